@@ -0,0 +1,81 @@
+# coding: UTF-8
+"""
+NTLogger の一回の呼び出しにかかる時間を測る。
+
+デバッグモードで呼んだ場所を inspect.stack() で調べていた以前のやり方と、
+sys._getframe() で必要なフレームだけを見る今のやり方とを比べる。
+出力しない水準のログ (INFO のときの debug()) にかかる時間も測る。
+
+使い方:
+
+    python -m benchmarks.logger
+    python -m benchmarks.logger --number 2000 --depth 30
+"""
+import argparse
+import inspect
+import logging
+import os
+import timeit
+
+from nicotools import utils
+
+
+class _LegacyLogger(utils.NTLogger):
+    """ 以前の forwarding をそのまま残したもの """
+    def forwarding(self, level, msg, *args, **kwargs):
+        _enco = utils.get_encoding()
+        if self.is_debug:
+            history = inspect.stack()
+            funcs = "line:{}|{}".format(
+                history[2][2],
+                " from ".join(["<{}>".format(item[3]) for item in history[2:5]])
+            )
+            if level <= logging.DEBUG:
+                msg = funcs + "]\t" + str(msg)
+            else:
+                msg = funcs + "]\t\t" + str(msg)
+        _msg = str(msg).encode(_enco, utils.BACKSLASH).decode(_enco)
+        _args = tuple([item.encode(_enco, utils.BACKSLASH).decode(_enco)
+                       if isinstance(item, str) else item for item in args[0]])
+        self._log(level, _msg, _args, **kwargs)
+
+
+def make_logger(cls, log_level: str, devnull) -> utils.NTLogger:
+    logger = cls(file_name=None, name=f"benchmark.{cls.__name__}.{log_level}", log_level=log_level)
+    for handler in logger.handlers:
+        handler.stream = devnull
+    return logger
+
+
+def nested(depth: int, func):
+    """ 実際の呼び出し元のように、スタックを depth 段だけ深くしてから呼ぶ """
+    if depth <= 0:
+        return func()
+    return nested(depth - 1, func)
+
+
+def measure(logger: utils.NTLogger, number: int, depth: int) -> float:
+    def _call():
+        for _ in range(number):
+            logger.debug("Started! Header: %s", "bytes=0-65535")
+
+    return min(timeit.repeat(lambda: nested(depth, _call), number=1, repeat=3)) / number
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=1000, help="一回の計測で繰り返す回数")
+    parser.add_argument("--depth", type=int, default=20, help="呼び出し元のスタックの深さ")
+    args = parser.parse_args(arguments)
+
+    with open(os.devnull, "w", encoding="utf-8") as devnull:
+        for name, cls, log_level in (("legacy, DEBUG", _LegacyLogger, "DEBUG"),
+                                     ("current, DEBUG", utils.NTLogger, "DEBUG"),
+                                     ("legacy, INFO", _LegacyLogger, "INFO"),
+                                     ("current, INFO", utils.NTLogger, "INFO")):
+            elapsed = measure(make_logger(cls, log_level, devnull), args.number, args.depth)
+            print(f"{name:<16} {elapsed * 1e6:>10.2f}us/call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,665 @@
+# coding: UTF-8
+"""
+ニコニコ動画の代わりになる、手元で動くサーバー。
+
+ベンチマークや通信を伴うテストで、本物のサイトへアクセスせずに
+ダウンロードの流れを最後まで動かすために使う。 以下のものを返す。
+
+* 動画視聴ページ (js-initial-watch-data と watchAPIDataContainer の二通り)
+* getthumbinfo API の XML とサムネイル画像 (ETag と Last-Modified による条件つきのリクエストに対応)
+* Range に対応した動画 (Smile サーバーと DMC サーバー)
+* DMC サーバーのセッションの交渉と Heartbeat
+* コメントサーバー (XML と JSON)、 threadkey と waybackkey
+* マイリストとそのAPI (中身はメモリの中に持つ)
+
+応答の前に待つ時間 (latency) と、本文を送る速さ (bandwidth, 応答ごと) を変えられる。
+inject() で、決まった経路への次の何回かのリクエストを失敗させられる。
+
+使い方:
+
+    with MockServer(latency=0.05) as server, server.redirect():
+        ...  # nicotools.utils.URL がこのサーバーを向く
+        info = OfflineInfo(["sm1", "sm2"], session=session)  # ログインはしない
+
+    python -m benchmarks.mock_server --port 8080 --latency 0.05
+"""
+import argparse
+import asyncio
+import contextlib
+import html
+import json
+import multiprocessing
+import re
+import socket
+import threading
+import time
+from collections import Counter, OrderedDict
+from email.utils import formatdate
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+from xml.etree import ElementTree
+
+import aiohttp
+from aiohttp import web
+
+from nicotools import utils
+from nicotools.download import Info
+from nicotools.mylist import NicoMyList
+from nicotools.tracer import Tracer
+
+from benchmarks import samples
+
+# 見本のページに埋めておき、リクエストごとに置き換える目印
+_MARK_ID = "__VIDEO_ID__"
+_MARK_THREAD = "1999999999"
+# コメントの投稿日時の起点
+_EPOCH = 1500000000
+
+
+def thread_id_of(video_id: str) -> int:
+    """
+    動画IDから、このサーバーでのスレッドIDを決める。 マイリストの item_id にも使う。
+
+    :param str video_id: 動画ID
+    :rtype: int
+    """
+    return 1000000000 + int(re.sub(r"\D", "", video_id) or 0)
+
+
+@contextlib.contextmanager
+def redirect(base: str):
+    """
+    utils.URL のURLを、パスはそのままにして base に向け直す。 抜けるときに元に戻す。
+
+    :param str base: "http://127.0.0.1:8080" のようなURL
+    """
+    original = {name: value for name, value in vars(utils.URL).items() if name.startswith("URL_")}
+    try:
+        for name, value in original.items():
+            parts = urlsplit(value)
+            setattr(utils.URL, name, base + parts.path + (f"?{parts.query}" if parts.query else ""))
+        yield base
+    finally:
+        for name, value in original.items():
+            setattr(utils.URL, name, value)
+
+
+class OfflineInfo(Info):
+    """ モックサーバーにはログインしないので、クッキーは空にする """
+    def _get_cookie(self):
+        return {}
+
+
+class OfflineMyList(NicoMyList):
+    """ ログインせずにセッションを作る """
+    async def _get_session(self, mail: str, password: str) -> aiohttp.ClientSession:
+        self.token = "mock-token"
+        return aiohttp.ClientSession(trace_configs=self.trace_configs(Tracer.MYLIST))
+
+
+class MockServer:
+    DATA_API = "data-api"
+    WATCH_API = "watch-api"
+    MIXED = "mixed"
+    # サムネイルの ETag
+    THUMB_ETAG = '"mock-thumbnail"'
+
+    def __init__(self,
+                 latency: float=0.0,
+                 bandwidth: Optional[int]=None,
+                 video_size: int=1024 * 1024,
+                 thumb_size: int=8 * 1024,
+                 comments: int=1000,
+                 page_size: int=200 * 1024,
+                 layout: str=MIXED,
+                 mylist_limit: int=500,
+                 host: str="127.0.0.1",
+                 port: int=0,
+                 ):
+        """
+        別のスレッドでイベントループを回して待ち受ける。
+
+        :param float latency: 応答を返し始めるまでに待つ秒数
+        :param Optional[int] bandwidth: 一つの応答の本文を送る速さ (バイト毎秒)。 None なら制限しない。
+        :param int video_size: 動画の大きさ (バイト)
+        :param int thumb_size: サムネイル画像の大きさ (バイト)
+        :param int comments: 動画ごとのコメントの数
+        :param int page_size: 動画視聴ページに詰める大きさ (バイト)
+        :param str layout: 動画視聴ページの形式。
+            "data-api" なら DMC、 "watch-api" なら Smile、
+            "mixed" なら動画IDの数字が偶数のものを DMC、奇数のものを Smile にする。
+        :param int mylist_limit: 一つのマイリストに登録できる数
+        :param str host: 待ち受けるアドレス
+        :param int port: 待ち受けるポート。 0 なら空いているものを使う。
+        """
+        assert layout in (self.DATA_API, self.WATCH_API, self.MIXED)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.comments = comments
+        self.page_size = page_size
+        self.layout = layout
+        self.mylist_limit = mylist_limit
+        self.host = host
+        self.port = port
+        self.base = None  # type: Optional[str]
+        self.token = "mock-token"
+        self.requests = Counter()
+        # 経路の名前ごとに、次のリクエストに返す失敗のステータスコード
+        self.faults = {}  # type: Dict[str, List[int]]
+        # 経路の名前ごとに、次のリクエストで本文を送り切らずに接続を切るまでのバイト数
+        self.cuts = {}  # type: Dict[str, List[int]]
+        self.video = (bytes(range(256)) * (video_size // 256 + 1))[:video_size]
+        self.thumbnail = (b"\xff\xd8" + b"\x00" * thumb_size)[:thumb_size]
+        self.mylists = OrderedDict()  # type: Dict[int, Dict]
+        self.deflist = OrderedDict()  # type: Dict[str, Dict]
+        self.items = OrderedDict()  # type: Dict[int, Dict[str, Dict]]
+        self.__item_ids = {}  # type: Dict[str, str]
+        self.__sessions = 0
+        self.__pages = {}  # type: Dict[str, bytes]
+        self.__loop = None  # type: Optional[asyncio.AbstractEventLoop]
+        self.__thread = None  # type: Optional[threading.Thread]
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *_):
+        self.stop()
+
+    def redirect(self):
+        """ utils.URL をこのサーバーに向ける。 with 文で使う。 """
+        return redirect(self.base)
+
+    def inject(self, route: str, *statuses: int) -> None:
+        """
+        その経路への次のリクエストから順に、指定したステータスコードで失敗させる。
+
+        429 と 503 には "Retry-After: 0" をつける。
+
+        :param str route: 経路の名前 ("watch", "thumbnail" など)
+        :param int statuses: 返すステータスコード
+        """
+        self.faults.setdefault(route, []).extend(statuses)
+
+    def cut(self, route: str, *sizes: int) -> None:
+        """
+        その経路への次のリクエストから順に、本文を指定したバイト数だけ送ったところで接続を切る。
+
+        Content-Length は本来の大きさのままなので、受け取る側からは途中で途切れたように見える。
+
+        :param str route: 経路の名前 ("smile", "dmc-video" など)
+        :param int sizes: 接続を切るまでに送るバイト数
+        """
+        self.cuts.setdefault(route, []).extend(sizes)
+
+    def start(self) -> str:
+        """
+        待ち受けを始める。
+
+        :return: このサーバーのURL
+        :rtype: str
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        self.base = "http://{}:{}".format(*sock.getsockname()[:2])
+        self.__pages = self._make_pages()
+        ready = threading.Event()
+        self.__thread = threading.Thread(target=self._serve, args=(sock, ready), daemon=True)
+        self.__thread.start()
+        ready.wait()
+        return self.base
+
+    def stop(self) -> None:
+        if self.__loop is not None:
+            self.__loop.call_soon_threadsafe(self.__loop.stop)
+            self.__thread.join()
+            self.__loop = None
+
+    def _serve(self, sock: socket.socket, ready: threading.Event) -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        # マイリストへのまとめての追加などでURLが長くなるので、上限を緩める
+        runner = web.AppRunner(self.make_app(), max_line_size=1024 * 1024)
+        loop.run_until_complete(runner.setup())
+        loop.run_until_complete(web.SockSite(runner, sock).start())
+        self.__loop = loop
+        ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            loop.run_until_complete(runner.cleanup())
+            loop.close()
+
+    def make_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_get("/watch/{video_id}", self._watch, name="watch")
+        app.router.add_get("/api/getthumbinfo/{video_id}", self._thumbinfo, name="thumbinfo")
+        app.router.add_get("/thumb/{name}", self._thumb, name="thumbnail")
+        app.router.add_get("/smile/{video_id}", self._video, name="smile")
+        app.router.add_get("/dmc/video/{video_id}", self._video, name="dmc-video")
+        app.router.add_post("/dmc/api/sessions", self._dmc_session, name="dmc-negotiate")
+        app.router.add_post("/dmc/api/sessions/{session_id}", self._dmc_session, name="dmc-heartbeat")
+        app.router.add_post("/api/", self._comment_xml, name="comment-xml")
+        app.router.add_post("/api.json/", self._comment_json, name="comment-json")
+        app.router.add_get("/api/getthreadkey", self._threadkey, name="threadkey")
+        app.router.add_get("/api/getwaybackkey", self._waybackkey, name="waybackkey")
+        app.router.add_get("/my/mylist", self._mylist_top, name="mylist-top")
+        app.router.add_route("*", "/api/mylistgroup/{action}", self._mylistgroup, name="mylistgroup")
+        app.router.add_route("*", "/api/{kind:mylist|deflist}/{action}", self._mylist, name="mylist")
+        return app
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        name = request.match_info.route.name or "unknown"
+        self.requests[name] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.faults.get(name):
+            status = self.faults[name].pop(0)
+            return web.Response(status=status, headers={"Retry-After": "0"} if status in (429, 503) else None)
+        return await handler(request)
+
+    async def _send(self, request: web.Request, body: bytes, content_type: str="text/plain",
+                    status: int=200, headers: Optional[Dict[str, str]]=None) -> web.StreamResponse:
+        """
+        本文を返す。 bandwidth があれば、その速さになるように少しずつ送る。
+        cut で切ることになっていれば、そのバイト数だけ送って接続を切る。
+        """
+        cuts = self.cuts.get(request.match_info.route.name)
+        cut = cuts.pop(0) if cuts and request.method != "HEAD" else None
+        if cut is None and (not self.bandwidth or request.method == "HEAD"):
+            return web.Response(body=body, status=status, headers=headers, content_type=content_type)
+        response = web.StreamResponse(status=status, headers=headers)
+        response.content_type = content_type
+        response.content_length = len(body)
+        await response.prepare(request)
+        sending = body if cut is None else body[:cut]
+        # 1秒を20回に分けて送る
+        step = max(1024, self.bandwidth // 20) if self.bandwidth else max(1, len(sending))
+        for position in range(0, len(sending), step):
+            chunk = sending[position:position + step]
+            await response.write(chunk)
+            if self.bandwidth:
+                await asyncio.sleep(len(chunk) / self.bandwidth)
+        if cut is not None:
+            request.transport.close()
+            return response
+        await response.write_eof()
+        return response
+
+    # ----------------------------------------------------------------
+    # 動画の情報
+    # ----------------------------------------------------------------
+    def is_dmc(self, video_id: str) -> bool:
+        if self.layout == self.MIXED:
+            return thread_id_of(video_id) % 2 == 0
+        return self.layout == self.DATA_API
+
+    def _make_pages(self) -> Dict[str, bytes]:
+        """ 目印を埋めた動画視聴ページの見本を、形式ごとに一つずつ作っておく """
+        common = {
+            "video_id": _MARK_ID,
+            "title": "動画 {}".format(_MARK_ID),
+            "thread_id": int(_MARK_THREAD),
+            "smile_url": f"{self.base}/smile/{_MARK_ID}",
+            "thumbnail_url": f"{self.base}/thumb/{_MARK_ID}",
+            "ms": f"{self.base}/api/",
+        }
+        data = samples.data_api(api_url=f"{self.base}/dmc/api/sessions", **common)
+        return {
+            self.DATA_API: samples.page_data_api(data, padding=self.page_size),
+            self.WATCH_API: samples.page_watch_api(samples.watch_api(**common), padding=self.page_size),
+        }
+
+    async def _watch(self, request: web.Request) -> web.StreamResponse:
+        video_id = request.match_info["video_id"]
+        page = self.__pages[self.DATA_API if self.is_dmc(video_id) else self.WATCH_API]
+        body = (page.replace(_MARK_ID.encode(), video_id.encode())
+                    .replace(_MARK_THREAD.encode(), str(thread_id_of(video_id)).encode()))
+        return await self._send(request, body, "text/html")
+
+    async def _thumbinfo(self, request: web.Request) -> web.StreamResponse:
+        video_id = request.match_info["video_id"]
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<nicovideo_thumb_response status="ok"><thumb>'
+            f'<video_id>{video_id}</video_id>'
+            f'<title>{html.escape("動画 " + video_id)}</title>'
+            f'<thumbnail_url>{self.base}/thumb/{video_id}</thumbnail_url>'
+            '<first_retrieve>2007-03-06T00:33:00+09:00</first_retrieve>'
+            '<length>5:19</length>'
+            f'<movie_type>{"mp4" if self.is_dmc(video_id) else "flv"}</movie_type>'
+            f'<size_high>{len(self.video)}</size_high>'
+            '<view_counter>1</view_counter>'
+            f'<comment_num>{self.comments}</comment_num>'
+            '<mylist_counter>1</mylist_counter>'
+            f'<watch_url>{self.base}/watch/{video_id}</watch_url>'
+            '</thumb></nicovideo_thumb_response>'
+        )
+        return await self._send(request, body.encode("utf-8"), "text/xml")
+
+    async def _thumb(self, request: web.Request) -> web.StreamResponse:
+        # 画像は変わらないので、条件つきのリクエストには 304 を返す
+        headers = {"ETag": self.THUMB_ETAG, "Last-Modified": formatdate(_EPOCH, usegmt=True)}
+        if (request.headers.get("If-None-Match") == self.THUMB_ETAG or
+                (request.if_modified_since is not None and request.if_modified_since.timestamp() >= _EPOCH)):
+            return web.Response(status=304, headers=headers)
+        return await self._send(request, self.thumbnail, "image/jpeg", headers=headers)
+
+    # ----------------------------------------------------------------
+    # 動画
+    # ----------------------------------------------------------------
+    async def _video(self, request: web.Request) -> web.StreamResponse:
+        size = len(self.video)
+        headers = {"Accept-Ranges": "bytes"}
+        if request.method == "HEAD":
+            headers["Content-Length"] = str(size)
+            return web.Response(headers=headers, content_type="video/mp4")
+        if "Range" not in request.headers:
+            return await self._send(request, self.video, "video/mp4", headers=headers)
+        start, stop = self._parse_range(request.headers["Range"], size)
+        if start >= stop:
+            headers["Content-Range"] = f"bytes */{size}"
+            return web.Response(status=416, headers=headers)
+        headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+        return await self._send(request, self.video[start:stop], "video/mp4", 206, headers)
+
+    @staticmethod
+    def _parse_range(header: str, size: int) -> Tuple[int, int]:
+        """
+        "bytes=0-99" のような Range ヘッダーを、 [始まり, 終わり) の組にする。
+
+        :rtype: Tuple[int, int]
+        """
+        first, _, last = header.partition("=")[2].split(",")[0].strip().partition("-")
+        if not first:
+            return max(0, size - int(last)), size
+        return int(first), min(size, int(last) + 1 if last else size)
+
+    async def _dmc_session(self, request: web.Request) -> web.StreamResponse:
+        video_id = re.search(r"<recipe_id>nicovideo-(.+?)</recipe_id>", await request.text()).group(1)
+        if "session_id" in request.match_info:
+            session_id = request.match_info["session_id"]
+        else:
+            self.__sessions += 1
+            session_id = f"mock{self.__sessions:010d}"
+        # 受け取る側は正規表現で <session> を切り出すので、一行で返す
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<object><meta status="201" message="created"/><data>'
+            f'<session><id>{session_id}</id><recipe_id>nicovideo-{video_id}</recipe_id>'
+            f'<content_uri>{self.base}/dmc/video/{video_id}</content_uri></session>'
+            '</data></object>'
+        )
+        return await self._send(request, body.encode("utf-8"), "application/xml", 201)
+
+    # ----------------------------------------------------------------
+    # コメント
+    # ----------------------------------------------------------------
+    def _select(self, res_from: int, when: Optional[int]) -> Tuple[int, range]:
+        """
+        取りに来たコメントの番号の範囲を決める。 一度に返すのは1000件まで。
+
+        :return: (その時点での最後の番号, 返す番号の範囲)
+        :rtype: Tuple[int, range]
+        """
+        last = self.comments
+        if when:
+            last = max(0, min(last, when - _EPOCH - 1))
+        if res_from < 0:
+            return last, range(max(1, last + res_from + 1, last - 999), last + 1)
+        start = max(1, res_from)
+        return last, range(start, min(last, start + 999) + 1)
+
+    @staticmethod
+    def _chat(thread_id: int, no: int, fork: int) -> Dict:
+        chat = {"thread": str(thread_id), "no": no, "vpos": no * 10 % 100000, "date": _EPOCH + no,
+                "mail": "184", "user_id": f"user{no % 97}", "anonymity": 1, "content": f"コメント{no}"}
+        if fork:
+            chat["fork"] = 1
+        return chat
+
+    def _threads(self, requests: List[Dict]) -> List[Tuple[str, Dict]]:
+        """
+        リクエストの thread 要素ごとに、スレッドの情報とコメントを並べる。
+
+        投稿者コメント (fork=1) はないものとして、スレッドの情報だけを返す。
+        """
+        result = []
+        for item in requests:
+            thread_id = int(item["thread"])
+            fork = int(item.get("fork", 0) or 0)
+            last, numbers = self._select(int(item.get("res_from", -1000)), int(item.get("when", 0) or 0))
+            if fork:
+                last, numbers = 0, range(0)
+            result.append(("thread", {"resultcode": 0, "thread": str(thread_id), "last_res": last,
+                                      "ticket": "0x0", "revision": 1, "server_time": int(time.time())}))
+            result.extend(("chat", self._chat(thread_id, no, fork)) for no in numbers)
+        return result
+
+    async def _comment_xml(self, request: web.Request) -> web.StreamResponse:
+        packet = ElementTree.fromstring(await request.text())
+        parts = ["<packet>"]
+        for tag, attributes in self._threads([dict(item.attrib) for item in packet.iter("thread")]):
+            content = html.escape(attributes.pop("content", ""))
+            attrs = " ".join(f'{key}="{value}"' for key, value in attributes.items())
+            parts.append(f"<{tag} {attrs}>{content}</{tag}>" if tag == "chat" else f"<{tag} {attrs}/>")
+        parts.append("</packet>")
+        return await self._send(request, "".join(parts).encode("utf-8"), "text/xml")
+
+    async def _comment_json(self, request: web.Request) -> web.StreamResponse:
+        payload = json.loads(await request.text())
+        result = [{"ping": item["ping"]} for item in payload if "ping" in item][:1]
+        result.extend({tag: body} for tag, body in self._threads(
+            [item["thread"] for item in payload if "thread" in item]))
+        return await self._send(request, json.dumps(result, ensure_ascii=False).encode("utf-8"),
+                                "application/json")
+
+    async def _threadkey(self, request: web.Request) -> web.StreamResponse:
+        return await self._send(request, b"threadkey=mock&force_184=1")
+
+    async def _waybackkey(self, request: web.Request) -> web.StreamResponse:
+        return await self._send(request, f"waybackkey={_EPOCH}.mock".encode())
+
+    # ----------------------------------------------------------------
+    # マイリスト
+    # ----------------------------------------------------------------
+    def seed_mylists(self, lists: int, items: int) -> List[int]:
+        """
+        マイリストを lists 個作り、それぞれに items 件の動画を登録しておく。
+
+        :return: 作ったマイリストのIDのリスト
+        :rtype: List[int]
+        """
+        created = []
+        for number in range(lists):
+            list_id = self._create_mylist(f"マイリスト{number}", "", "0")
+            for serial in range(items):
+                self._register(self.items[list_id], f"sm{list_id % 1000 * 100000 + serial}", "")
+            created.append(list_id)
+        return created
+
+    def _create_mylist(self, name: str, description: str, public: str) -> int:
+        list_id = max(self.mylists or [10000000]) + 1
+        self.mylists[list_id] = {"id": str(list_id), "user_id": "1", "name": name,
+                                 "description": description, "public": public,
+                                 "default_sort": "0", "create_time": int(time.time()),
+                                 "update_time": int(time.time()), "icon_id": "0"}
+        self.items[list_id] = OrderedDict()
+        return list_id
+
+    def _register(self, container: Dict[str, Dict], video_id: str, description: str) -> None:
+        item_id = str(thread_id_of(video_id))
+        self.__item_ids[item_id] = video_id
+        container[video_id] = {
+            "item_type": "0", "item_id": item_id, "description": description,
+            "create_time": int(time.time()), "update_time": int(time.time()), "watch": 0,
+            "item_data": {
+                "video_id": video_id, "title": f"動画 {video_id}", "thumbnail_url": "",
+                "first_retrieve": 1173108780, "update_time": 1173108780,
+                "view_counter": "1", "mylist_counter": "1", "num_res": str(self.comments),
+                "group_type": "default", "length_seconds": "319", "deleted": "0",
+                "last_res_body": "",
+            },
+        }
+
+    @staticmethod
+    def _fail(code: str, description: str) -> Dict:
+        return {"status": "fail", "error": {"code": code, "description": description}}
+
+    async def _json(self, request: web.Request, data: Dict) -> web.StreamResponse:
+        return await self._send(request, json.dumps(data, ensure_ascii=False).encode("utf-8"),
+                                "application/json")
+
+    async def _mylist_top(self, request: web.Request) -> web.StreamResponse:
+        body = f'<html><script>NicoAPI.token = "{self.token}";</script></html>'
+        return await self._send(request, body.encode("utf-8"), "text/html")
+
+    async def _mylistgroup(self, request: web.Request) -> web.StreamResponse:
+        query = request.query
+        action = request.match_info["action"]
+        if action == "list":
+            return await self._json(request, {"mylistgroup": list(self.mylists.values()), "status": "ok"})
+        elif action == "add":
+            list_id = self._create_mylist(query.get("name", ""), query.get("description", ""),
+                                          query.get("public", "0"))
+            return await self._json(request, {"id": list_id, "status": "ok"})
+        elif action == "delete":
+            list_id = int(query.get("group_id", 0))
+            if list_id not in self.mylists:
+                return await self._json(request, self._fail("NONEXIST", "マイリストがありません"))
+            del self.mylists[list_id]
+            del self.items[list_id]
+            return await self._json(request, {"status": "ok"})
+        raise web.HTTPNotFound()
+
+    async def _mylist(self, request: web.Request) -> web.StreamResponse:
+        query = request.query
+        action = request.match_info["action"]
+        if request.match_info["kind"] == "deflist":
+            source = self.deflist
+        else:
+            source = self.items.get(int(query.get("group_id", 0) or 0))
+            if source is None:
+                return await self._json(request, self._fail("NONEXIST", "マイリストがありません"))
+
+        if action == "list":
+            return await self._json(request, {"mylistitem": list(source.values()), "status": "ok"})
+        elif action == "add":
+            video_ids = query.getall("item_id", [])
+            if any(_id in source for _id in video_ids):
+                return await self._json(request, self._fail("EXIST", "すでに登録されています"))
+            if len(source) + len(video_ids) > self.mylist_limit:
+                return await self._json(request, self._fail("MAXERROR", "もう登録できません"))
+            for video_id in video_ids:
+                self._register(source, video_id, query.get("description", ""))
+            return await self._json(request, {"status": "ok"})
+
+        video_ids = [self.__item_ids.get(_id) for _id in query.getall("id_list[0][]", [])]
+        video_ids = [_id for _id in video_ids if _id in source]
+        if action == "delete":
+            for video_id in video_ids:
+                del source[video_id]
+            return await self._json(request, {"status": "ok", "delete_count": len(video_ids)})
+        elif action in ("copy", "move"):
+            target = self.items.get(int(query.get("target_group_id", 0) or 0))
+            if target is None:
+                return await self._json(request, self._fail("NONEXIST", "マイリストがありません"))
+            matches = [_id for _id in video_ids if _id not in target]
+            if len(target) + len(matches) > self.mylist_limit:
+                return await self._json(request, self._fail("MAXERROR", "もう登録できません"))
+            for video_id in video_ids:
+                target.setdefault(video_id, source[video_id])
+                if action == "move":
+                    del source[video_id]
+            return await self._json(request, {"status": "ok", "matches": {"item": [
+                {"type": "0", "id": target[_id]["item_id"]} for _id in matches]}})
+        raise web.HTTPNotFound()
+
+
+def _serve_in_process(connection, options: Dict) -> None:
+    server = MockServer(**options)
+    connection.send(server.start())
+    connection.recv()
+    server.stop()
+    connection.send(dict(server.requests))
+
+
+class ServerProcess:
+    def __init__(self, **options):
+        """
+        MockServer を別のプロセスで動かす。
+
+        サーバーの処理がクライアントと GIL やメモリを取り合わないので、
+        クライアントの速さやメモリの使用量だけを測りたいときに使う。
+
+        :param options: MockServer に渡す引数
+        """
+        self.options = options
+        self.base = None  # type: Optional[str]
+        self.__connection = None
+        self.__process = None  # type: Optional[multiprocessing.Process]
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *_):
+        self.stop()
+
+    def redirect(self):
+        return redirect(self.base)
+
+    def start(self) -> str:
+        self.__connection, child = multiprocessing.Pipe()
+        self.__process = multiprocessing.Process(target=_serve_in_process, args=(child, self.options), daemon=True)
+        self.__process.start()
+        self.base = self.__connection.recv()
+        return self.base
+
+    def stop(self) -> Dict[str, int]:
+        """
+        サーバーを止める。
+
+        :return: 受けたリクエストの、種類ごとの数
+        :rtype: Dict[str, int]
+        """
+        if self.__process is None:
+            return {}
+        self.__connection.send(None)
+        requests = self.__connection.recv()
+        self.__process.join()
+        self.__process = None
+        return requests
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="応答までに待つ秒数")
+    parser.add_argument("--bandwidth", type=int, default=None, help="応答ごとの送信速度 (バイト毎秒)")
+    parser.add_argument("--video-size", type=int, default=1024 * 1024, help="動画の大きさ (バイト)")
+    parser.add_argument("--comments", type=int, default=1000, help="動画ごとのコメントの数")
+    parser.add_argument("--layout", default=MockServer.MIXED,
+                        choices=(MockServer.DATA_API, MockServer.WATCH_API, MockServer.MIXED))
+    parser.add_argument("--mylists", type=int, nargs=2, default=(0, 0), metavar=("LISTS", "ITEMS"),
+                        help="あらかじめ作っておくマイリストの数と、それぞれの件数")
+    args = parser.parse_args(arguments)
+
+    server = MockServer(latency=args.latency, bandwidth=args.bandwidth, video_size=args.video_size,
+                        comments=args.comments, layout=args.layout, host=args.host, port=args.port)
+    server.seed_mylists(*args.mylists)
+    print(f"Listening on {server.start()}  (Ctrl+C で止める)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
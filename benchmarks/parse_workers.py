@@ -0,0 +1,82 @@
+# coding: UTF-8
+"""
+Info の parse_workers の効果を測る。
+
+動画視聴ページのダウンロードを asyncio.sleep で真似しつつ、
+保存しておいたページをまとめて解析して、全体にかかった時間を比べる。
+
+使い方:
+
+    python -m benchmarks.parse_workers                       # 見本のページで測る
+    python -m benchmarks.parse_workers saved/*.html          # 保存したページで測る
+    python -m benchmarks.parse_workers --workers 0 2 4 --latency 0.2
+"""
+import argparse
+import asyncio
+import os
+import time
+from pathlib import Path
+from typing import List
+
+from nicotools import utils
+from nicotools.download import Info
+
+from benchmarks import samples
+
+
+class _Session:
+    """ 通信しないので、閉じるだけのセッション """
+    async def close(self):
+        pass
+
+
+async def _fetch_and_parse(info: Info, page: bytes, latency: float):
+    await asyncio.sleep(latency)
+    return await info._parse(page)
+
+
+def measure(pages: List[bytes], workers: int, latency: float) -> float:
+    loop = asyncio.new_event_loop()
+    info = Info([], session=_Session(), parse_workers=workers, loop=loop,
+                logger=utils.NTLogger(file_name=None, log_level="WARNING"))
+
+    async def _run():
+        return await asyncio.gather(*[_fetch_and_parse(info, page, latency) for page in pages])
+
+    try:
+        # プロセスの立ち上げは計測に含めない
+        if workers > 0:
+            loop.run_until_complete(info._parse(pages[0]))
+        begin = time.perf_counter()
+        results = loop.run_until_complete(_run())
+        elapsed = time.perf_counter() - begin
+        assert all(isinstance(result, dict) for result in results)
+        return elapsed
+    finally:
+        info.close()
+        loop.close()
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pages", nargs="*", help="保存しておいた動画視聴ページのHTML")
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, os.cpu_count() or 1],
+                        help="試すプロセスの数 (0 はイベントループの中で解析する)")
+    parser.add_argument("--latency", type=float, default=0.05, help="一回のダウンロードにかかる時間(秒)")
+    parser.add_argument("--copies", type=int, default=100, help="見本のページを使う時の枚数")
+    args = parser.parse_args(arguments)
+
+    if args.pages:
+        pages = [Path(name).read_bytes() for name in args.pages]
+    else:
+        pages = [samples.page_data_api(samples.data_api(description_size=20000), padding=1024 * 1024)
+                 for _ in range(args.copies)]
+    size = sum(len(page) for page in pages) / 1024 / 1024
+    print(f"{len(pages)} pages, {size:.1f}MB, latency {args.latency * 1000:.0f}ms")
+    for workers in sorted(set(args.workers)):
+        elapsed = measure(pages, workers, args.latency)
+        print(f"parse_workers={workers:<3} {elapsed:>8.3f}s {len(pages) / elapsed:>8.1f} pages/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# coding: UTF-8
+"""
+ベンチマークやモックサーバーで使う、動画視聴ページなどの見本を作る。
+"""
+import html
+import json
+from urllib.parse import quote, urlencode
+
+
+def data_api(video_id="sm9", title="新・豪血寺一族 -煩悩解放 - レッツゴー！陰陽師",
+             thread_id=1173108780, dmc=True, api_url="http://api.dmc.nico:2805/api/sessions",
+             smile_url="http://smile-com00.nicovideo.jp/smile?m=9.0", description_size=2000,
+             thumbnail_url="http://tn-skr2.smilevideo.jp/smile?i=9", ms="http://nmsg.nicovideo.jp/api/"):
+    """
+    data-api-data 属性に入る JSON を辞書で返す。
+
+    :rtype: dict
+    """
+    video = {
+        "id": video_id,
+        "title": title,
+        "description": "説明文" * (description_size // 3),
+        "thumbnailURL": thumbnail_url,
+        "movieType": "mp4",
+        "isDeleted": False,
+        "isPublic": True,
+        "isOfficial": False,
+        "smileInfo": {"url": smile_url},
+        "dmcInfo": None,
+    }
+    if dmc:
+        video["dmcInfo"] = {
+            "thread": {
+                "server_url": ms,
+                "thread_id": thread_id,
+                "optional_thread_id": None,
+                "thread_key_required": False,
+            },
+            "session_api": {
+                "urls": [{"url": api_url}],
+                "recipe_id": "nicovideo-{}".format(video_id),
+                "content_id": "out1",
+                "videos": ["archive_h264_600kbps_360p", "archive_h264_300kbps_360p"],
+                "audios": ["archive_aac_64kbps"],
+                "heartbeat_lifetime": 120000,
+                "token": json.dumps({"service_id": "nicovideo", "player_id": "x" * 40}),
+                "signature": "f" * 64,
+                "auth_types": {"http": "ht2"},
+                "content_key_timeout": 600000,
+                "player_id": "nicovideo-6-xxxxxxxxxx_0000000000000",
+                "priority": 0.8,
+            },
+        }
+    return {
+        "video": video,
+        "context": {"isPeakTime": False, "userkey": "1500000000.~1~xxxxxxxxxxxxxxxx"},
+        "viewer": {"id": 1, "isPremium": False},
+        "tags": [{"name": "タグ{}".format(i)} for i in range(10)],
+        "comments": [{"body": "コメント{}".format(i)} for i in range(50)],
+    }
+
+
+def watch_api(video_id="sm9", title="新・豪血寺一族 -煩悩解放 - レッツゴー！陰陽師",
+              thread_id=1173108780, smile_url="http://smile-com00.nicovideo.jp/smile?m=9.0",
+              ms="http://nmsg.nicovideo.jp/api/", thumbnail_url="http://tn-skr2.smilevideo.jp/smile?i=9"):
+    """
+    watchAPIDataContainer に入る JSON を辞書で返す。
+
+    :rtype: dict
+    """
+    flv_info = urlencode({
+        "thread_id": thread_id, "l": 320, "url": smile_url, "ms": ms,
+        "ms_sub": ms, "user_id": 1, "is_premium": 0, "nickname": "nickname",
+        "userkey": "1500000000.~1~xxxxxxxxxxxxxxxx",
+    })
+    return {
+        "flashvars": {
+            "flvInfo": quote(flv_info),
+            "videoId": video_id,
+            "videoTitle": title,
+            "thumbImage": thumbnail_url,
+            "eco": 0,
+            "movie_type": "flv",
+        },
+        "videoDetail": {"isDeleted": False, "is_public": True, "is_official": False},
+        "viewerInfo": {"isPremium": False},
+    }
+
+
+def _filler(size):
+    """ 本物のページと同じくらいの大きさにするための詰め物 """
+    unit = ('<div class="Filler"><a href="/watch/sm9" data-nicoad="{&quot;a&quot;: 1}">'
+            'ニコニコ動画</a><script>var x = "<span>";</script></div>\n')
+    return unit * (size // len(unit.encode("utf-8")) + 1)
+
+
+def page_data_api(data=None, padding=200 * 1024):
+    """
+    js-initial-watch-data を持つ動画視聴ページのHTMLを返す。
+
+    :param dict | None data: data-api-data に入れる辞書
+    :param int padding: 前後に詰める大きさ(バイト)
+    :rtype: bytes
+    """
+    data = data or data_api()
+    attribute = html.escape(json.dumps(data, ensure_ascii=False), quote=True)
+    return (
+        "<!DOCTYPE html><html><head><title>ニコニコ動画</title></head><body>\n"
+        + _filler(padding // 2)
+        + '<div id="js-initial-watch-data" data-api-data="{}"'
+          ' data-environment="{{&quot;playlistToken&quot;: &quot;x&quot;}}" hidden></div>\n'.format(attribute)
+        + _filler(padding // 2)
+        + "</body></html>"
+    ).encode("utf-8")
+
+
+def page_watch_api(data=None, padding=200 * 1024):
+    """
+    watchAPIDataContainer を持つ動画視聴ページのHTMLを返す。
+
+    :param dict | None data: watchAPIDataContainer に入れる辞書
+    :param int padding: 前後に詰める大きさ(バイト)
+    :rtype: bytes
+    """
+    data = data or watch_api()
+    text = html.escape(json.dumps(data, ensure_ascii=False), quote=False)
+    return (
+        "<!DOCTYPE html><html><head><title>ニコニコ動画</title></head><body>\n"
+        + _filler(padding // 2)
+        + '<div id="watchAPIDataContainer" style="display:none">{}</div>\n'.format(text)
+        + _filler(padding // 2)
+        + "</body></html>"
+    ).encode("utf-8")
@@ -0,0 +1,110 @@
+# coding: UTF-8
+"""
+nicotools の import にかかる時間と、引数を解釈し終えるまでに読み込まれるモジュールを、
+python -X importtime (Python 3.7 以上) で測る。
+
+--help や --what のように実際の処理に進まない起動では、
+サブコマンドのモジュールや aiohttp などの重いライブラリーを読み込まないはずなので、
+読み込まれたものと、 import にかかった時間の合計とを確かめる。
+予算 (--budget) を超えたものがあれば、終了コード 1 で終わる。
+
+使い方:
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --repeat 10 --budget 150
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# 引数の解釈だけでは読み込まれてはいけないもの
+HEAVY = ("aiohttp", "bs4", "tqdm", "prettytable", "requests", "multidict",
+         "nicotools.download", "nicotools.mylist", "nicotools.tracer", "nicotools.store", "nicotools.verify")
+
+# 測る起動のしかた: {名前: nicotools.main に渡す引数 (None なら import するだけ)}
+COMMANDS = OrderedDict([
+    ("import", None),
+    ("help", ["--help"]),
+    ("download --what", ["download", "sm9", "--comment", "--what"]),
+    ("mylist --what", ["mylist", "マイリスト", "--export", "--what"]),
+    ("verify --what", ["verify", ".", "--what"]),
+])
+
+SCRIPT = ("import sys\n"
+          "import nicotools\n"
+          "if len(sys.argv) > 1:\n"
+          "    nicotools.main(sys.argv[1:])\n")
+
+_LINE = re.compile(r"^import time:\s*\d+\s*\|\s*(\d+)\s*\|\s*(\S+)\s*$")
+
+
+def import_times(arguments: Optional[List[str]]) -> Dict[str, int]:
+    """
+    別のプロセスで nicotools を起動して、読み込まれたモジュールと、
+    それぞれの import にかかった時間 (自分の読み込みを含む累計, マイクロ秒) を返す。
+
+    :param Optional[List[str]] arguments: nicotools.main に渡す引数
+    :rtype: Dict[str, int]
+    """
+    command = [sys.executable, "-X", "importtime", "-c", SCRIPT] + (arguments or [])
+    env = dict(os.environ, PYTHONIOENCODING="utf-8")
+    env.pop("PYTHON_TEST", None)
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, env=env)
+    times = OrderedDict()  # type: Dict[str, int]
+    for line in result.stderr.decode("utf-8", "replace").splitlines():
+        matched = _LINE.match(line)
+        if matched:
+            times[matched.group(2)] = int(matched.group(1))
+    return times
+
+
+def heavy_imports(arguments: Optional[List[str]]) -> List[str]:
+    """
+    その起動のしかたで読み込まれた、重いモジュールの名前を返す。
+
+    :param Optional[List[str]] arguments: nicotools.main に渡す引数
+    :rtype: List[str]
+    """
+    loaded = import_times(arguments)
+    return [name for name in HEAVY if name in loaded]
+
+
+def measure(arguments: Optional[List[str]], repeat: int) -> Tuple[float, List[str]]:
+    """
+    nicotools を import するのにかかった時間の最小値 (ミリ秒) と、読み込まれた重いモジュールを返す。
+
+    :param Optional[List[str]] arguments: nicotools.main に渡す引数
+    :param int repeat: 繰り返す回数
+    :rtype: Tuple[float, List[str]]
+    """
+    best = None
+    heavy = []  # type: List[str]
+    for _ in range(repeat):
+        loaded = import_times(arguments)
+        elapsed = loaded.get("nicotools", 0) / 1000
+        best = elapsed if best is None else min(best, elapsed)
+        heavy = [name for name in HEAVY if name in loaded]
+    return best or 0.0, heavy
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="起動のしかたごとに繰り返す回数")
+    parser.add_argument("--budget", type=float, default=150.0, help="nicotools の import にかけてよい時間 (ミリ秒)")
+    args = parser.parse_args(arguments)
+
+    failed = False
+    for name, command in COMMANDS.items():
+        elapsed, heavy = measure(command, args.repeat)
+        over = elapsed > args.budget or bool(heavy)
+        failed = failed or over
+        print(f"{name:<18} {elapsed:>8.1f}ms  {'NG' if over else 'OK'}  {', '.join(heavy)}", flush=True)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
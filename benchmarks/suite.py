@@ -0,0 +1,228 @@
+# coding: UTF-8
+"""
+手元のモックサーバー (benchmarks.mock_server) を相手に、
+Info, Thumbnail, Comment, VideoSmile, VideoDmc, NicoMyList の
+処理速度 (件数毎秒) とメモリの使用量の最大値を、件数を変えながら測る。
+
+サーバーは別のプロセスで動かすので、測るのはこのプロセス (nicotools の側) だけになる。
+時間を測る回と、 tracemalloc でメモリを測る回は分けている (tracemalloc は遅くなるので)。
+
+使い方:
+
+    python -m benchmarks.suite
+    python -m benchmarks.suite --scales 10 1000 10000 --targets info comment
+    python -m benchmarks.suite --latency 0.05 --bandwidth 1000000 --video-size 65536
+"""
+import argparse
+import asyncio
+import contextlib
+import gc
+import io
+import tempfile
+import time
+import tracemalloc
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+
+from nicotools import utils
+from nicotools.download import Comment, Thumbnail, Video
+
+from benchmarks.mock_server import MockServer, OfflineInfo, OfflineMyList, ServerProcess
+
+try:
+    from prettytable import PrettyTable
+except ImportError:
+    PrettyTable = False
+
+
+class Scenario:
+    # モックサーバーが返す動画視聴ページの形式
+    layout = MockServer.MIXED
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, save_dir: Path, logger: utils.NTLogger):
+        """
+        測る対象ひとつ分の準備と実行。
+
+        prepare() で測らない下ごしらえをして、 run() にかかった時間を測る。
+
+        :param asyncio.AbstractEventLoop loop: イベントループ
+        :param Path save_dir: ダウンロードしたものを置く場所
+        :param utils.NTLogger logger: ロガー
+        """
+        self.loop = loop
+        self.save_dir = save_dir
+        self.logger = logger
+        self.session = None  # type: Optional[aiohttp.ClientSession]
+
+    def prepare(self, video_ids: List[str]) -> None:
+        async def _session():
+            return aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=100))
+
+        self.session = self.loop.run_until_complete(_session())
+
+    async def run(self, video_ids: List[str]) -> int:
+        """
+        :return: 処理できた件数
+        :rtype: int
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        if self.session is not None:
+            self.loop.run_until_complete(self.session.close())
+
+    def glossary(self, video_ids: List[str]) -> Dict[str, Dict]:
+        """ 動画の情報を取ってくる。 下ごしらえに使う """
+        return OfflineInfo(video_ids, session=self.session, logger=self.logger, loop=self.loop).info
+
+
+class InfoScenario(Scenario):
+    async def run(self, video_ids: List[str]) -> int:
+        info = OfflineInfo([], session=self.session, logger=self.logger, loop=self.loop)
+        return len(await info.fetch(video_ids))
+
+
+class ThumbnailScenario(Scenario):
+    def prepare(self, video_ids: List[str]) -> None:
+        super().prepare(video_ids)
+        self.thumbnail = Thumbnail({}, save_dir=self.save_dir, logger=self.logger,
+                                   session=self.session, loop=self.loop)
+
+    async def run(self, video_ids: List[str]) -> int:
+        self.thumbnail.glossary = await self.thumbnail._get_infos(video_ids)
+        return len(await self.thumbnail.download())
+
+
+class CommentScenario(Scenario):
+    def prepare(self, video_ids: List[str]) -> None:
+        super().prepare(video_ids)
+        self.comment = Comment(self.glossary(video_ids), save_dir=self.save_dir, logger=self.logger,
+                               session=self.session, loop=self.loop)
+
+    async def run(self, video_ids: List[str]) -> int:
+        results = await self.comment._broker()
+        return sum(1 for result in results if result is True)
+
+
+class SmileScenario(Scenario):
+    layout = MockServer.WATCH_API
+    smile = True
+
+    def prepare(self, video_ids: List[str]) -> None:
+        super().prepare(video_ids)
+        self.video = Video(self.glossary(video_ids), save_dir=self.save_dir, logger=self.logger,
+                           smile=self.smile, multiline=False, session=self.session, loop=self.loop)
+
+    async def run(self, video_ids: List[str]) -> int:
+        await self.video.download()
+        return sum(1 for path in self.save_dir.iterdir() if path.suffix in (".mp4", ".flv"))
+
+
+class DmcScenario(SmileScenario):
+    layout = MockServer.DATA_API
+    smile = False
+
+
+class MyListScenario(Scenario):
+    # 一度のリクエストで追加する数
+    batch = 100
+
+    def prepare(self, video_ids: List[str]) -> None:
+        self.mylist = OfflineMyList(logger=self.logger)
+        # 登録できる数はモックサーバーの側で件数に合わせてある
+        self.mylist.loop.run_until_complete(self.mylist._create_mylist("benchmark"))
+        self.list_id, _ = self.mylist._get_list_id("benchmark")
+
+    async def run(self, video_ids: List[str]) -> int:
+        for position in range(0, len(video_ids), self.batch):
+            await self.mylist._add_onetime(self.list_id, *video_ids[position:position + self.batch])
+        items = await self.mylist.fetch_one(self.list_id, with_header=False)
+        return len(items)
+
+    def close(self) -> None:
+        self.mylist.close()
+
+
+TARGETS = OrderedDict([
+    ("info", InfoScenario),
+    ("thumbnail", ThumbnailScenario),
+    ("comment", CommentScenario),
+    ("smile", SmileScenario),
+    ("dmc", DmcScenario),
+    ("mylist", MyListScenario),
+])
+
+
+def measure(target: str, scale: int, options: Dict, trace_memory: bool) -> Tuple[int, float, int, int]:
+    """
+    ひとつの対象を、ひとつの件数で一回だけ測る。
+
+    :param str target: 測る対象の名前
+    :param int scale: 件数
+    :param Dict options: モックサーバーに渡す引数
+    :param bool trace_memory: tracemalloc でメモリの使用量を測るかどうか
+    :return: (処理できた件数, かかった秒数, メモリの使用量の最大値 (バイト), サーバーが受けたリクエストの数)
+    :rtype: Tuple[int, float, int, int]
+    """
+    scenario_class = TARGETS[target]
+    video_ids = [f"sm{number}" for number in range(1, scale + 1)]
+    server = ServerProcess(layout=scenario_class.layout, mylist_limit=scale, **options)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    logger = utils.NTLogger(file_name=None, log_level="WARNING")
+    with tempfile.TemporaryDirectory() as save_dir, server, server.redirect(), \
+            contextlib.redirect_stderr(io.StringIO()):
+        scenario = scenario_class(loop, Path(save_dir), logger)
+        try:
+            scenario.prepare(video_ids)
+            gc.collect()
+            if trace_memory:
+                tracemalloc.start()
+            begin = time.perf_counter()
+            done = loop.run_until_complete(scenario.run(video_ids))
+            elapsed = time.perf_counter() - begin
+            peak = tracemalloc.get_traced_memory()[1] if trace_memory else 0
+        finally:
+            tracemalloc.stop()
+            scenario.close()
+            loop.close()
+        requests = server.stop()
+    return done, elapsed, peak, sum(requests.values())
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", nargs="+", default=list(TARGETS), choices=list(TARGETS), help="測る対象")
+    parser.add_argument("--scales", nargs="+", type=int, default=[10, 1000, 10000], help="件数")
+    parser.add_argument("--latency", type=float, default=0.0, help="サーバーが応答までに待つ秒数")
+    parser.add_argument("--bandwidth", type=int, default=None, help="応答ごとの送信速度 (バイト毎秒)")
+    parser.add_argument("--video-size", type=int, default=64 * 1024, help="動画の大きさ (バイト)")
+    parser.add_argument("--comments", type=int, default=1000, help="動画ごとのコメントの数")
+    parser.add_argument("--no-memory", action="store_true", help="メモリの使用量を測らない")
+    args = parser.parse_args(arguments)
+    options = {"latency": args.latency, "bandwidth": args.bandwidth,
+               "video_size": args.video_size, "comments": args.comments}
+
+    header = ["target", "scale", "done", "seconds", "items/s", "peak MiB", "requests"]
+    rows = []
+    for target in args.targets:
+        for scale in args.scales:
+            done, elapsed, _, requests = measure(target, scale, options, trace_memory=False)
+            peak = 0 if args.no_memory else measure(target, scale, options, trace_memory=True)[2]
+            row = [target, scale, done, f"{elapsed:.2f}", f"{done / elapsed:.1f}",
+                   f"{peak / 1024 / 1024:.1f}" if peak else "-", requests]
+            print("\t".join(str(item) for item in row), flush=True)
+            rows.append(row)
+
+    if PrettyTable:
+        table = PrettyTable(header)
+        for row in rows:
+            table.add_row(row)
+        print(table.get_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# coding: UTF-8
+"""
+動画視聴ページからの情報の取り出しにかかる時間を、
+WatchDataScanner を使う方法と BeautifulSoup でページ全体を解析する方法とで比べる。
+
+使い方:
+
+    python -m benchmarks.watch_page                      # 見本のページで測る
+    python -m benchmarks.watch_page saved/sm9.html ...   # 保存したページで測る
+    python -m benchmarks.watch_page --number 50
+"""
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+from nicotools import utils
+from nicotools.download import Info
+
+from benchmarks import samples
+
+
+def make_info() -> Info:
+    """ 通信せずに解析の部分だけを使うための Info を作る """
+    info = Info.__new__(Info)
+    info.logger = utils.NTLogger(file_name=None, log_level="WARNING")
+    return info
+
+
+def measure(name: str, page: bytes, number: int) -> None:
+    info = make_info()
+    text = page.decode("utf-8")
+    fast = info._junction(page)
+    slow = info._junction_soup(text)
+    if fast != slow:
+        print(f"{name}: results differ!", file=sys.stderr)
+
+    t_fast = min(timeit.repeat(lambda: info._junction(page), number=number, repeat=3)) / number
+    t_slow = min(timeit.repeat(lambda: info._junction_soup(text), number=number, repeat=3)) / number
+    print(f"{name:<32} {len(page) / 1024:>8.1f}KB"
+          f" scanner: {t_fast * 1000:>8.3f}ms"
+          f" soup: {t_slow * 1000:>8.3f}ms"
+          f" x{t_slow / t_fast:>7.1f}")
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pages", nargs="*", help="保存しておいた動画視聴ページのHTML")
+    parser.add_argument("--number", type=int, default=20, help="一回の計測で繰り返す回数")
+    args = parser.parse_args(arguments)
+
+    if args.pages:
+        pages = [(Path(name).name, Path(name).read_bytes()) for name in args.pages]
+    else:
+        pages = [("sample (data-api-data)", samples.page_data_api()),
+                 ("sample (watchAPIDataContainer)", samples.page_watch_api())]
+    for name, page in pages:
+        measure(name, page, args.number)
+
+
+if __name__ == "__main__":
+    main()
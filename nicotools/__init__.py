@@ -1,9 +1,26 @@
 # coding: UTF-8
+import importlib
 import os
 import sys
 
 from .utils import Msg, Err, InheritedParser
-from . import download, mylist
+
+
+def subcommand(module_name):
+    """
+    サブコマンドの main を返す。
+
+    aiohttp などの重いライブラリーを読み込むのはサブコマンドのモジュールなので、
+    そのサブコマンドが実際に選ばれて実行されるときまで読み込まない。
+    --help や --what だけならば読み込まずに済む。
+
+    :param str module_name: "download", "mylist" または "verify"
+    :rtype: (argparse.Namespace) -> bool
+    """
+    def runner(args):
+        return importlib.import_module("." + module_name, __name__).main(args)
+    runner.__qualname__ = runner.__name__ = "{}.main".format(module_name)
+    return runner
 
 
 def main(arguments=None):
@@ -25,7 +42,7 @@ def main(arguments=None):
 
 
     parser_nd = subparsers.add_parser("download", aliases=["d"], help=Msg.nd_description)
-    parser_nd.set_defaults(func=download.main)
+    parser_nd.set_defaults(func=subcommand("download"))
     parser_nd.add_argument("VIDEO_ID", nargs="+", type=str, help=Msg.nd_help_video_id)
     parser_nd.add_argument("--loglevel", type=str.upper, default="INFO", help=Msg.nd_help_loglevel, choices=choices)
     parser_nd.add_argument("-w", "--what", action="store_true", help=Msg.nd_help_what)
@@ -36,13 +53,29 @@ def main(arguments=None):
     parser_nd.add_argument("-v", "--video", action="store_true", help=Msg.nd_help_video)
     parser_nd.add_argument("-t", "--thumbnail", action="store_true", help=Msg.nd_help_thumbnail)
     parser_nd.add_argument("-x", "--xml", action="store_true", help=Msg.nd_help_xml)
+    parser_nd.add_argument("--columnar", action="store_true", help=Msg.nd_help_columnar)
+    parser_nd.add_argument("--incremental", action="store_true", help=Msg.nd_help_incremental)
+    parser_nd.add_argument("--overwrite", action="store_true", help=Msg.nd_help_overwrite)
+    parser_nd.add_argument("--wayback", action="store_true", help=Msg.nd_help_wayback)
     parser_nd.add_argument("--smile", action="store_true", help=Msg.nd_help_smile)
     parser_nd.add_argument("--limit", type=int, help=Msg.nd_help_limit, default=4)
+    parser_nd.add_argument("--rate", type=float, help=Msg.nd_help_rate, default=0)
+    parser_nd.add_argument("--inflight", type=int, help=Msg.nd_help_inflight, default=4)
+    parser_nd.add_argument("--no-cache", action="store_false", help=Msg.nd_help_no_cache, dest="cache")
+    parser_nd.add_argument("--parallel", type=int, help=Msg.nd_help_parallel, default=3)
+    parser_nd.add_argument("--connections", type=int, help=Msg.nd_help_connections, default=16)
+    parser_nd.add_argument("--trace", type=str, help=Msg.nd_help_trace, metavar="FILE")
+    parser_nd.add_argument("--retries", type=int, help=Msg.nd_help_retries, default=3)
+    parser_nd.add_argument("--deadline", type=float, help=Msg.nd_help_deadline, default=None)
+    parser_nd.add_argument("--bandwidth", type=str, help=Msg.nd_help_bandwidth, metavar="RATE")
+    parser_nd.add_argument("--bandwidth-per-video", type=str, help=Msg.nd_help_bandwidth_per_video, metavar="RATE")
+    parser_nd.add_argument("--bandwidth-schedule", type=str, help=Msg.nd_help_bandwidth_schedule, metavar="SPEC")
+    parser_nd.add_argument("--bandwidth-file", type=str, help=Msg.nd_help_bandwidth_file, metavar="FILE")
     parser_nd.add_argument("--nomulti", action="store_false", help=Msg.nd_help_nomulti, dest="nomulti")
 
 
     parser_ml = subparsers.add_parser("mylist", aliases=["m"], help=Msg.ml_description)
-    parser_ml.set_defaults(func=mylist.main)
+    parser_ml.set_defaults(func=subcommand("mylist"))
     parser_ml.add_argument("src", nargs=1, help=Msg.ml_help_src, metavar="マイリスト名")
     parser_ml.add_argument("--loglevel", type=str.upper, default="INFO", help=Msg.nd_help_loglevel, choices=choices)
     parser_ml.add_argument("-w", "--what", action="store_true", help=Msg.nd_help_what)
@@ -51,6 +84,7 @@ def main(arguments=None):
     parser_ml.add_argument("-i", "--id", action="store_true", help=Msg.ml_help_id)
     parser_ml.add_argument("-o", "--out", nargs=1, help=Msg.ml_help_outfile, metavar="FILE")
     parser_ml.add_argument("--yes", action="store_true", help=Msg.ml_help_yes)
+    parser_ml.add_argument("--trace", type=str, help=Msg.nd_help_trace, metavar="FILE")
 
     group_one = parser_ml.add_argument_group(Msg.ml_help_group_a)
     group_one.add_argument("-t", "--to", nargs=1, help=Msg.ml_help_to, metavar="To")
@@ -58,6 +92,8 @@ def main(arguments=None):
     group_one.add_argument("-d", "--delete", nargs="+", help=Msg.ml_help_delete, metavar="sm...")
     group_one.add_argument("-m", "--move", nargs="+", help=Msg.ml_help_move, metavar="sm...")
     group_one.add_argument("-c", "--copy", nargs="+", help=Msg.ml_help_copy, metavar="sm...")
+    group_one.add_argument("--sync", nargs=1, help=Msg.ml_help_sync, metavar="FILE")
+    group_one.add_argument("--dry-run", action="store_true", help=Msg.ml_help_dry_run)
 
     group_two = parser_ml.add_argument_group(Msg.ml_help_group_b)
     group_two.add_argument("-r", "--create", action="store_true", help=Msg.ml_help_create)
@@ -66,6 +102,14 @@ def main(arguments=None):
     group_two.add_argument("-e", "--export", action="count", help=Msg.ml_help_export)
     group_two.add_argument("--everything", action="store_true", help=Msg.ml_help_everything)
 
+
+    parser_vf = subparsers.add_parser("verify", aliases=["v"], help=Msg.vf_description)
+    parser_vf.set_defaults(func=subcommand("verify"))
+    parser_vf.add_argument("DIRECTORY", nargs="+", type=str, help=Msg.vf_help_directory)
+    parser_vf.add_argument("--loglevel", type=str.upper, default="INFO", help=Msg.nd_help_loglevel, choices=choices)
+    parser_vf.add_argument("-w", "--what", action="store_true", help=Msg.nd_help_what)
+    parser_vf.add_argument("--workers", type=int, help=Msg.vf_help_workers, default=None)
+
     if len(sys.argv) <= 1:
         parser.print_help()
         sys.exit()
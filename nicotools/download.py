@@ -1,33 +1,49 @@
 # coding: UTF-8
 import asyncio
 import functools
+from concurrent.futures import ProcessPoolExecutor
+from email.utils import formatdate
 import html
 import json
+import logging
 import os
 import re
+import signal
 import sys
+import time
 from pathlib import Path
 from string import Template
-from typing import Dict, Union, Optional, List
+from typing import BinaryIO, Callable, Dict, Iterable, Union, Optional, List, Set, Tuple
 from urllib.parse import parse_qs, unquote
+from xml.etree import ElementTree
 
 import aiohttp
 from bs4 import BeautifulSoup, Tag
 from tqdm import tqdm
 
 from nicotools import utils
+from nicotools.store import (BlockHasher, ChatStore, FileIndex, InfoCache, Manifest, RangeJournal,
+                             chats_from_json, chats_from_xml)
+from nicotools.tracer import Tracer
 from nicotools.utils import Msg, Err, URL, KeyGetFlv, KeyGTI, KeyDmc, DataKey
 
 
 class Info(utils.Canopy):
+    # 動画視聴ページを一度に受け取る大きさ
+    READ_SIZE = 64 * 1024
+
     def __init__(self,
                  videoids: List,
                  mail: Optional[str]=None,
                  password: Optional[str]=None,
                  limit: int=4,
-                 interval: Union[int, float]=5,
-                 backoff: Union[int, float]=3,
-                 retries: Union[int, float]=3,
+                 interval: Optional[float]=None,
+                 backoff: Optional[float]=None,
+                 retries: Optional[int]=None,
+                 parse_workers: int=0,
+                 cache: Optional[InfoCache]=None,
+                 stable_only: bool=False,
+                 logged_in: bool=False,
                  logger: Optional[utils.NTLogger]=None,
                  session: Optional[aiohttp.ClientSession]=None,
                  loop: Optional[asyncio.AbstractEventLoop]=None,
@@ -35,6 +51,16 @@ class Info(utils.Canopy):
         """
         動画視聴ページから様々なデータを集める。
 
+        parse_workers に1以上を指定すると、ページの解析を別のプロセスで行う。
+        解析している間も、イベントループは他のページのダウンロードを続けられる。
+
+        cache を渡すと、まだ使える情報はそこから取り出し、残りの動画だけを取りに行く。
+        すべてがキャッシュにあればログインもしない。
+
+        session を渡した場合、そのセッションは呼び出し側のものとして扱い、ここでは閉じない。
+        そのセッションにログイン済みのクッキーがなければ、最初に取りに行くときに一度だけ入れる。
+        logged_in が真なら、呼び出し側がすでに入れているものとして何もしない。
+
         :param List videoids:
         :param Optional[str] mail: メールアドレス
         :param Optional[str] password: パスワード
@@ -42,18 +68,32 @@ class Info(utils.Canopy):
         :param aiohttp.ClientSession session:
         :param int limit: 同時にアクセスする最大数
         :param asyncio.AbstractEventLoop loop: イベントループ
-        :param Union[int, float] interval: うまくいかなかった場合の待ち時間
-        :param Union[int, float] backoff: 待ち時間の増大倍率
-        :param Union[int,float] retries: 再試行回数
+        :param Optional[float] interval: うまくいかなかった場合の待ち時間の上限。 None なら全体の方針に従う。
+        :param Optional[float] backoff: 待ち時間の増大倍率。 None なら全体の方針に従う。
+        :param Optional[int] retries: 再試行回数。 None なら全体の方針に従う。
+        :param int parse_workers: ページの解析に使うプロセスの数。 0 ならイベントループの中で解析する。
+        :param Optional[InfoCache] cache: 情報を保存しておく場所
+        :param bool stable_only: 動画そのものについての情報だけが必要か (サムネイルだけを取る場合など)
+        :param bool logged_in: 渡したセッションにログイン済みのクッキーが入っているかどうか
         """
-        super().__init__(loop=loop, logger=logger)
+        super().__init__(loop=loop, logger=logger, limit=limit)
         self.__mail = mail
         self.__password = password
-        self.aio_session = session or self.loop.run_until_complete(self.get_session())
-        self.__parallel_limit = limit
-        self.interval = interval
-        self.backoff = backoff
-        self.retries = retries
+        self.__executor = ProcessPoolExecutor(max_workers=parse_workers) if parse_workers > 0 else None
+        self.cache = cache
+        self.stable_only = stable_only
+        self.aio_session = session
+        self.__owns_session = session is None
+        # ログインは同期的な通信を伴うので、ひとつのインスタンスで一度だけにする
+        self.__has_cookies = logged_in
+        if not (interval is None and backoff is None and retries is None):
+            shared = self.get_retry_policy()
+            self.retry = utils.RetryPolicy(
+                retries=shared.retries if retries is None else max(0, int(retries)),
+                base=shared.base if interval is None else interval,
+                factor=shared.factor if backoff is None else max(1, backoff),
+                cap=max(shared.cap, shared.base if interval is None else interval),
+                deadline=shared.deadline, rules=shared.rules)
         self.videoinfo = self.get_data(videoids)
 
     async def get_session(self) -> aiohttp.ClientSession:
@@ -62,6 +102,9 @@ class Info(utils.Canopy):
 
         :rtype: aiohttp.ClientSession
         """
+        return aiohttp.ClientSession(cookies=self._get_cookie(), trace_configs=self.trace_configs(Tracer.INFO))
+
+    def _get_cookie(self) -> Dict[str, str]:
         login = utils.LogIn(mail=self.__mail, password=self.__password)
         if login.is_login:
             cook = login.cookie
@@ -69,13 +112,18 @@ class Info(utils.Canopy):
             login.get_session(utils.LogIn.ask_credentials())
             cook = login.cookie
         self.logger.debug(f"Object ID of cookie (Info): {id(cook)}")
-        return aiohttp.ClientSession(cookies=cook)
+        return cook
 
     def close(self):
         async def _close():
             await self.session.close()
 
-        self.loop.run_until_complete(_close())
+        if self.session is not None and self.__owns_session:
+            self.loop.run_until_complete(_close())
+            self.aio_session = None
+        if self.__executor is not None:
+            self.__executor.shutdown()
+            self.__executor = None
 
     @property
     def info(self) -> Dict:
@@ -92,15 +140,42 @@ class Info(utils.Canopy):
         :param List video_ids:
         :rtype: Dict
         """
-        video_ids = utils.validator(video_ids)
-        infos = self.loop.run_until_complete(
-            asyncio.gather(*[self._retrieve_info(_id) for _id in video_ids]))
-        result = {_id: _info for _id, _info in zip(video_ids, infos)}
-        sieved_result = self._sieve(result)
-
+        if not video_ids:
+            return {}
+        sieved_result = self.loop.run_until_complete(self.fetch(video_ids))
         self.close()
         return sieved_result
 
+    async def fetch(self, video_ids: List) -> Dict:
+        """
+        get_data の中身。 イベントループの中から呼ぶ。
+
+        セッションは閉じないので、続けて別の処理に使い回せる。
+
+        :param List video_ids:
+        :rtype: Dict
+        """
+        if not video_ids:
+            return {}
+        video_ids = utils.validator(video_ids)
+        result = self.cache.lookup(video_ids, self.stable_only) if self.cache else {}
+        remains = [_id for _id in video_ids if _id not in result]
+        if remains:
+            if self.aio_session is None:
+                self.aio_session = await self.get_session()
+                self.__owns_session = True
+            elif not (self.__owns_session or self.__has_cookies):
+                # 借りたセッションがまだログインしていなくても取りに行けるように
+                self.aio_session.cookie_jar.update_cookies(self._get_cookie())
+                self.__has_cookies = True
+            infos = await asyncio.gather(*[self._retrieve_info(_id) for _id in remains])
+            fetched = {_id: _info for _id, _info in zip(remains, infos)}
+            if self.cache:
+                self.cache.store(fetched)
+            result.update(fetched)
+        result = {_id: result[_id] for _id in video_ids}
+        return self._sieve(result)
+
     def _sieve(self, infos: Dict) -> Dict:
         """
         非公開や削除済み動画をふるいにかける。
@@ -115,34 +190,85 @@ class Info(utils.Canopy):
             self.logger.info(Msg.nd_deleted_or_private.format(bad))
         return good
 
-    async def _retrieve_info(self, video_id: str) -> Dict:
-        interval = self.interval
-        backoff = self.backoff
-        attempt = max(0, self.retries) + 1
+    async def _retrieve_info(self, video_id: str) -> Optional[Dict]:
+        """
+        動画視聴ページを取ってきて解析する。 取れなかった場合は None を返す。
+
+        ページは届いた順に WatchDataScanner に読ませ、動画の情報を切り出せたらその先は読まずに手放す。
+
+        :param str video_id: 動画ID
+        :rtype: Optional[Dict]
+        """
         url = URL.URL_Watch + video_id
 
-        async with asyncio.Semaphore(self.__parallel_limit):
-            while attempt > 0:
-                attempt -= 1
-                async with self.session.get(url) as response:  # type: aiohttp.ClientResponse
-                    if response.status == 200:
-                        info_data = await response.text()
-                        return self._junction(info_data)
-                    elif 400 <= response.status < 500:
-                        break
-                    elif 500 <= response.status < 600:
-                        await asyncio.sleep(interval/2)
-                        print(Err.waiting_for_permission)
-                        await asyncio.sleep(interval/2)
-                        interval *= backoff
-                    else:
-                        break
+        async def attempt(number: int) -> utils.WatchDataScanner:
+            scanner = utils.WatchDataScanner()
+            async with self.slot(url):
+                async with self.session.get(url, trace_request_ctx=Tracer.tag(Tracer.INFO, number)) as response:
+                    response.raise_for_status()
+                    async for chunk in response.content.iter_chunked(self.READ_SIZE):
+                        if scanner.feed(chunk):
+                            # 必要なところは切り出せたので、残りは受け取らない
+                            response.release()
+                            break
+            return scanner
+
+        try:
+            scanner = await self.retry.call(attempt, self.logger, video_id)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+            self.logger.error(Err.request_failed.format(video_id, Tracer.INFO, error))
+            return None
+        return await self._parse(bytes(scanner.buffer), scanner)
+
+    async def _parse(self, content: bytes, scanner: Optional[utils.WatchDataScanner]=None
+                     ) -> Dict[str, Union[str, int, List[str], bool]]:
+        """
+        動画視聴ページを解析する。 プロセスプールがあればそちらに任せる。
+
+        scanner にページを読ませながら切り出したものがあれば、ページを調べ直さずにそれを使う。
 
-    def _junction(self, content: str) -> Dict[str, Union[str, int, List[str], bool]]:
+        :param bytes content: 受け取ったところまでのHTML
+        :param Optional[utils.WatchDataScanner] scanner: content を読ませ終えた WatchDataScanner
+        :rtype: Dict[str, Union[str, int, List[str], bool]]
+        """
+        if scanner is None:
+            if self.__executor is None:
+                return self._junction(content)
+            result = await self.loop.run_in_executor(self.__executor, parse_watch_page, content)
+        elif not scanner.done:
+            result = None
+        elif self.__executor is None:
+            result = parse_watch_data(scanner.kind, scanner.payload)
+        else:
+            result = await self.loop.run_in_executor(
+                self.__executor, parse_watch_data, scanner.kind, scanner.payload)
+        if result is None:
+            self.logger.debug("Falling back to BeautifulSoup.")
+            return self._junction_soup(content.decode("utf-8", utils.BACKSLASH))
+        return result
+
+    def _junction(self, content: Union[bytes, str]) -> Dict[str, Union[str, int, List[str], bool]]:
         """
         動画視聴ページのHTMLから必要な情報を取り出す。
 
         HTML構造は複数あり、ものによって内容が異なる。適切な担当者へ振り向ける。
+        まずは WatchDataScanner で必要な部分だけを切り出し、
+        それでうまくいかなかった時にだけ BeautifulSoup でページ全体を解析する。
+
+        :param bytes | str content:
+        :rtype: Dict[str, Union[str, int, List[str], bool]]
+        """
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        result = parse_watch_page(content)
+        if result is None:
+            self.logger.debug("Falling back to BeautifulSoup.")
+            return self._junction_soup(content.decode("utf-8", utils.BACKSLASH))
+        return result
+
+    def _junction_soup(self, content: str) -> Dict[str, Union[str, int, List[str], bool]]:
+        """
+        動画視聴ページのHTML全体を BeautifulSoup で解析して必要な情報を取り出す。
 
         :param str content:
         :rtype: Dict[str, Union[str, int, List[str], bool]]
@@ -165,7 +291,8 @@ class Info(utils.Canopy):
                 print(f"Unknown HTML structure has been met."
                       f" It's exported for debugging at {Path.cwd()/file_name}.", file=sys.stderr)
 
-    def _read_from_data_api(self, content: str) -> Dict:
+    @staticmethod
+    def _read_from_data_api(content: str) -> Dict:
         """
         data-api-data 属性を持つタグがあるHTMLから情報を取り出す。
 
@@ -244,7 +371,8 @@ class Info(utils.Canopy):
             })
         return info
 
-    def _read_from_watch_api(self, content: str) -> Dict:
+    @staticmethod
+    def _read_from_watch_api(content: str) -> Dict:
         """
         watchAPIDataContainer を含む HTML から情報を取り出す。
 
@@ -321,12 +449,48 @@ class Info(utils.Canopy):
         return info
 
 
+def parse_watch_page(content: bytes) -> Optional[Dict[str, Union[str, int, List[str], bool]]]:
+    """
+    動画視聴ページのHTMLから WatchDataScanner で必要な情報を取り出す。
+
+    プロセスプールからも呼べるように、モジュールの関数にしてある。
+    うまくいかなければ None を返すので、その時は BeautifulSoup で解析し直す。
+
+    :param bytes content:
+    :rtype: Optional[Dict[str, Union[str, int, List[str], bool]]]
+    """
+    scanner = utils.WatchDataScanner()
+    if not scanner.feed(content):
+        return None
+    return parse_watch_data(scanner.kind, scanner.payload)
+
+
+def parse_watch_data(kind: str, payload: str) -> Optional[Dict[str, Union[str, int, List[str], bool]]]:
+    """
+    WatchDataScanner が切り出したJSONから必要な情報を取り出す。
+
+    うまくいかなければ None を返す。
+
+    :param str kind: WatchDataScanner.DATA_API または WatchDataScanner.WATCH_API
+    :param str payload: JSONの文字列
+    :rtype: Optional[Dict[str, Union[str, int, List[str], bool]]]
+    """
+    try:
+        if kind == utils.WatchDataScanner.DATA_API:
+            return Info._read_from_data_api(payload)
+        else:
+            return Info._read_from_watch_api(payload)
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
 class Thumbnail(utils.Canopy):
     def __init__(self,
                  videoids: Union[List, Dict],
                  save_dir: Union[str, Path]=None,
                  is_large: bool=True,
                  limit: int=8,
+                 overwrite: bool=False,
                  logger: Optional[utils.NTLogger]=None,
                  session: Optional[aiohttp.ClientSession]=None,
                  loop: Optional[asyncio.AbstractEventLoop]=None,
@@ -334,23 +498,34 @@ class Thumbnail(utils.Canopy):
         """
         サムネイル画像をダウンロードする。
 
+        overwrite が偽なら、保存済みのものは If-None-Match (ETag) と If-Modified-Since をつけて取りに行き、
+        サーバー上で変わっていなければ (304) そのままにしておく。
+
         :param dict[str, dict[str, int | str]] | list[str] videoids:
          動画の情報が入った辞書またはIDのリスト
         :param str | Path save_dir:
         :param bool is_large: 大きいサムネイルを取りに行くかどうか
         :param T<= logging.logger logger: ロガー
         :param int limit: 同時にアクセスする最大数
-        :param aiohttp.ClientSession session:
+        :param bool overwrite: 保存済みのものがあっても取りに行って上書きするかどうか
+        :param aiohttp.ClientSession session: 渡した場合は呼び出し側のものとして扱い、ここでは閉じない。
         :param asyncio.AbstractEventLoop loop: イベントループ
         """
-        super().__init__(loop=loop, logger=logger)
+        super().__init__(loop=loop, logger=logger, limit=limit)
         self.undone = []
         self.done = []
         self.__bucket = {}
+        self.__owns_session = session is None
         self.session = session or self.loop.run_until_complete(self.get_session())
-        self.__parallel_limit = limit
         self.glossary = {}
         self.save_dir = utils.get_dir(save_dir)
+        # サムネイルは小さくて数が多いので、記録は溜めておいてまとめて書き出す
+        self.manifest = Manifest(self.save_dir, interval=5, batch=100)
+        self.overwrite = overwrite
+        self.existing = FileIndex(self.save_dir)
+        # 動画IDごとの、サーバーが返した ETag と Last-Modified
+        self.validators = {}  # type: Dict[str, Dict[str, Optional[str]]]
+        self.__recorded = None  # type: Optional[Dict[str, Dict]]
         if isinstance(videoids, list):
             videoids = utils.validator(videoids)
             videoids = self.loop.run_until_complete(self._get_infos(videoids))
@@ -358,13 +533,16 @@ class Thumbnail(utils.Canopy):
         self.is_large = is_large
 
     async def get_session(self) -> aiohttp.ClientSession:
-        return aiohttp.ClientSession()
+        return aiohttp.ClientSession(trace_configs=self.trace_configs(Tracer.THUMBNAIL))
 
     def close(self):
         async def _close():
             await self.session.close()
 
-        self.loop.run_until_complete(_close())
+        # 溜めておいたハッシュの記録を書き出す
+        self.manifest.save()
+        if self.__owns_session:
+            self.loop.run_until_complete(_close())
 
     def start(self):
         """
@@ -372,14 +550,44 @@ class Thumbnail(utils.Canopy):
 
         :rtype: list
         """
+        self.loop.run_until_complete(self.download())
+        self.close()
+        return self.done
 
+    async def download(self) -> List[str]:
+        """
+        start の中身。 イベントループの中から呼ぶ。
+
+        :return: ダウンロードできた動画のIDのリスト
+        :rtype: List[str]
+        """
         if len(self.glossary) > 0:
-            self.loop.run_until_complete(self._download(list(self.glossary), self.is_large))
-            while len(self.undone) > 0:
-                self.loop.run_until_complete(self._download(self.undone, False))
-        self.close()
+            await self._download(list(self.glossary), self.is_large)
+            if self.is_large and len(self.undone) > 0:
+                # 大きいものがなかった動画だけ、小さいものを一度だけ取りに行く
+                undone, self.undone = self.undone, []
+                await self._download(undone, False)
+            self.manifest.save()
         return self.done
 
+    async def download_one(self, video_id: str, info: Dict) -> bool:
+        """
+        動画ひとつ分のサムネイルをダウンロードする。 大きいものがなければ小さいものを取りに行く。
+
+        :param str video_id: 動画ID
+        :param Dict info: その動画の情報
+        :return: ダウンロードできたかどうか
+        :rtype: bool
+        """
+        self.glossary[video_id] = info
+        await self._download([video_id], self.is_large)
+        if video_id in self.undone:
+            self.undone.remove(video_id)
+            await self._download([video_id], False)
+            if video_id in self.undone:
+                self.undone.remove(video_id)
+        return video_id in self.done
+
     async def _download(self, video_ids: list, islarge: bool=True) -> None:
         urls = self._make_urls(video_ids, islarge)
 
@@ -389,25 +597,47 @@ class Thumbnail(utils.Canopy):
             f = asyncio.ensure_future(coro)
             f.add_done_callback(functools.partial(self._saver, video_id))
             futures.append(f)
-        await asyncio.wait(futures, loop=self.loop)
+        await asyncio.gather(*futures)
 
     async def _worker(self, idx: int, video_id: str, url: str) -> Optional[bytes]:
-        async with asyncio.Semaphore(self.__parallel_limit):
+        self.logger.info(Msg.nd_download_pict.format(
+            idx + 1, len(self.glossary), video_id, self.glossary[video_id][KeyGTI.TITLE]))
+
+        file_path = utils.make_name(self.glossary[video_id], self.save_dir, extention="jpg")
+        headers = self._conditions(file_path.name)
+
+        async def attempt(number: int) -> Optional[bytes]:
+            async with self.slot(url):
+                async with self.session.get(url, timeout=10, headers=headers,
+                                            trace_request_ctx=Tracer.tag(Tracer.THUMBNAIL, number)) as response:
+                    response.raise_for_status()
+                    if response.status == 304:
+                        return None
+                    self.validators[video_id] = {"etag": response.headers.get("ETag"),
+                                                 "last_modified": response.headers.get("Last-Modified")}
+                    data = await response.read()
+                    # 圧縮されていなければ、本文は Content-Length の通りの大きさのはず
+                    if (response.content_length is not None and "Content-Encoding" not in response.headers
+                            and len(data) != response.content_length):
+                        raise aiohttp.ClientPayloadError(
+                            f"Truncated: {len(data)} / {response.content_length} bytes")
+                    return data
 
-            self.logger.info(Msg.nd_download_pict.format(
-                idx + 1, len(self.glossary), video_id, self.glossary[video_id][KeyGTI.TITLE]))
-
-            try:
-                async with self.session.get(url, timeout=10) as response:
-                    if response.status == 200:
-                        # ダウンロードに成功したら「未完了のリスト」から取り除く
-                        if video_id in self.undone:
-                            self.undone.remove(video_id)
-                        return await response.content.read()
-                    elif response.status == 404:
-                        self.undone.append(video_id)
-            except asyncio.TimeoutError:
-                return None
+        try:
+            image_data = await self.retry.call(attempt, self.logger, video_id)
+            if image_data is None:
+                self.logger.info(Msg.nd_skip_unchanged.format(path=file_path))
+                self.done.append(video_id)
+            return image_data
+        except aiohttp.ClientResponseError as error:
+            if error.status == 404:
+                # 見つからなかったものは「未完了のリスト」に入れておく
+                self.undone.append(video_id)
+            else:
+                self.logger.error(Err.request_failed.format(video_id, Tracer.THUMBNAIL, error))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+            self.logger.error(Err.request_failed.format(video_id, Tracer.THUMBNAIL, error))
+        return None
 
     def _saver(self, video_id: str, coroutine: asyncio.Task) -> None:
         image_data = coroutine.result()
@@ -417,9 +647,37 @@ class Thumbnail(utils.Canopy):
 
             with file_path.open('wb') as f:
                 f.write(image_data)
+            hasher = BlockHasher(len(image_data))
+            hasher.update(0, image_data)
+            self.manifest.record(file_path, len(image_data), hasher.hexdigest(file_path),
+                                 **self.validators.pop(video_id, {}))
             self.logger.info(Msg.nd_download_done.format(path=file_path))
             self.done.append(video_id)
 
+    def _conditions(self, name: str) -> Dict[str, str]:
+        """
+        保存済みのサムネイルを、変わっているときだけ取りに行くためのヘッダーを返す。
+
+        前に取りに行ったときの ETag と Last-Modified が記録にあればそれを使い、
+        なければファイルの更新日時を If-Modified-Since にする。
+
+        :param str name: 保存先のファイル名
+        :rtype: Dict[str, str]
+        """
+        if self.overwrite or name not in self.existing:
+            return {}
+        if self.__recorded is None:
+            self.__recorded = self.manifest.load()
+        entry = self.__recorded.get(name, {})
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        elif not headers:
+            headers["If-Modified-Since"] = formatdate(self.existing.mtime(name), usegmt=True)
+        return headers
+
     def _make_urls(self, video_ids: list, is_large: bool=True) -> list:
         """
 
@@ -446,7 +704,7 @@ class Thumbnail(utils.Canopy):
         :rtype: Dict[str, Dict]
         """
         tasks = [self._get_infos_worker(video_id) for video_id in queue]
-        await asyncio.wait(tasks, loop=self.loop)
+        await asyncio.gather(*tasks)
         bad = list(set(queue) - set(self.__bucket))
         if len(bad) > 0:
             self.logger.info(Msg.nd_deleted_or_private.format(bad))
@@ -455,18 +713,26 @@ class Thumbnail(utils.Canopy):
         return result
 
     async def _get_infos_worker(self, video_id: str):
-        async with asyncio.Semaphore(self.__parallel_limit):
-            async with self.session.get(URL.URL_Info + video_id) as resp:
-                result = await resp.text()
-
-            soup = BeautifulSoup(result, "html.parser")
-            if soup.nicovideo_thumb_response["status"].lower() == "ok":
-                self.__bucket[video_id] = {
-                    KeyGTI.FILE_NAME    : utils.t2filename(soup.select(KeyGTI.TITLE)[0].text),
-                    KeyGTI.THUMBNAIL_URL: soup.select(KeyGTI.THUMBNAIL_URL)[0].text,
-                    KeyGTI.TITLE        : html.unescape(soup.select(KeyGTI.TITLE)[0].text),
-                    KeyGTI.VIDEO_ID     : video_id
-                }
+        async def attempt(number: int) -> str:
+            async with self.slot(URL.URL_Info):
+                async with self.session.get(URL.URL_Info + video_id,
+                                            trace_request_ctx=Tracer.tag(Tracer.THUMBNAIL, number)) as resp:
+                    resp.raise_for_status()
+                    return await resp.text()
+
+        try:
+            result = await self.retry.call(attempt, self.logger, video_id)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+            self.logger.error(Err.request_failed.format(video_id, Tracer.THUMBNAIL, error))
+            return
+        soup = BeautifulSoup(result, "html.parser")
+        if soup.nicovideo_thumb_response["status"].lower() == "ok":
+            self.__bucket[video_id] = {
+                KeyGTI.FILE_NAME    : utils.t2filename(soup.select(KeyGTI.TITLE)[0].text),
+                KeyGTI.THUMBNAIL_URL: soup.select(KeyGTI.THUMBNAIL_URL)[0].text,
+                KeyGTI.TITLE        : html.unescape(soup.select(KeyGTI.TITLE)[0].text),
+                KeyGTI.VIDEO_ID     : video_id
+            }
 
 
 class Video(utils.Canopy):
@@ -479,7 +745,11 @@ class Video(utils.Canopy):
                  smile: bool=False,
                  chunk_size: int=1024*50,
                  division: int=4,
+                 parallel: int=3,
+                 connections: int=16,
+                 overwrite: bool=False,
                  logger: Optional[utils.NTLogger]=None,
+                 session: Optional[aiohttp.ClientSession]=None,
                  loop: Optional[asyncio.AbstractEventLoop]=None,
                  ):
         """
@@ -489,12 +759,19 @@ class Video(utils.Canopy):
         :param password: パスワード
         :param logger: ロガー
         :param division: いくつに分割するか
+        :param parallel: DMCサーバーから同時にダウンロードする動画の数
+        :param connections: 動画のダウンロードのために同時に張る接続の数の上限
+        :param overwrite: サーバーと同じ大きさのファイルがすでにあっても取りに行くかどうか
         :param chunk_size: サーバーに一度に要求するデータ量
         :param multiline: プログレスバーを複数行で表示するか
+        :param session: セッション。 渡した場合は呼び出し側のものとして扱い、ここでは閉じない。
         :param loop: イベントループ
         """
         super().__init__(loop=loop, logger=logger)
-        self.session = self.loop.run_until_complete(self.get_session(mail, password))
+        self.__owns_session = session is None
+        self.__dmc = None  # type: Optional[VideoDmc]
+        self.__smile = None  # type: Optional[VideoSmile]
+        self.session = session or self.loop.run_until_complete(self.get_session(mail, password))
         self.commons = {
             DataKey.SESSION     : self.session,
             DataKey.LOGGER      : self.logger,
@@ -503,50 +780,86 @@ class Video(utils.Canopy):
             DataKey.IS_MULTILINE: multiline,
             DataKey.IS_SMILE    : smile,
             DataKey.DIVISION    : division,
+            DataKey.PARALLEL    : parallel,
+            DataKey.CONNECTIONS : connections,
+            DataKey.OVERWRITE   : overwrite,
             DataKey.SAVE_DIR    : utils.get_dir(save_dir)
         }  # type: Dict[str, Union[int, bool, Path, aiohttp.ClientSession, asyncio.AbstractEventLoop, utils.NTLogger]]
 
         self.glossary = videoids
         if isinstance(videoids, list):
-            info = Info(utils.validator(videoids), mail=mail, password=password, session=self.commons[DataKey.SESSION])
+            info = Info(utils.validator(videoids), mail=mail, password=password,
+                        session=self.session, logger=self.logger, loop=self.loop)
             self.glossary = info.info
-            self.commons[DataKey.SESSION] = info.session
-
 
     async def get_session(self, mail: str, password: str) -> aiohttp.ClientSession:
         cook = utils.LogIn(mail=mail, password=password).cookie
-        return aiohttp.ClientSession(cookies=cook)
+        return aiohttp.ClientSession(cookies=cook, trace_configs=self.trace_configs(Tracer.VIDEO_RANGE))
 
     def start(self):
+        self.loop.run_until_complete(self.download())
+        self.close()
+        return True
+
+    async def download(self) -> bool:
+        """
+        start の中身。 イベントループの中から呼ぶ。
+
+        :rtype: bool
+        """
         if self.commons[DataKey.IS_SMILE]:
-            VideoSmile(self.glossary, self.commons).callee()
+            await VideoSmile(self.glossary, self.commons).run()
         else:
             dmc_list = {key: val for key, val in self.glossary.items() if val[KeyDmc.IS_DMC] is True}
             sml_list = {key: val for key, val in self.glossary.items() if val[KeyDmc.IS_DMC] is False}
             if len(dmc_list) > 0:
-                VideoDmc(dmc_list, self.commons).callee()
+                await VideoDmc(dmc_list, self.commons).run()
             if len(sml_list) > 0:
-                VideoSmile(sml_list, self.commons).callee()
+                await VideoSmile(sml_list, self.commons).run()
+        return True
 
-        self.close()
+    async def download_one(self, video_id: str, info: Dict, number: int=0) -> bool:
+        """
+        動画をひとつダウンロードする。
+
+        DMCサーバーとSmileサーバーそれぞれについて、担当するインスタンスを使い回すので、
+        connections で決めた接続数の上限は、この Video から始めたダウンロード全体で守られる。
+
+        :param str video_id: 動画ID
+        :param Dict info: その動画の情報
+        :param int number: 何番目の担当者か (プログレスバーの表示位置に使う)
+        :rtype: bool
+        """
+        if info[KeyDmc.IS_DMC] and not self.commons[DataKey.IS_SMILE]:
+            if self.__dmc is None:
+                self.__dmc = VideoDmc({}, self.commons)
+            worker = self.__dmc
+        else:
+            if self.__smile is None:
+                self.__smile = VideoSmile({}, self.commons)
+            worker = self.__smile
+        worker.glossary[video_id] = info
+        await worker.run_one(len(worker.glossary) - 1, video_id, number)
         return True
 
     def close(self):
         async def _close():
             await self.session.close()
 
-        self.loop.run_until_complete(_close())
-
+        if self.__owns_session:
+            self.loop.run_until_complete(_close())
 
 
-class VideoSmile:
+class VideoBase:
     def __init__(self,
-                 glossary: Dict[str, Union[str, int, bool, List]],
+                 glossary: Dict[str, Dict[str, Union[str, int, bool, List]]],
                  common: Dict[str, Union[int, bool, Path, aiohttp.ClientSession,
-                         asyncio.AbstractEventLoop, utils.NTLogger]]):
+                                         asyncio.AbstractEventLoop, utils.NTLogger]]):
         """
-        Smileサーバーから動画をダウンロードする。
+        Smileサーバーと DMCサーバーからのダウンロードに共通する部分。
 
+        分割してダウンロードするときは、はじめに最終的な大きさのファイルを作っておき、
+        それぞれの担当者が受け持ちの位置へ直接書き込む。後でまとめ直す必要はない。
         """
         self.glossary = glossary
         self.session = common[DataKey.SESSION]
@@ -557,107 +870,275 @@ class VideoSmile:
         self.multiline = common[DataKey.IS_MULTILINE]
         self.smile = common[DataKey.IS_SMILE]
         self.division = common[DataKey.DIVISION]
-        # (実際のダウンロード前のファイルサイズの確認で)同時にアクセスする最大数
-        self.__parallel_limit = 4
-        # 分割数と同じだけの要素を持つリストを作り、各要素にそれぞれが
-        # 保存したファイルサイズを記録する。プログレスバーに利用する。
-        self.__downloaded_size = [0] * common[DataKey.DIVISION]  # type: List[int]
+        self.parallel = common.get(DataKey.PARALLEL) or 1
+        self.connections = common.get(DataKey.CONNECTIONS) or self.division * self.parallel
+        self.overwrite = common.get(DataKey.OVERWRITE, False)
+        self.existing = FileIndex(self.save_dir)
+        self.__connection_semaphore = None  # type: Optional[asyncio.Semaphore]
 
-    def callee(self):
-        # まず各動画のファイルサイズを集める。
-        self.loop.run_until_complete(self._push_file_size())
-        self.loop.run_until_complete(self._broker())
-        return True
+    @property
+    def retry(self) -> utils.RetryPolicy:
+        return utils.Canopy.get_retry_policy()
 
-    async def _push_file_size(self):
-        video_ids = sorted(self.glossary)
-        tasks = [self._get_file_size_worker(video_id) for video_id in video_ids]
-        async with asyncio.Semaphore(self.__parallel_limit):
-            result = await asyncio.gather(*tasks)
-        for _id, size in zip(video_ids, result):
-            self.glossary[_id][KeyDmc.FILE_SIZE] = size
+    @property
+    def connection_semaphore(self) -> asyncio.Semaphore:
+        """
+        すべての動画を通して、同時に張る接続の数を制限するためのセマフォ。
 
-    async def _get_file_size_worker(self, video_id: str) -> int:
-        vid_url = self.glossary[video_id][KeyDmc.VIDEO_URL_SM]
-        self.logger.debug(f"Video ID: {video_id}, Video URL: {vid_url}")
-        async with self.session.head(vid_url) as resp:
-            headers = resp.headers
-            self.logger.debug(f"Headers: {str(headers)}")
-            return int(headers["content-length"])
+        イベントループが動き出してから作る。
+        """
+        if self.__connection_semaphore is None:
+            self.__connection_semaphore = asyncio.Semaphore(self.connections)
+        return self.__connection_semaphore
 
-    async def _broker(self):
-        futures = []
-        for idx, video_id in enumerate(self.glossary):
-            coro = self._download(idx, video_id)
-            f = asyncio.ensure_future(coro)
-            f.add_done_callback(functools.partial(self._combiner, video_id))
-            futures.append(f)
-        await asyncio.wait(futures, loop=self.loop)
+    def _is_present(self, file_path: Path, file_size: int) -> bool:
+        """
+        書きかけではなく、サーバーと同じ大きさのファイルがすでにあるかどうか。
 
-    async def _download(self, idx: int, video_id: str):
-        division = self.division
-        file_path = utils.make_name(self.glossary, self.save_dir)
+        :param Path file_path: 保存先
+        :param int file_size: サーバーが返した content-length
+        :rtype: bool
+        """
+        if self.overwrite:
+            return False
+        name = Path(file_path).name
+        if name + RangeJournal.SUFFIX in self.existing:
+            return False
+        return self.existing.size(name) == file_size
+
+    @staticmethod
+    def _preallocate(file_path: Path, file_size: int) -> None:
+        """
+        書き込みを始める前に、最終的な大きさのファイルを作っておく。
 
-        self.logger.info(Msg.nd_download_video.format(
-            idx + 1, len(self.glossary), video_id, self.glossary[video_id][KeyDmc.TITLE]))
+        :param Path file_path: 保存先
+        :param int file_size: 全体のファイルサイズ
+        :rtype: None
+        """
+        with file_path.open("wb") as fd:
+            try:
+                os.posix_fallocate(fd.fileno(), 0, file_size)
+            except (AttributeError, OSError):
+                # Windows など、使えない環境もある。
+                fd.truncate(file_size)
 
-        video_url = self.glossary[video_id][KeyDmc.VIDEO_URL_SM]
-        file_size = self.glossary[video_id][KeyDmc.FILE_SIZE]
-        headers = [{
-            "Range": f"bytes={int(file_size*order/division)}-{int((file_size*(order+1))/division-1)}"
-           } for order in range(division)]
-
-        for i, h in enumerate(headers):
-            self.logger.debug(f"Header {i}: {str(h)}")
-
-        if self.multiline:
-            progress_bars = [tqdm(total=int(file_size / division),
-                                  leave=False, position=order,
-                                  unit="B", unit_scale=True,
-                                  file=sys.stdout)
-                             for order in range(division)]  # type: List[tqdm]
-            tasks = [self._download_worker(file_path, video_url, header, order, pbar)
-                     for header, order, pbar
-                     in zip(headers, range(division), progress_bars)]
-            progress_bars = await asyncio.gather(*tasks)  # type: List[tqdm]
-            # ネストの「内側」から順に消さないと棒が画面に残る。
-            for pbar in reversed(progress_bars):
-                pbar.close()
+    async def _fetch(self, file_path: Path, video_url: str, file_size: int, position: int=0) -> None:
+        """
+        ファイルを分割してダウンロードする。
+
+        区間は ChunkScheduler が小分けにして配り、手の空いた担当者は遅い担当者の残りを引き受ける。
+        前回の記録が残っていれば、まだ書いていない区間だけを取りに行く。
+        途中で止まった場合には記録を残しておき、次に実行したときに続きから再開する。
+        書き込みながらハッシュをとり、終わったら大きさと一緒に Manifest に記録する。
+
+        :param Path file_path: 保存先
+        :param str video_url: 動画のURL
+        :param int file_size: 全体のファイルサイズ
+        :param int position: プログレスバーを表示する行の始まり
+        :rtype: None
+        """
+        journal = RangeJournal(file_path, file_size)
+        if journal.resumed:
+            self.logger.info(Msg.nd_resume_video.format(
+                path=file_path, done=journal.done_size, size=file_size))
         else:
-            tasks = [self._download_worker(file_path, video_url, header, order)
-                     for header, order
-                     in zip(headers, range(division))]
-            await asyncio.gather(*tasks, self._counter_whole(file_size))
-
-    async def _download_worker(self, file_path: Union[str, Path], video_url: str,
-                               header: dict, order: int, pbar: tqdm=None) -> tqdm:
-        file_path = Path(f"{file_path}.{order:03}")
-        # => video.mp4.000 ～ video.mp4.003 (4分割の場合)
-        with file_path.open("wb") as fd:
-            async with self.session.get(url=video_url, headers=header) as video_data:
-                self.logger.debug(f"Started! Header: {header}, Video URL: {video_url}")
-                while True:
-                    data = await video_data.content.read(self.chunk_size)
+            self._preallocate(file_path, file_size)
+            # 最初から大きさだけはそろっているので、書きかけであることをすぐに残しておく
+            journal.save()
+        max_workers = min(self.connections, self.division * 2)
+        # 区間の切れ目をハッシュのブロックにそろえて、どのブロックも頭から順にハッシュにかけられるようにする
+        hasher = BlockHasher(file_size, block_size=BlockHasher.block_size_for(file_size, max_workers))
+        limiter = utils.Canopy.get_byte_limiter()
+        cap = limiter.cap() if limiter is not None else None
+        scheduler = utils.ChunkScheduler(journal.missing(), workers=self.division,
+                                         max_workers=max_workers, block=hasher.block_size)
+        self.logger.debug(f"Chunk size: {scheduler.chunk_size}, Chunks: {len(scheduler.pending)}")
+
+        # 担当者の番号ごとに保存したファイルサイズを記録する。プログレスバーに利用する。
+        # 番号は使い回すので、番号の上限の数だけあればよい。
+        downloaded_size = [0] * scheduler.max_workers  # type: List[int]
+        progress_bars = {}  # type: Dict[int, tqdm]
+        tasks = []  # type: List[asyncio.Future]
+
+        def spawn():
+            number = scheduler.join()
+            if number is None:
+                return
+            tasks.append(asyncio.ensure_future(self._download_worker(
+                number, scheduler, file_path, video_url, journal,
+                downloaded_size, progress_bars, position, spawn, hasher, cap)))
+
+        for _ in range(scheduler.target):
+            spawn()
+        counter = None
+        if not self.multiline:
+            counter = asyncio.ensure_future(self._counter_whole(scheduler.remaining, downloaded_size))
+        try:
+            while True:
+                running = [task for task in tasks if not task.done()]
+                if not running:
+                    break
+                await asyncio.wait(running)
+            errors = [task.exception() for task in tasks if task.exception()]
+            for error in errors:
+                self.logger.debug(f"Worker failed: {error!r}")
+            if scheduler.remaining:
+                raise errors[0] if errors else aiohttp.ClientPayloadError(file_path)
+            # 全ての区間を書き終え、ファイルが元の大きさのままであることを確かめてから記録を消す
+            missing = journal.missing()
+            actual = Path(file_path).stat().st_size
+            if missing or actual != file_size:
+                raise aiohttp.ClientPayloadError(Err.video_incomplete.format(
+                    file_path, missing, actual, file_size))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            # 次に実行したときに続きから始められるように、記録を残しておく。
+            journal.save()
+            raise
+        finally:
+            if counter:
+                counter.cancel()
+            # ネストの「内側」から順に消さないと棒が画面に残る。
+            for number in sorted(progress_bars, reverse=True):
+                progress_bars[number].close()
+        journal.finish()
+        digest = hasher.hexdigest(file_path)
+        if hasher.reread:
+            self.logger.debug(f"Blocks read again for the digest: {hasher.reread}")
+        Manifest(Path(file_path).parent).record(file_path, file_size, digest, block_size=hasher.block_size)
+        self.logger.info(Msg.nd_download_done.format(path=file_path))
+
+    async def _download_worker(self, number: int, scheduler: utils.ChunkScheduler,
+                               file_path: Union[str, Path], video_url: str, journal: RangeJournal,
+                               downloaded_size: List[int], progress_bars: Dict[int, tqdm],
+                               position: int, spawn: Callable[[], None],
+                               hasher: Optional[BlockHasher]=None,
+                               cap: Optional[utils.TokenBucket]=None) -> None:
+        """
+        受け持ちの区間がなくなるまで、区間をダウンロードしてファイルのその位置に書き込む。
+
+        担当者ごとに別々にファイルを開くので、書き込む位置がぶつかることはない。
+        バッファーを通さずに書くので、記録に残した位置まではファイルに書かれている。
+
+        :param int number: 担当者の番号 (ChunkScheduler.join() が渡したもの)
+        :param utils.ChunkScheduler scheduler: 区間を配る係
+        :param Union[str, Path] file_path: 保存先
+        :param str video_url: 動画のURL
+        :param RangeJournal journal: 書き終えた区間の記録
+        :param List[int] downloaded_size: 担当者ごとの保存したファイルサイズ
+        :param Dict[int, tqdm] progress_bars: 担当者ごとのプログレスバー
+        :param int position: プログレスバーを表示する行の始まり
+        :param Callable[[], None] spawn: 担当者を増やす関数
+        :param Optional[BlockHasher] hasher: 書き込んだデータのハッシュをとる係
+        :param Optional[utils.TokenBucket] cap: この動画を受け取る速さの上限
+        :rtype: None
+        """
+        pbar = progress_bars.get(number)
+        if self.multiline and pbar is None:
+            # 同じ番号の前の担当者の棒があれば、そのまま引き継ぐ
+            pbar = tqdm(leave=False, position=position + number,
+                        unit="B", unit_scale=True, file=sys.stdout)
+            progress_bars[number] = pbar
+        try:
+            with Path(file_path).open("r+b", buffering=0) as fd:
+                while not scheduler.retire(number):
+                    assignment = scheduler.take(number)
+                    if assignment is None:
+                        break
+                    begin = time.monotonic()
+                    start = assignment.position
+                    try:
+                        # 途中で切れても、受け取ったところから先の Range を頼み直す
+                        await self.retry.call(
+                            lambda attempt: self._download_range(fd, video_url, assignment, journal, number,
+                                                                 downloaded_size, pbar, attempt, hasher, cap),
+                            self.logger, Path(file_path).name, progress=lambda: assignment.position)
+                    finally:
+                        grow = scheduler.release(number, assignment.position - start, time.monotonic() - begin)
+                    if grow:
+                        self.logger.debug(f"Workers: {scheduler.target}")
+                        spawn()
+        finally:
+            # 番号を空けて、あとから来る担当者が使えるようにする
+            scheduler.leave(number)
+        self.logger.debug(f"Worker {number}: done!")
+
+    async def _download_range(self, fd: BinaryIO, video_url: str, assignment: utils.Assignment,
+                              journal: RangeJournal, number: int, downloaded_size: List[int],
+                              pbar: tqdm=None, attempt: int=0, hasher: Optional[BlockHasher]=None,
+                              cap: Optional[utils.TokenBucket]=None) -> int:
+        """
+        ひとつの区間をダウンロードして書き込み、書いた大きさを返す。
+
+        途中で区間の後ろ半分を他の担当者に譲った場合は、縮んだ終わりの位置で止める。
+        区間の終わりまで届かずに本文が途切れたときは ClientPayloadError を投げる。
+        受け取る速さに制限があれば、受け取るたびに ByteLimiter で待つ。
+        書いたところまでは記録してあるので、次の試行はその続きから始まる。
+
+        :param BinaryIO fd: 書き込み先のファイル
+        :param str video_url: 動画のURL
+        :param utils.Assignment assignment: 受け持つ区間
+        :param RangeJournal journal: 書き終えた区間の記録
+        :param int number: 何番目の担当者か
+        :param List[int] downloaded_size: 担当者ごとの保存したファイルサイズ
+        :param tqdm pbar: プログレスバー
+        :param int attempt: 何回目のやり直しか
+        :param Optional[BlockHasher] hasher: 書き込んだデータのハッシュをとる係
+        :param Optional[utils.TokenBucket] cap: この動画を受け取る速さの上限
+        :rtype: int
+        """
+        header = {"Range": f"bytes={assignment.position}-{assignment.end}"}
+        written = 0
+        tag = Tracer.tag(Tracer.VIDEO_RANGE, attempt)
+        limiter = utils.Canopy.get_byte_limiter()
+        async with self.connection_semaphore:
+            async with self.session.get(url=video_url, headers=header, trace_request_ctx=tag) as video_data:
+                # 区間ごとに呼ばれるので、出力しないときは文字列も作らない
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug(f"Started! Header: {header}, Video URL: {video_url}")
+                video_data.raise_for_status()
+                if video_data.status != 206 and assignment.position > 0:
+                    raise aiohttp.ClientPayloadError(f"Range is not satisfied: {video_data.status}")
+                fd.seek(assignment.position)
+                while assignment.remaining:
+                    data = await video_data.content.read(min(self.chunk_size, assignment.remaining))
                     if not data:
                         break
-                    downloaded_size = fd.write(data)
-                    self.__downloaded_size[order] += downloaded_size
+                    data = data[:assignment.remaining]
+                    view = memoryview(data)
+                    while view:
+                        view = view[fd.write(view):]
+                    journal.commit(assignment.position, len(data))
+                    if hasher is not None:
+                        hasher.update(assignment.position, data)
+                    tag.received(len(data))
+                    assignment.position += len(data)
+                    written += len(data)
+                    downloaded_size[number] += len(data)
                     if pbar:
-                        pbar.update(downloaded_size)
-        self.logger.debug(f"Order {order}: done!")
-        return pbar
-
-    async def _counter_whole(self, file_size: int, interval: int=1):
+                        pbar.update(len(data))
+                    if limiter is not None:
+                        await limiter.consume(len(data), cap)
+        if written == 0:
+            raise aiohttp.ClientPayloadError(f"Empty response: {header}")
+        if assignment.remaining:
+            raise aiohttp.ClientPayloadError(
+                f"Response ended at {assignment.position}, expected up to {assignment.end}: {header}")
+        return written
+
+    async def _counter_whole(self, file_size: int, downloaded_size: List[int], interval: int=1):
         """
         ダウンロード済みのファイルサイズを総合して一つのプログレスバーに表示する。
 
-        :param int file_size: 全体のファイルサイズ
+        :param int file_size: ダウンロードする大きさ
+        :param List[int] downloaded_size: 担当者ごとの保存したファイルサイズ
         :param int interval: ダウンロード率を更新する間隔
         """
         with tqdm(total=file_size, unit="B") as pbar:
             oldsize = 0
             while True:
-                newsize = sum(self.__downloaded_size)
+                newsize = sum(downloaded_size)
                 if newsize >= file_size:
                     pbar.update(file_size - oldsize)
                     break
@@ -665,25 +1146,75 @@ class VideoSmile:
                 oldsize = newsize
                 await asyncio.sleep(interval)
 
-    def _combiner(self, coroutine: asyncio.Task):
+
+class VideoSmile(VideoBase):
+    def __init__(self,
+                 glossary: Dict[str, Dict[str, Union[str, int, bool, List]]],
+                 common: Dict[str, Union[int, bool, Path, aiohttp.ClientSession,
+                                         asyncio.AbstractEventLoop, utils.NTLogger]]):
         """
-        ダウンロードが終わった後に分割したそれぞれを一つにまとめる関数。
+        Smileサーバーから動画をダウンロードする。
 
-        :param asyncio.Task coroutine: 動画をダウンロードしたタスク
         """
-        if coroutine.done() and not coroutine.cancelled():
-            file_path = utils.make_name(self.glossary, self.save_dir)
-            file_names = [f"{file_path}.{order:03}" for order in range(self.division)]
-            self.logger.debug(f"File names: {file_names}")
-            with file_path.open("wb") as fd:
-                for name in file_names:
-                    with open(name, "rb") as file:
-                        fd.write(file.read())
-                    os.remove(name)
-            self.logger.info(Msg.nd_download_done.format(path=file_path))
+        super().__init__(glossary, common)
+        # (実際のダウンロード前のファイルサイズの確認で)同時にアクセスする最大数
+        self.__parallel_limit = 4
+
+    def callee(self):
+        self.loop.run_until_complete(self.run())
+        return True
+
+    async def run(self):
+        # まず各動画のファイルサイズを集める。
+        await self._push_file_size()
+        await self._broker()
+
+    async def run_one(self, idx: int, video_id: str, number: int=0):
+        semaphore = asyncio.Semaphore(self.__parallel_limit)
+        self.glossary[video_id][KeyDmc.FILE_SIZE] = await self._get_file_size_worker(video_id, semaphore)
+        await self._download(idx, video_id)
+
+    async def _push_file_size(self):
+        video_ids = sorted(self.glossary)
+        semaphore = asyncio.Semaphore(self.__parallel_limit)
+        tasks = [self._get_file_size_worker(video_id, semaphore) for video_id in video_ids]
+        result = await asyncio.gather(*tasks)
+        for _id, size in zip(video_ids, result):
+            self.glossary[_id][KeyDmc.FILE_SIZE] = size
 
+    async def _get_file_size_worker(self, video_id: str, semaphore: asyncio.Semaphore) -> int:
+        vid_url = self.glossary[video_id][KeyDmc.VIDEO_URL_SM]
+        self.logger.debug(f"Video ID: {video_id}, Video URL: {vid_url}")
+
+        async def attempt(number: int) -> int:
+            async with utils.Canopy.get_governor().slot(vid_url, semaphore):
+                async with self.session.head(vid_url,
+                                             trace_request_ctx=Tracer.tag(Tracer.VIDEO_RANGE, number)) as resp:
+                    resp.raise_for_status()
+                    self.logger.debug(f"Headers: {str(resp.headers)}")
+                    return int(resp.headers["content-length"])
+
+        return await self.retry.call(attempt, self.logger, video_id)
+
+    async def _broker(self):
+        tasks = [self._download(idx, video_id) for idx, video_id in enumerate(self.glossary)]
+        await asyncio.gather(*tasks)
 
-class VideoDmc:
+    async def _download(self, idx: int, video_id: str):
+        file_path = utils.make_name(self.glossary[video_id], self.save_dir)
+
+        self.logger.info(Msg.nd_download_video.format(
+            idx + 1, len(self.glossary), video_id, self.glossary[video_id][KeyDmc.TITLE]))
+
+        video_url = self.glossary[video_id][KeyDmc.VIDEO_URL_SM]
+        file_size = self.glossary[video_id][KeyDmc.FILE_SIZE]
+        if self._is_present(file_path, file_size):
+            self.logger.info(Msg.nd_skip_present.format(path=file_path))
+            return
+        await self._fetch(file_path, video_url, file_size)
+
+
+class VideoDmc(VideoBase):
     def __init__(self,
                  glossary: Dict[str, Dict[str, Union[str, int, bool, List]]],
                  common: Dict[str, Union[int, bool, Path, aiohttp.ClientSession,
@@ -691,56 +1222,92 @@ class VideoDmc:
         """
         DMCサーバーから動画をダウンロードする。
         """
-        self.glossary = glossary
-        self.session = common[DataKey.SESSION]
-        self.logger = common[DataKey.LOGGER]
-        self.loop = common[DataKey.LOOP]
-        self.save_dir = common[DataKey.SAVE_DIR]
-        self.chunk_size = common[DataKey.CHUNK_SIZE]
-        self.multiline = common[DataKey.IS_MULTILINE]
-        self.smile = common[DataKey.IS_SMILE]
-        self.division = common[DataKey.DIVISION]
-        self.__downloaded_size = [0] * common[DataKey.DIVISION]  # type: List[int]
+        super().__init__(glossary, common)
 
     def callee(self, xml: bool=True):
-        self.loop.run_until_complete(self._broker(xml))
+        self.loop.run_until_complete(self.run(xml))
         return True
 
+    async def run(self, xml: bool=True):
+        await self._broker(xml)
+
+    async def run_one(self, idx: int, video_id: str, number: int=0, xml: bool=True):
+        await self._negotiate_and_download(idx, video_id, number * self.division, xml)
+
     async def _broker(self, xml: bool=True) -> None:
+        """
+        parallel 本の担当者が、動画を順番待ちの列から一つずつ取り出してダウンロードする。
+
+        動画ごとにセッションを交渉し、それぞれに Heartbeat を送り続ける。
+        """
+        queue = asyncio.Queue()
         for idx, video_id in enumerate(self.glossary):
-            if xml:
-                res_xml = await self._first_nego_xml(video_id)
-                video_url = self._extract_video_url_xml(res_xml)
-                coro_heartbeat = asyncio.ensure_future(self._heartbeat(video_id, res_xml))
-            else:
-                res_json = await self._first_nego_json(video_id)
-                video_url = self._extract_video_url_json(res_json)
-                coro_heartbeat = asyncio.ensure_future(self._heartbeat(video_id, res_json))
+            queue.put_nowait((idx, video_id))
+        workers = min(self.parallel, len(self.glossary))
+        await asyncio.gather(*[self._worker(queue, number, xml) for number in range(workers)])
 
-            self.logger.debug(f"動画URL: {video_url}")
-            coro_download = asyncio.ensure_future(self._download(idx, video_id, video_url))
-            coro_download.add_done_callback(functools.partial(self._canceler, coro_heartbeat))
-            coro_download.add_done_callback(functools.partial(self._combiner, video_id))
-            tasks = [coro_download, coro_heartbeat]
-            await asyncio.gather(*tasks)
+    async def _worker(self, queue: asyncio.Queue, number: int, xml: bool=True) -> None:
+        """
+        順番待ちの列が空になるまで動画をダウンロードする。
+
+        ひとつの動画が失敗しても、残りの動画のダウンロードは続ける。
+
+        :param asyncio.Queue queue: (何番目か, 動画ID) の組の列
+        :param int number: 何番目の担当者か
+        :param bool xml: セッションの交渉にXMLを使うか
+        """
+        while not queue.empty():
+            idx, video_id = queue.get_nowait()
+            try:
+                await self._negotiate_and_download(idx, video_id, number * self.division, xml)
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as error:
+                self.logger.error(Err.video_failed.format(video_id, error))
+
+    async def _negotiate_and_download(self, idx: int, video_id: str, position: int, xml: bool=True) -> None:
+        if xml:
+            res_xml = await self._first_nego_xml(video_id)
+            video_url = self._extract_video_url_xml(res_xml)
+            coro_heartbeat = asyncio.ensure_future(self._heartbeat(video_id, res_xml))
+        else:
+            res_json = await self._first_nego_json(video_id)
+            video_url = self._extract_video_url_json(res_json)
+            coro_heartbeat = asyncio.ensure_future(self._heartbeat(video_id, res_json))
+
+        self.logger.debug(f"動画URL: {video_url}")
+        coro_download = asyncio.ensure_future(self._download(idx, video_id, video_url, position))
+        coro_download.add_done_callback(functools.partial(self._canceler, coro_heartbeat))
+        tasks = [coro_download, coro_heartbeat]
+        await asyncio.gather(*tasks)
 
     async def _first_nego_xml(self, video_id: str) -> str:
         payload = self._make_param_xml(self.glossary[video_id])
-        async with self.session.post(
-                url=self.glossary[video_id][KeyDmc.API_URL],
-                params={"_format": "xml"},
-                data=payload,
-        ) as response:  # type: aiohttp.ClientResponse
-            return await response.text()
+
+        async def attempt(number: int) -> str:
+            async with self.session.post(
+                    url=self.glossary[video_id][KeyDmc.API_URL],
+                    params={"_format": "xml"},
+                    data=payload,
+                    trace_request_ctx=Tracer.tag(Tracer.DMC_NEGOTIATE, number),
+            ) as response:  # type: aiohttp.ClientResponse
+                response.raise_for_status()
+                return await response.text()
+
+        return await self.retry.call(attempt, self.logger, video_id)
 
     async def _first_nego_json(self, video_id: str) -> str:  # pragma: no cover
         payload = self._make_param_json(self.glossary[video_id])
-        async with self.session.post(
-                url=self.glossary[video_id][KeyDmc.API_URL],
-                params={"_format": "json"},
-                data=payload,
-        ) as response:  # type: aiohttp.ClientResponse
-            return await response.text()
+
+        async def attempt(number: int) -> str:
+            async with self.session.post(
+                    url=self.glossary[video_id][KeyDmc.API_URL],
+                    params={"_format": "json"},
+                    data=payload,
+                    trace_request_ctx=Tracer.tag(Tracer.DMC_NEGOTIATE, number),
+            ) as response:  # type: aiohttp.ClientResponse
+                response.raise_for_status()
+                return await response.text()
+
+        return await self.retry.call(attempt, self.logger, video_id)
 
     def _make_param_xml(self, info: Dict) -> str:
         info.update({
@@ -907,75 +1474,45 @@ class VideoDmc:
             companion = self._extract_session_tag(text)  # type: str
             session_id = self._extract_session_id_xml(text)  # type: str
             await asyncio.sleep(waiting)
-            async with self.session.post(
-                    url=api_url + "/" + session_id,
-                    params={"_format": "xml", "_method": "PUT"},
-                    data=companion
-            ) as response:  # type: aiohttp.ClientResponse
-                res_text = await response.text()
+
+            async def attempt(number: int) -> str:
+                async with self.session.post(
+                        url=api_url + "/" + session_id,
+                        params={"_format": "xml", "_method": "PUT"},
+                        data=companion,
+                        trace_request_ctx=Tracer.tag(Tracer.DMC_HEARTBEAT, number),
+                ) as response:  # type: aiohttp.ClientResponse
+                    response.raise_for_status()
+                    return await response.text()
+
+            res_text = await self.retry.call(attempt, self.logger, video_id)
             await self._heartbeat(video_id, res_text)
         except asyncio.CancelledError:
             pass
 
     async def _get_file_size(self, video_id: str, video_url: str) -> int:
         self.logger.debug(f"Video ID: {video_id}, Video URL: {video_url}")
-        async with self.session.head(video_url) as resp:
-            headers = resp.headers
-            self.logger.debug(str(headers))
-            return int(headers["content-length"])
 
-    async def _download(self, idx: int, video_id: str, video_url: str):
-        division = self.division
+        async def attempt(number: int) -> int:
+            async with self.session.head(video_url,
+                                         trace_request_ctx=Tracer.tag(Tracer.VIDEO_RANGE, number)) as resp:
+                resp.raise_for_status()
+                self.logger.debug(str(resp.headers))
+                return int(resp.headers["content-length"])
+
+        return await self.retry.call(attempt, self.logger, video_id)
+
+    async def _download(self, idx: int, video_id: str, video_url: str, position: int=0):
         file_path = utils.make_name(self.glossary[video_id], self.save_dir)
 
         self.logger.info(Msg.nd_download_video.format(
             idx + 1, len(self.glossary), video_id, self.glossary[video_id][KeyDmc.TITLE]))
 
         file_size = await self._get_file_size(video_id, video_url)
-        headers = [{
-            "Range": f"bytes={int(file_size*order/division)}-{int((file_size*(order+1))/division-1)}"
-        } for order in range(division)]
-
-        for o, h in zip(range(division), headers):
-            self.logger.debug(f"Order {o}: {h}")
-
-        if self.multiline:
-            progress_bars = [tqdm(total=int(file_size / division),
-                                  leave=False, position=order,
-                                  unit="B", unit_scale=True,
-                                  file=sys.stdout)
-                             for order in range(division)]  # type: List[tqdm]
-            tasks = [self._download_worker(file_path, video_url, header, order, pbar)
-                     for header, order, pbar
-                     in zip(headers, range(division), progress_bars)]
-            progress_bars = await asyncio.gather(*tasks)  # type: List[tqdm]
-            # ネストの「内側」から順に消さないと棒が画面に残る。
-            for pbar in reversed(progress_bars):
-                pbar.close()
-        else:
-            tasks = [self._download_worker(file_path, video_url, header, order)
-                     for header, order
-                     in zip(headers, range(division))]
-            await asyncio.gather(*tasks, self._counter_whole(file_size))
-
-    async def _download_worker(self, file_path: Union[str, Path], video_url: str,
-                               header: dict, order: int, pbar: tqdm = None) -> tqdm:
-        file_path = Path(f"{file_path}.{order:03}")
-        # => video.mp4.000 ～ video.mp4.003 (4分割の場合)
-        self.logger.debug(file_path)
-        with file_path.open("wb") as fd:
-            async with self.session.get(url=video_url, headers=header) as video_data:
-                self.logger.debug(f"Started! Header: {header}, Video URL: {video_url}")
-                while True:
-                    data = await video_data.content.read(self.chunk_size)
-                    if not data:
-                        break
-                    downloaded_size = fd.write(data)
-                    self.__downloaded_size[order] += downloaded_size
-                    if pbar:
-                        pbar.update(downloaded_size)
-        self.logger.debug(f"Order {order}: done!")
-        return pbar
+        if self._is_present(file_path, file_size):
+            self.logger.info(Msg.nd_skip_present.format(path=file_path))
+            return
+        await self._fetch(file_path, video_url, file_size, position)
 
     def _canceler(self, task_to_cancel: asyncio.Task, _: asyncio.Task) -> bool:
         """
@@ -987,35 +1524,6 @@ class VideoDmc:
         """
         return task_to_cancel.cancel()
 
-    async def _counter_whole(self, file_size: int, interval: int=1):
-        with tqdm(total=file_size, unit="B") as pbar:
-            oldsize = 0
-            while True:
-                newsize = sum(self.__downloaded_size)
-                if newsize >= file_size:
-                    pbar.update(file_size - oldsize)
-                    break
-                pbar.update(newsize - oldsize)
-                oldsize = newsize
-                await asyncio.sleep(interval)
-
-    def _combiner(self, video_id: str, coroutine: asyncio.Task):
-        """
-        ダウンロードが終わった後に分割したそれぞれを一つにまとめる関数。
-
-        :param str video_id:
-        :param asyncio.Task coroutine:
-        """
-        if coroutine.done() and not coroutine.cancelled():
-            file_path = utils.make_name(self.glossary[video_id], self.save_dir)
-            file_names = [f"{file_path}.{order:03}" for order in range(self.division)]
-            with file_path.open("wb") as fd:
-                for name in file_names:
-                    with open(name, "rb") as file:
-                        fd.write(file.read())
-                    os.remove(name)
-            self.logger.info(Msg.nd_download_done.format(path=file_path))
-
 
 class Comment(utils.Canopy):
     def __init__(self,
@@ -1027,6 +1535,9 @@ class Comment(utils.Canopy):
                  density: str="0-99999:9999,1000",
                  limit: int=4,
                  wayback=False,
+                 columnar: bool=False,
+                 incremental: bool=False,
+                 overwrite: bool=False,
                  logger: utils.NTLogger=None,
                  session: aiohttp.ClientSession=None,
                  loop: asyncio.AbstractEventLoop=None,
@@ -1036,57 +1547,103 @@ class Comment(utils.Canopy):
         0-99999:9999,1000: 「0分～99999分までの範囲で
         一分間あたり9999件、直近の1000件を取得する」の意味。
 
+        wayback が真なら、過去ログをさかのぼって最初のコメントまでを取りに行く。
+        過去ログはページごとに ChatStore の形式 (拡張子 .chats) のファイルへ書き足していく。
+
+        columnar が真なら、サーバーの返事をそのまま書き出す代わりに
+        コメントを列ごとにまとめて ChatStore の形式 (拡張子 .chats) で保存する。
+
+        incremental が真なら、保存済みのファイルにある最後のコメント番号より新しいものだけを取りに行き、
+        コメント番号で重複を除いて保存済みのファイルに書き足す。
+        overwrite が偽なら、保存済みのファイルがある動画は incremental と同じように扱う。
+
         :param dict[str, dict[str, int | str]] | list[str] videoids:
         :param mail: メールアドレス
         :param password: パスワード
         :param str | Path save_dir:
         :param logger: ロガー
-        :param session: セッション
+        :param session: セッション。 渡した場合は呼び出し側のものとして扱い、ここでは閉じない。
         :param limit: 同時にアクセスする最大数
         :param bool xml:
         :param str density: ダウンロードするコメントの密度。
         :param wayback: 過去ログを取りに行くかどうか
+        :param bool columnar: 列ごとにまとめた形式で保存するかどうか
+        :param bool incremental: 新しいコメントだけを取りに行くかどうか
+        :param bool overwrite: 保存済みのファイルがあっても、すべてを取りに行って上書きするかどうか
         :param loop: イベントループ
         """
-        super().__init__(loop=loop, logger=logger)
+        super().__init__(loop=loop, logger=logger, limit=limit)
         self.__downloaded_size = None  # type: List[int]
+        self.columnar = columnar
+        self.incremental = incremental
+        self.overwrite = overwrite
+        self.__owns_session = session is None
         self.session = session or self.loop.run_until_complete(self.get_session(mail, password))
-        self.__parallel_limit = limit
-        self.__wayback = wayback
+        self.wayback = wayback
         self.glossary = {}
         self.save_dir = utils.get_dir(save_dir)
+        self.existing = FileIndex(self.save_dir)
         self.xml = xml
         self.density = density
 
         if isinstance(videoids, list):
-            info = Info(utils.validator(videoids), mail=mail, password=password, session=self.session)
+            info = Info(utils.validator(videoids), mail=mail, password=password,
+                        session=self.session, logger=self.logger, loop=self.loop)
             videoids = info.info
-            self.session = info.session
         self.glossary = videoids
 
     async def get_session(self, mail: str, password: str) -> aiohttp.ClientSession:
         cook = utils.LogIn(mail=mail, password=password).cookie
-        return aiohttp.ClientSession(cookies=cook)
+        return aiohttp.ClientSession(cookies=cook, trace_configs=self.trace_configs(Tracer.COMMENT))
 
     def close(self):
         async def _close():
             await self.session.close()
 
-        self.loop.run_until_complete(_close())
+        if self.__owns_session:
+            self.loop.run_until_complete(_close())
 
     def start(self):
         """ ダウンロードを開始する。 """
-        futures = []
-        for idx, video_id in enumerate(self.glossary):
-            coro = self._download(idx, self.glossary[video_id], self.xml, self.density)
-            f = asyncio.ensure_future(coro)
-            f.add_done_callback(functools.partial(self.saver, video_id, self.xml))
-            futures.append(f)
-
-        self.loop.run_until_complete(asyncio.wait(futures, loop=self.loop))
+        self.loop.run_until_complete(self.download())
         self.close()
         return True
 
+    async def download(self) -> bool:
+        """
+        start の中身。 イベントループの中から呼ぶ。
+
+        :rtype: bool
+        """
+        results = await self._broker()
+        for video_id, result in zip(self.glossary, results):
+            if isinstance(result, Exception):
+                self.logger.error(Err.comment_failed.format(video_id, result))
+        return True
+
+    async def _broker(self) -> List:
+        tasks = [self.download_one(video_id, info) for video_id, info in list(self.glossary.items())]
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def download_one(self, video_id: str, info: Dict) -> bool:
+        """
+        動画ひとつ分のコメントをダウンロードして保存する。
+
+        :param str video_id: 動画ID
+        :param Dict info: その動画の情報
+        :rtype: bool
+        """
+        self.glossary[video_id] = info
+        idx = list(self.glossary).index(video_id)
+        if self.wayback:
+            return await self._download_wayback(idx, info, self.xml)
+        elif self.incremental or (not self.overwrite and
+                                  self._comment_path(video_id, self.xml).name in self.existing):
+            return await self._download_incremental(idx, info, self.xml, self.density)
+        else:
+            comment_data = await self._download(idx, info, self.xml, self.density)
+            return self.save(video_id, self.xml, comment_data)
+
     async def _download(self, idx: int, info: dict, is_xml: bool, density: str) -> str:
         video_id        = info[KeyDmc.VIDEO_ID]
         thread_id       = info[KeyDmc.THREAD_ID]
@@ -1107,9 +1664,6 @@ class Comment(utils.Canopy):
         if is_official:
             thread_key, force_184 = await self.get_thread_key(thread_id, needs_key)
 
-        # if self.__wayback:
-        #     waybackkey = await self.get_wayback_key(thread_id)
-
         if is_xml:
             req_param = self.make_param_xml(
                 thread_id, user_id, thread_key, force_184, density=density)
@@ -1122,10 +1676,266 @@ class Comment(utils.Canopy):
 
         return self.postprocesser(is_xml, com_data)
 
+    async def _download_incremental(self, idx: int, info: dict, is_xml: bool, density: str) -> bool:
+        """
+        保存済みのコメントより新しいものだけを取りに行き、保存済みのファイルに書き足す。
+
+        スレッド (と投稿者コメントかどうか) ごとに、保存済みの最後の番号の次から
+        1000件ずつ、返ってくるコメントが1000件に満たなくなるまで取りに行く。
+        保存済みのファイルがなければ、普段通りにすべてを取りに行く。
+
+        :param int idx: 何番目の動画か
+        :param dict info: 動画の情報
+        :param bool is_xml: XML形式で取りに行くかどうか
+        :param str density: ダウンロードするコメントの密度
+        :rtype: bool
+        """
+        video_id = info[KeyDmc.VIDEO_ID]
+        file_path = self._comment_path(video_id, is_xml)
+        last_numbers = self._stored_numbers(file_path, is_xml)
+        if not last_numbers:
+            comment_data = await self._download(idx, info, is_xml, density)
+            return self.save(video_id, is_xml, comment_data)
+
+        self.logger.info(Msg.nd_download_comment.format(
+            idx + 1, len(self.glossary), video_id, info[KeyGTI.TITLE]))
+        thread_key, force_184 = None, None
+        if info[KeyDmc.IS_OFFICIAL]:
+            thread_key, force_184 = await self.get_thread_key(info[KeyDmc.THREAD_ID], info[KeyDmc.NEEDS_KEY])
+
+        # サーバーが一度に返すコメントの数
+        quantity = 1000
+        fetched = []
+        for (thread_id, fork), last_no in sorted(last_numbers.items()):
+            res_from = last_no + 1
+            while True:
+                key = thread_key if thread_id == int(info[KeyDmc.THREAD_ID]) else None
+                if is_xml:
+                    req_param = self.make_param_since_xml(
+                        thread_id, info[KeyDmc.USER_ID], res_from, fork, key, force_184)
+                    com_data = await self.retriever(data=req_param, url=info[KeyDmc.MSG_SERVER])
+                    chats = chats_from_xml(com_data)
+                else:
+                    req_param = self.make_param_since_json(
+                        thread_id, info[KeyDmc.USER_ID], info[KeyDmc.USER_KEY], res_from, fork,
+                        key, force_184)
+                    com_data = await self.retriever(data=json.dumps(req_param), url=URL.URL_Msg_JSON)
+                    chats = chats_from_json(com_data)
+                chats = [chat for chat in chats
+                         if chat[ChatStore.FORK] == fork and chat[ChatStore.NO] >= res_from]
+                fetched.append(com_data)
+                if len(chats) < quantity:
+                    break
+                res_from = max(chat[ChatStore.NO] for chat in chats) + 1
+
+        added = self.merge(file_path, is_xml, fetched)
+        self.logger.info(Msg.nd_comment_incremental.format(video_id, added))
+        self.logger.info(Msg.nd_download_done.format(path=file_path))
+        return True
+
+    async def _download_wayback(self, idx: int, info: dict, is_xml: bool) -> bool:
+        """
+        動画のすべてのスレッドについて、過去ログを最初のコメントまでさかのぼって保存する。
+
+        スレッドごとに並行して取りに行く。 アクセスの頻度は Governor がまとめて制限する。
+
+        :param int idx: 何番目の動画か
+        :param dict info: 動画の情報
+        :param bool is_xml: XML形式で取りに行くかどうか
+        :rtype: bool
+        """
+        video_id = info[KeyDmc.VIDEO_ID]
+        thread_id = int(info[KeyDmc.THREAD_ID])
+        self.logger.info(Msg.nd_download_comment.format(
+            idx + 1, len(self.glossary), video_id, info[KeyGTI.TITLE]))
+        thread_key, force_184 = None, None
+        if info[KeyDmc.IS_OFFICIAL]:
+            thread_key, force_184 = await self.get_thread_key(thread_id, info[KeyDmc.NEEDS_KEY])
+
+        threads = [(thread_id, 0, thread_key), (thread_id, 1, thread_key)]
+        if info.get(KeyDmc.OPT_THREAD_ID):
+            threads.append((int(info[KeyDmc.OPT_THREAD_ID]), 0, None))
+        file_path = utils.make_name(self.glossary[video_id], self.save_dir, extention="chats")
+        store = ChatStore(file_path)
+        # 前に取ったコメントは書き足さないように、保存してあるものを覚えておく
+        known = set()  # type: Set[Tuple[int, int, int]]
+        if file_path.exists() and file_path.stat().st_size > 0:
+            known.update(self._chat_keys(store))
+        counts = await asyncio.gather(*[
+            self._crawl_thread(store, info, thread, fork, key, force_184, is_xml, known)
+            for thread, fork, key in threads])
+        self.logger.info(Msg.nd_comment_wayback.format(video_id, sum(counts)))
+        self.logger.info(Msg.nd_download_done.format(path=file_path))
+        return True
+
+    async def _crawl_thread(self, store: ChatStore, info: dict, thread_id: int, fork: int,
+                            thread_key: Optional[str], force_184: Optional[str], is_xml: bool,
+                            known: Optional[Set[Tuple[int, int, int]]]=None) -> int:
+        """
+        ひとつのスレッドの過去ログを、新しいほうから古いほうへ1000件ずつさかのぼる。
+
+        when には前のページで最も古かったコメントの日時を渡す。
+        取ってきたページはその都度ファイルに書き足すので、メモリーに溜め込むことはない。
+        known にある (スレッドID, fork, コメント番号) のコメントはすでに保存してあるので書き足さない。
+        1番のコメントにたどり着くか、新しいコメントが返ってこなくなったら終わる。
+
+        :param ChatStore store: 保存先
+        :param dict info: 動画の情報
+        :param int thread_id: スレッドID
+        :param int fork: 1 なら投稿者コメント
+        :param Optional[str] thread_key:
+        :param Optional[str] force_184:
+        :param bool is_xml: XML形式で取りに行くかどうか
+        :param Optional[Set[Tuple[int, int, int]]] known: 保存してあるコメント。 書き足したものもここに加える。
+        :return: 書き足したコメントの数
+        :rtype: int
+        """
+        if known is None:
+            known = set()
+        # サーバーが一度に返すコメントの数
+        quantity = 1000
+        waybackkey = await self.get_wayback_key(thread_id)
+        when = int(time.time())
+        oldest = None  # これまでに取った最も古いコメントの番号
+        total = 0
+        while True:
+            if is_xml:
+                req_param = self.make_param_since_xml(
+                    thread_id, info[KeyDmc.USER_ID], -quantity, fork, thread_key, force_184,
+                    when=when, waybackkey=waybackkey)
+                com_data = await self.retriever(data=req_param, url=info[KeyDmc.MSG_SERVER])
+                chats = chats_from_xml(com_data)
+            else:
+                req_param = self.make_param_since_json(
+                    thread_id, info[KeyDmc.USER_ID], info[KeyDmc.USER_KEY], -quantity, fork,
+                    thread_key, force_184, when=when, waybackkey=waybackkey)
+                com_data = await self.retriever(data=json.dumps(req_param), url=URL.URL_Msg_JSON)
+                chats = chats_from_json(com_data)
+            returned = len(chats)
+            chats = [chat for chat in chats if chat[ChatStore.FORK] == fork
+                     and (oldest is None or chat[ChatStore.NO] < oldest)]
+            if not chats:
+                break
+            new = [chat for chat in chats if self._chat_key(chat) not in known]
+            if new:
+                store.append(new)
+                known.update(map(self._chat_key, new))
+            total += len(new)
+            oldest = min(chat[ChatStore.NO] for chat in chats)
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(f"Thread {thread_id} (fork {fork}): {total} comments, oldest No. {oldest}")
+            if oldest <= 1 or returned < quantity:
+                break
+            # 同じ秒に書かれたコメントを取りこぼさないように、1秒だけ重ねる
+            when = min(chat[ChatStore.DATE] for chat in chats) + 1
+        return total
+
+    def _comment_path(self, video_id: str, is_xml: bool) -> Path:
+        if self.columnar:
+            extention = "chats"
+        elif is_xml:
+            extention = "xml"
+        else:
+            extention = "json"
+        return utils.make_name(self.glossary[video_id], self.save_dir, extention=extention)
+
+    def _stored_numbers(self, file_path: Path, is_xml: bool) -> Dict[Tuple[int, int], int]:
+        """
+        保存済みのファイルから、(スレッドID, fork) ごとのコメント番号の最大値を読む。
+
+        ファイルがないか読めなければ、空の辞書を返す。
+
+        :param Path file_path: 保存済みのファイル
+        :param bool is_xml: XML形式かどうか
+        :rtype: Dict[Tuple[int, int], int]
+        """
+        if not file_path.exists():
+            return {}
+        try:
+            if self.columnar:
+                return ChatStore(file_path).last_numbers()
+            text = file_path.read_text(encoding="utf-8")
+            chats = chats_from_xml(text) if is_xml else chats_from_json(text)
+        except (ValueError, SyntaxError, KeyError) as error:
+            self.logger.debug(f"Can't read {file_path}: {error!r}")
+            return {}
+        result = {}
+        for chat in chats:
+            key = (chat[ChatStore.THREAD], chat[ChatStore.FORK])
+            result[key] = max(chat[ChatStore.NO], result.get(key, 0))
+        return result
+
+    def merge(self, file_path: Path, is_xml: bool, responses: List[str]) -> int:
+        """
+        取ってきたコメントを保存済みのファイルに書き足し、書き足した数を返す。
+
+        (スレッドID, fork, コメント番号) が同じコメントは書き足さない。
+
+        :param Path file_path: 保存済みのファイル
+        :param bool is_xml: 受け取ったデータがXML形式かどうか。
+        :param List[str] responses: サーバーからの返事
+        :rtype: int
+        """
+        if self.columnar:
+            store = ChatStore(file_path)
+            known = set(self._chat_keys(store))
+            chats = []
+            for text in responses:
+                for chat in (chats_from_xml(text) if is_xml else chats_from_json(text)):
+                    key = self._chat_key(chat)
+                    if key not in known:
+                        known.add(key)
+                        chats.append(chat)
+            return store.append(chats) if chats else 0
+
+        def chat_key(chat) -> Tuple[int, int, int]:
+            return int(chat.get("thread")), int(chat.get("fork", 0)), int(chat.get("no", 0))
+
+        added = 0
+        if is_xml:
+            root = ElementTree.fromstring(file_path.read_text(encoding="utf-8"))
+            known = {chat_key(chat) for chat in root.iter("chat")}
+            for text in responses:
+                for chat in ElementTree.fromstring(text).iter("chat"):
+                    if chat_key(chat) not in known:
+                        known.add(chat_key(chat))
+                        chat.tail = None
+                        root.append(chat)
+                        added += 1
+            result = ElementTree.tostring(root, encoding="unicode")
+        else:
+            items = json.loads(file_path.read_text(encoding="utf-8"))
+            known = {chat_key(item["chat"]) for item in items if "chat" in item}
+            for text in responses:
+                for item in json.loads(text):
+                    if "chat" in item and chat_key(item["chat"]) not in known:
+                        known.add(chat_key(item["chat"]))
+                        items.append(item)
+                        added += 1
+            result = json.dumps(items, ensure_ascii=False)
+        with file_path.open("w", encoding="utf-8") as f:
+            f.write(self.postprocesser(is_xml, result) + "\n")
+        return added
+
+    @staticmethod
+    def _chat_key(chat: Dict) -> Tuple[int, int, int]:
+        return chat[ChatStore.THREAD], chat[ChatStore.FORK], chat[ChatStore.NO]
+
+    @staticmethod
+    def _chat_keys(store: ChatStore) -> Iterable[Tuple[int, int, int]]:
+        for thread_id, columns in store.blocks():
+            for no, fork in zip(columns[ChatStore.NO], columns[ChatStore.FORK]):
+                yield thread_id, fork, no
+
     async def retriever(self, data: str, url: str) -> str:
-        async with asyncio.Semaphore(self.__parallel_limit):
-            async with self.session.post(url=url, data=data) as resp:  # type: aiohttp.ClientResponse
-                return await resp.text()
+        async def attempt(number: int) -> str:
+            async with self.slot(url):
+                async with self.session.post(url=url, data=data,
+                                             trace_request_ctx=Tracer.tag(Tracer.COMMENT, number)) as resp:  # type: aiohttp.ClientResponse
+                    resp.raise_for_status()
+                    return await resp.text()
+
+        return await self.retry.call(attempt, self.logger, url)
 
     def postprocesser(self, is_xml: bool, result: str):
         """
@@ -1140,19 +1950,33 @@ class Comment(utils.Canopy):
         else:
             return result.replace("}, ", "},\n")
 
-    def saver(self, video_id: str, is_xml: bool, coroutine: asyncio.Task) -> bool:
-        comment_data = coroutine.result()
-        if is_xml:
-            extention = "xml"
-        else:
-            extention = "json"
+    def save(self, video_id: str, is_xml: bool, comment_data: str) -> bool:
+        if self.columnar:
+            return self.saver_columnar(video_id, is_xml, comment_data)
 
-        file_path = utils.make_name(self.glossary[video_id], self.save_dir, extention=extention)
+        file_path = self._comment_path(video_id, is_xml)
         with file_path.open("w", encoding="utf-8") as f:
             f.write(comment_data + "\n")
         self.logger.info(Msg.nd_download_done.format(path=file_path))
         return True
 
+    def saver_columnar(self, video_id: str, is_xml: bool, comment_data: str) -> bool:
+        """
+        コメントを解析して、列ごとにまとめた形式で保存する。
+
+        :param str video_id:
+        :param bool is_xml: 受け取ったデータがXML形式かどうか。
+        :param str comment_data: コメントの文字列
+        :rtype: bool
+        """
+        chats = chats_from_xml(comment_data) if is_xml else chats_from_json(comment_data)
+        file_path = self._comment_path(video_id, is_xml)
+        if file_path.exists():
+            file_path.unlink()
+        ChatStore(file_path).append(chats)
+        self.logger.info(Msg.nd_download_done.format(path=file_path))
+        return True
+
     async def get_thread_key(self, thread_id, needs_key):
         """
         専用のAPIにアクセスして thread_key を取得する。
@@ -1165,8 +1989,15 @@ class Comment(utils.Canopy):
             self.logger.debug(f"needs_key is not 1. Video ID (or Thread ID): {thread_id},"
                               f" needs_key: {needs_key}")
             return "", "0"
-        async with self.session.get(URL.URL_GetThreadKey, params={"thread": thread_id}) as resp:
-            response = await resp.text()
+
+        async def attempt(number: int) -> str:
+            async with self.slot(URL.URL_GetThreadKey):
+                async with self.session.get(URL.URL_GetThreadKey, params={"thread": thread_id},
+                                            trace_request_ctx=Tracer.tag(Tracer.COMMENT, number)) as resp:
+                    resp.raise_for_status()
+                    return await resp.text()
+
+        response = await self.retry.call(attempt, self.logger, thread_id)
         self.logger.debug("Response from GetThreadKey API"
                           f" (thread id is {thread_id}): {response}")
         parameters = parse_qs(response)
@@ -1175,11 +2006,16 @@ class Comment(utils.Canopy):
         return threadkey, force_184
 
     async def get_wayback_key(self, thread_id: int):
-        async with asyncio.Semaphore(self.__parallel_limit):
-            async with self.session.get(URL.URL_WayBackKey, params={"thread", thread_id}) as resp:
-                response = await resp.text()
-                self.logger.debug(f"Waybackkey response: {response}")
-            return parse_qs(response)["waybackkey"][0]
+        async def attempt(number: int) -> str:
+            async with self.slot(URL.URL_WayBackKey):
+                async with self.session.get(URL.URL_WayBackKey, params={"thread": thread_id},
+                                            trace_request_ctx=Tracer.tag(Tracer.COMMENT, number)) as resp:
+                    resp.raise_for_status()
+                    return await resp.text()
+
+        response = await self.retry.call(attempt, self.logger, thread_id)
+        self.logger.debug(f"Waybackkey response: {response}")
+        return parse_qs(response)["waybackkey"][0]
 
     def make_param_xml(self, thread_id, user_id, thread_key=None, force_184=None,
                        waybackkey=None, quantity=1000, density="0-99999:9999,1000"):
@@ -1223,6 +2059,76 @@ class Comment(utils.Canopy):
                 f'{density}</thread_leaves>'
                 f'</packet>')
 
+    def make_param_since_xml(self, thread_id, user_id, res_from, fork=0, thread_key=None, force_184=None,
+                             when=None, waybackkey=None):
+        """
+        res_from 番以降のコメントを取るためのxmlを構成する。
+
+        res_from が負の数なら、最新の(when があればその日時より前の)コメントを
+        その数だけ取りに行く。
+
+        :param int thread_id:
+        :param str user_id:
+        :param int res_from: 取りに行く最初のコメント番号
+        :param int fork: 1 なら投稿者コメント
+        :param str | None thread_key:
+        :param str | None force_184:
+        :param int | None when: 過去ログを取るときの日時(UNIX時間)
+        :param str | None waybackkey: 過去ログを取るときの鍵
+        :rtype: str
+        """
+        key = f' threadkey="{thread_key}" force_184="{force_184}"' if thread_key else ""
+        frk = ' fork="1"' if fork else ""
+        wbk = f' when="{when}" waybackkey="{waybackkey}"' if when else ""
+        return (
+            f'<packet>'
+            f'<thread thread="{thread_id}" user_id="{user_id}" scores="1"{key}{wbk}'
+            f' version="20090904" res_from="{res_from}"{frk}/>'
+            f'</packet>')
+
+    def make_param_since_json(self, thread_id, user_id, user_key, res_from, fork=0,
+                              thread_key=None, force_184=None, when=None, waybackkey=None):
+        """
+        res_from 番以降のコメントを取るためのjsonを構成する。
+
+        res_from が負の数なら、最新の(when があればその日時より前の)コメントを
+        その数だけ取りに行く。
+
+        :param int thread_id:
+        :param str user_id:
+        :param str user_key:
+        :param int res_from: 取りに行く最初のコメント番号
+        :param int fork: 1 なら投稿者コメント
+        :param str | None thread_key:
+        :param str | None force_184:
+        :param int | None when: 過去ログを取るときの日時(UNIX時間)
+        :param str | None waybackkey: 過去ログを取るときの鍵
+        :rtype: list
+        """
+        thread = {
+            "thread"     : thread_id,
+            "version"    : "20090904",
+            "language"   : 0,
+            "user_id"    : user_id,
+            "with_global": 1,
+            "scores"     : 1,
+            "nicoru"     : 0,
+            "res_from"   : res_from,
+        }
+        if fork:
+            thread["fork"] = 1
+        if thread_key:
+            thread.update({"threadkey": thread_key, "force_184": force_184})
+        else:
+            thread["userkey"] = user_key
+        if when:
+            thread.update({"when": when, "waybackkey": waybackkey})
+        return [{"ping": {"content": "rs:0"}},
+                {"ping": {"content": "ps:0"}},
+                {"thread": thread},
+                {"ping": {"content": "pf:0"}},
+                {"ping": {"content": "rf:0"}}]
+
     def make_param_json(self, official_video, user_id, user_key, thread_id,
                         optional_thread_id=None, thread_key=None, force_184=None,
                         density="0-99999:9999,1000"):
@@ -1310,6 +2216,231 @@ class Comment(utils.Canopy):
         return result
 
 
+class Pipeline(utils.Canopy):
+    INFO = "info"
+    THUMBNAIL = "thumbnail"
+    COMMENT = "comment"
+    VIDEO = "video"
+    # 段階ごとの担当者の数
+    WORKERS = {INFO: 4, THUMBNAIL: 4, COMMENT: 4, VIDEO: 3}
+
+    def __init__(self,
+                 mail: Optional[str]=None,
+                 password: Optional[str]=None,
+                 limit: int=100,
+                 limit_per_host: int=20,
+                 dns_ttl: int=300,
+                 keepalive: Union[int, float]=30,
+                 cache: Optional[InfoCache]=None,
+                 parse_workers: int=0,
+                 queue_size: int=8,
+                 workers: Optional[Dict[str, int]]=None,
+                 logger: Optional[utils.NTLogger]=None,
+                 loop: Optional[asyncio.AbstractEventLoop]=None,
+                 ):
+        """
+        情報の取得からサムネイル・コメント・動画のダウンロードまでを、
+        ひとつのセッション(コネクションプール)とひとつのイベントループで行う。
+
+        段階ごとにセッションを作り直さないので、TCP や TLS の接続をそのまま使い回せる。
+        それぞれの動画は 情報 → サムネイル → コメント → 動画 の順に段階を進み、
+        ひとつの段階が終わればすぐに次の段階の列に並ぶ。 他の動画を待つことはない。
+        段階ごとの列には上限があり、後ろの段階が詰まっていれば前の段階も待つ。
+
+        :param Optional[str] mail: メールアドレス
+        :param Optional[str] password: パスワード
+        :param int limit: 全体で同時に張る接続の数の上限
+        :param int limit_per_host: ひとつのホストに同時に張る接続の数の上限
+        :param int dns_ttl: DNS の結果を覚えておく秒数
+        :param Union[int, float] keepalive: 使っていない接続を残しておく秒数
+        :param Optional[InfoCache] cache: 情報を保存しておく場所
+        :param int parse_workers: ページの解析に使うプロセスの数
+        :param int queue_size: 段階ごとの列に並べられる動画の数
+        :param Optional[Dict[str, int]] workers: 段階ごとの担当者の数。 段階の名前をキーにする。
+        :param Optional[utils.NTLogger] logger: ロガー
+        :param Optional[asyncio.AbstractEventLoop] loop: イベントループ
+        """
+        super().__init__(loop=loop, logger=logger)
+        self.__mail = mail
+        self.__password = password
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.keepalive = keepalive
+        self.cache = cache
+        self.parse_workers = parse_workers
+        self.queue_size = queue_size
+        self.workers = dict(self.WORKERS, **(workers or {}))
+        self.metrics = utils.StageMetrics()
+        self.session = None  # type: Optional[aiohttp.ClientSession]
+        self.__is_login = False
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """
+        共有するセッションを返す。 まだなければ作る。
+
+        :rtype: aiohttp.ClientSession
+        """
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host,
+                                             ttl_dns_cache=self.dns_ttl, keepalive_timeout=self.keepalive)
+            self.session = aiohttp.ClientSession(connector=connector, trace_configs=self.trace_configs())
+        return self.session
+
+    def login(self) -> None:
+        """ 共有するセッションにログイン済みのクッキーを入れる。 """
+        if not self.__is_login:
+            cook = utils.LogIn(mail=self.__mail, password=self.__password).cookie
+            self.session.cookie_jar.update_cookies(cook)
+            self.__is_login = True
+
+    def close(self):
+        async def _close():
+            await self.session.close()
+
+        if self.session is not None:
+            self.loop.run_until_complete(_close())
+            self.session = None
+
+    def start(self, video_ids: Union[List[str], Dict[str, Dict]], **stages) -> Dict[str, Dict]:
+        """
+        run を最後まで走らせてからセッションを閉じる。
+
+        :param Union[List[str], Dict[str, Dict]] video_ids: 動画IDのリスト、または動画の情報が入った辞書
+        :param stages: run と同じ
+        :rtype: Dict[str, Dict]
+        """
+        try:
+            return self.loop.run_until_complete(self.run(video_ids, **stages))
+        finally:
+            self.close()
+
+    async def run(self,
+                  video_ids: Union[List[str], Dict[str, Dict]],
+                  thumbnail: Optional[Dict]=None,
+                  comment: Optional[Dict]=None,
+                  video: Optional[Dict]=None,
+                  ) -> Dict[str, Dict]:
+        """
+        動画の情報を集め、頼まれた段階を動画ごとに流れ作業で進める。
+
+        各段階には、Thumbnail や Comment, Video に渡す引数を辞書で指定する。
+        None を渡した段階は行わない。 セッション・ロガー・イベントループは共有のものが使われる。
+        ある動画のある段階が失敗しても、その動画は次の段階へ進む (情報が取れなかった場合を除く)。
+        段階ごとの所要時間は self.metrics に記録される。
+
+        :param Union[List[str], Dict[str, Dict]] video_ids: 動画IDのリスト、または動画の情報が入った辞書
+        :param Optional[Dict] thumbnail: Thumbnail に渡す引数
+        :param Optional[Dict] comment: Comment に渡す引数
+        :param Optional[Dict] video: Video に渡す引数
+        :return: 動画の情報
+        :rtype: Dict[str, Dict]
+        """
+        session = await self.get_session()
+        if comment is not None or video is not None:
+            self.login()
+        known = video_ids if isinstance(video_ids, dict) else {}
+        queue = list(video_ids) if known else utils.validator(video_ids)
+        database = {}  # type: Dict[str, Dict]
+        info = Info([], mail=self.__mail, password=self.__password, cache=self.cache,
+                    stable_only=comment is None and video is None, parse_workers=self.parse_workers,
+                    logged_in=self.__is_login, logger=self.logger, session=session, loop=self.loop)
+
+        async def _info(video_id: str, _, __) -> Optional[Dict]:
+            data = known.get(video_id) or (await info.fetch([video_id])).get(video_id)
+            if data:
+                database[video_id] = data
+            return data
+
+        shared = {"logger": self.logger, "session": session, "loop": self.loop}
+        stages = [(self.INFO, _info)]
+        stage_thumbnail = None
+        if thumbnail is not None:
+            stage_thumbnail = Thumbnail({}, **thumbnail, **shared)
+            stages.append((self.THUMBNAIL, lambda _id, data, _: stage_thumbnail.download_one(_id, data)))
+        if comment is not None:
+            stage_comment = Comment({}, **comment, **shared)
+            stages.append((self.COMMENT, lambda _id, data, _: stage_comment.download_one(_id, data)))
+        if video is not None:
+            stage_video = Video({}, **video, **shared)
+            stages.append((self.VIDEO, stage_video.download_one))
+
+        self.metrics = utils.StageMetrics()
+        self.metrics.start()
+        try:
+            await self._flow(queue, stages)
+        finally:
+            info.close()
+            if stage_thumbnail is not None:
+                # 溜めておいたサムネイルのハッシュの記録を書き出す
+                stage_thumbnail.close()
+            self.metrics.stop()
+        return {_id: database[_id] for _id in queue if _id in database}
+
+    async def _flow(self, video_ids: List[str], stages: List[Tuple[str, Callable]]) -> None:
+        """
+        段階をつないで、動画IDを流す。
+
+        段階ごとに上限つきの列を用意し、前の段階が終えた動画をすぐに次の列へ入れる。
+        列の終わりは、担当者の数だけ None を入れて知らせる。
+
+        :param List[str] video_ids: 動画IDのリスト
+        :param List[Tuple[str, Callable]] stages: (段階の名前, 処理する関数) の組のリスト
+        """
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in stages]
+        counts = [max(1, self.workers.get(name, 1)) for name, _ in stages]
+
+        async def _feed():
+            for video_id in video_ids:
+                await queues[0].put((video_id, None, self.metrics.clock()))
+            for _ in range(counts[0]):
+                await queues[0].put(None)
+
+        async def _stage(index: int):
+            name, handler = stages[index]
+            outbox = queues[index + 1] if index + 1 < len(stages) else None
+            await asyncio.gather(*[self._stage_worker(name, handler, number, queues[index], outbox)
+                                   for number in range(counts[index])])
+            if outbox is not None:
+                for _ in range(counts[index + 1]):
+                    await outbox.put(None)
+
+        await asyncio.gather(_feed(), *[_stage(index) for index in range(len(stages))])
+
+    async def _stage_worker(self, name: str, handler: Callable, number: int,
+                            inbox: asyncio.Queue, outbox: Optional[asyncio.Queue]) -> None:
+        clock = self.metrics.clock
+        while True:
+            item = await inbox.get()
+            if item is None:
+                return
+            video_id, data, queued = item
+            begin = clock()
+            try:
+                result = await handler(video_id, data, number)
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                self.logger.error(Err.stage_failed.format(name, video_id, error))
+                result = None
+            self.metrics.record(name, clock() - begin, begin - queued)
+            # 失敗しても、動画の情報さえあれば次の段階へ進める
+            data = result if isinstance(result, dict) else data
+            if data is None:
+                continue
+            if outbox is None:
+                self.metrics.complete()
+            else:
+                await outbox.put((video_id, data, clock()))
+
+    def report(self) -> None:
+        """ 段階ごとの所要時間と、全体の処理量をログに出す。 """
+        for stage, stat in self.metrics.stats().items():
+            self.logger.info(Msg.nd_stage_stats.format(stage=stage, **stat))
+        self.logger.info(Msg.nd_pipeline_stats.format(
+            completed=self.metrics.completed, elapsed=self.metrics.elapsed, throughput=self.metrics.throughput))
+
+
 def main(args):
     """
     メイン。
@@ -1329,6 +2460,12 @@ def main(args):
         sys.exit(Err.invalid_videoid)
     if not (args.thumbnail or args.comment or args.video):
         sys.exit(Err.not_specified.format("--thumbnail or --comment or --video"))
+    try:
+        bandwidth = utils.parse_size(args.bandwidth) if args.bandwidth else None
+        per_video = utils.parse_size(args.bandwidth_per_video) if args.bandwidth_per_video else None
+        schedule = utils.parse_schedule(args.bandwidth_schedule) if args.bandwidth_schedule else None
+    except ValueError as error:
+        sys.exit(Err.invalid_bandwidth.format(error))
 
     #
     # 本筋
@@ -1336,20 +2473,36 @@ def main(args):
     log_level = "DEBUG" if is_debug else args.loglevel
     logger = utils.NTLogger(log_level=log_level)
     destination = utils.get_dir(args.dest[0])
-
-    database = Info(videoid, mail=mailadrs, password=password, logger=logger).info
-
-    if len(database) == 0:
-        return True
-
-    if args.thumbnail:
-        Thumbnail(videoids=database, save_dir=destination, logger=logger).start()
-
-    if args.comment:
-        Comment(videoids=database, save_dir=destination, xml=args.xml, logger=logger).start()
-
-    if args.video:
-        Video(videoids=database, save_dir=destination,
-              logger=logger, division=args.limit, multiline=args.nomulti, smile=args.smile).start()
-
+    governor = utils.Governor(max_in_flight=args.inflight, rate=args.rate)
+    utils.Canopy.set_governor(governor)
+    utils.Canopy.set_retry_policy(utils.RetryPolicy(retries=max(0, args.retries), deadline=args.deadline))
+    if bandwidth or per_video or schedule or args.bandwidth_file:
+        limiter = utils.ByteLimiter(bandwidth, per_video, schedule, args.bandwidth_file)
+        utils.Canopy.set_byte_limiter(limiter)
+        if hasattr(signal, "SIGUSR1"):
+            # kill -USR1 で、制御ファイルと時間帯をすぐに確かめ直させる
+            signal.signal(signal.SIGUSR1, lambda *_: limiter.reload())
+    tracer = Tracer()
+    utils.Canopy.set_tracer(tracer)
+
+    cache = InfoCache() if args.cache else None
+    pipeline = Pipeline(mail=mailadrs, password=password, cache=cache,
+                        workers={Pipeline.VIDEO: args.parallel}, logger=logger)
+    pipeline.start(
+        videoid,
+        thumbnail={"save_dir": destination, "overwrite": args.overwrite} if args.thumbnail else None,
+        comment={"save_dir": destination, "xml": args.xml, "columnar": args.columnar,
+                 "incremental": args.incremental, "wayback": args.wayback,
+                 "overwrite": args.overwrite} if args.comment else None,
+        video={"save_dir": destination, "division": args.limit, "multiline": args.nomulti,
+               "smile": args.smile, "parallel": args.parallel,
+               "connections": args.connections, "overwrite": args.overwrite} if args.video else None)
+    pipeline.report()
+    tracer.report(logger, args.trace)
+    if cache:
+        logger.info(Msg.nd_cache_stats.format(**cache.stats()))
+        cache.close()
+
+    for host, stat in governor.stats().items():
+        logger.debug(Msg.nd_governor_stats.format(host=host, **stat))
     return True
@@ -5,8 +5,10 @@ import itertools
 import json
 import os
 import sys
+from collections import OrderedDict
 from datetime import datetime, timezone, timedelta
-from typing import Dict, Union, Optional, List
+from pathlib import Path
+from typing import Dict, Union, Optional, List, Tuple
 
 import aiohttp
 from bs4 import BeautifulSoup
@@ -18,10 +20,15 @@ except ImportError:
     PrettyTable = False
 
 from nicotools import utils
+from nicotools.tracer import Tracer
 from nicotools.utils import Msg, Err, URL, KeyGTI, MKey, MylistAPIError
 
 
 class NicoMyList(utils.Canopy):
+    # 一度のリクエストでまとめて操作する動画の数
+    BATCH_SIZE = 100
+    # このエラーが返ってきたら、リクエストの間隔を広げる
+    SLOW_DOWN = (Err.MAXERROR, Err.MAINTENANCE, Err.INTERNAL)
     WHY_DELETED = {
         "0": "公開",
         "1": "削除",
@@ -75,6 +82,12 @@ class NicoMyList(utils.Canopy):
                 mylist MYLIST --purge
             指定した名前のマイリストを削除する(確認なし):
                 mylist MYLIST --purge --yes
+            ファイルに書いた動画IDの通りに MYLIST の中身を揃える:
+                mylist MYLIST --sync C:/Users/Me/Desktop/ids.txt
+            揃えるための計画と APIの呼び出し回数だけを確かめる:
+                mylist MYLIST --sync C:/Users/Me/Desktop/ids.txt --dry-run
+            「マイリスト名<タブ>動画ID」の行で、複数のマイリストをまとめて揃える:
+                mylist * --sync C:/Users/Me/Desktop/lists.tsv
 
         他のコマンド:
             それぞれにはログインに必要な情報を与えられる:
@@ -97,6 +110,9 @@ class NicoMyList(utils.Canopy):
         """
         super().__init__(logger=logger)
         self.token = None  # type: str
+        self.limiter = utils.AdaptiveLimiter()
+        # マイリストのIDごとに、登録されたもの (APIの返事の "mylistitem") を取ってくるタスク
+        self.__contents = {}  # type: Dict[int, asyncio.Future]
         self.session = self.get_session(mail, password)  # type: aiohttp.ClientSession
         self.mylists = self.get_mylists_info()  # type: Dict[int, Dict]
 
@@ -108,7 +124,7 @@ class NicoMyList(utils.Canopy):
         cook = login.cookie
         self.token = login.token
         self.logger.debug(f"cookie (nicoml_async): {id(cook)}")
-        return aiohttp.ClientSession(cookies=cook)
+        return aiohttp.ClientSession(cookies=cook, trace_configs=self.trace_configs(Tracer.MYLIST))
 
     def close(self):
         async def _close():
@@ -145,7 +161,7 @@ class NicoMyList(utils.Canopy):
                 print(Msg.ml_answer_invalid)
                 continue
 
-    def _should_continue(self, res, **kwargs):
+    async def _should_continue(self, res, **kwargs):
         """
         次の項目に進んでよいかを判断する。
 
@@ -181,7 +197,7 @@ class NicoMyList(utils.Canopy):
                 self.logger.error(msg)
                 raise MylistAPIError(code=Err.MAXERROR, msg=msg)
             elif code == Err.EXIST:
-                title = self.get_title(video_id)
+                title = await self.get_title(video_id)
                 msg = Err.already_exist.format(video_id, title)
                 self.logger.error(msg)
                 raise MylistAPIError(code=Err.EXIST, msg=msg, ok=True)
@@ -219,8 +235,7 @@ class NicoMyList(utils.Canopy):
 
         :rtype: dict[int, dict[str, int | str | bool]]
         """
-        async with self.session.get(URL.URL_ListAll) as resp:  # type: aiohttp.ClientResponse
-            jtext = json.loads(await resp.text())
+        jtext = json.loads(await self._get_text(URL.URL_ListAll))
 
         candidate = {}
 
@@ -347,16 +362,8 @@ class NicoMyList(utils.Canopy):
             whole = False
         self.logger.debug(f"Is in whole mode?: {whole}")
 
-        if list_id == utils.DEFAULT_ID:
-            async with self.session.get(URL.URL_ListDef) as resp:
-                jtext = json.loads(await resp.text())
-        else:
-            async with self.session.get(URL.URL_ListOne, params={"group_id": list_id}) as resp:
-                jtext = json.loads(await resp.text())
-        self.logger.debug(f"Response: {jtext}")
-
         results = {}
-        for item in jtext["mylistitem"]:
+        for item in await self._get_contents(list_id):
             data = item["item_data"]
             # 0以外のは削除されているか非公開
             if not whole:
@@ -368,6 +375,61 @@ class NicoMyList(utils.Canopy):
                 results.update({data["video_id"]: item["item_id"]})
         return results
 
+    async def _get_contents(self, list_id: int) -> List[Dict]:
+        """
+        そのマイリストに登録されたものを返す。
+
+        一度取ってきたものは、自分でそのマイリストを変えるまで使い回すので、
+        ひとつのコマンドの中では、同じマイリストは一度しか取りに行かない。
+
+        :param int list_id: マイリストのID
+        :return: APIの返事の "mylistitem" の中身
+        :rtype: List[Dict]
+        """
+        task = self.__contents.get(list_id)
+        if task is None:
+            task = self.__contents[list_id] = asyncio.ensure_future(self._fetch_contents(list_id))
+        try:
+            return await task
+        except Exception:
+            # 失敗したものは覚えておかない
+            if self.__contents.get(list_id) is task:
+                del self.__contents[list_id]
+            raise
+
+    async def _fetch_contents(self, list_id: int) -> List[Dict]:
+        if list_id == utils.DEFAULT_ID:
+            jtext = json.loads(await self._get_text(URL.URL_ListDef))
+        else:
+            jtext = json.loads(await self._get_text(URL.URL_ListOne, params={"group_id": list_id}))
+        self.logger.debug(f"Response: {jtext}")
+        return jtext["mylistitem"]
+
+    def _invalidate(self, *list_ids: int) -> None:
+        """
+        変えたマイリストの中身を忘れて、次に使うときに取り直すようにする。
+
+        :param int list_ids: マイリストのID
+        """
+        for list_id in list_ids:
+            self.__contents.pop(list_id, None)
+
+    async def _get_text(self, url: str, params: Optional[Dict]=None) -> str:
+        """
+        GET したものを文字列で返す。 通信が途切れたときや混雑しているときはやり直す。
+
+        :param str url: URL
+        :param Optional[Dict] params: クエリー
+        :rtype: str
+        """
+        async def attempt(number: int) -> str:
+            async with self.session.get(url, params=params,
+                                        trace_request_ctx=Tracer.tag(Tracer.MYLIST, number)) as resp:
+                resp.raise_for_status()
+                return await resp.text()
+
+        return await self.retry.call(attempt, self.logger, url)
+
     async def get_title(self, video_id):
         """
         getthumbinfo APIから、タイトルをもらってくる
@@ -375,8 +437,7 @@ class NicoMyList(utils.Canopy):
         :param str video_id: 動画ID
         :rtype:str
         """
-        async with self.session.get(URL.URL_Info + video_id) as resp:
-            soup = BeautifulSoup(await resp.text(), "html.parser")
+        soup = BeautifulSoup(await self._get_text(URL.URL_Info + video_id), "html.parser")
         # 「status="ok"」 なら動画は生存 / 存在しない動画には「status="fail"」が返る
         if not soup.nicovideo_thumb_response["status"].lower() == "ok":
             self.logger.error(Msg.nd_deleted_or_private.format(video_id))
@@ -499,9 +560,16 @@ class NicoMyList(utils.Canopy):
 
         self.logger.debug(f"URL: {url}")
         self.logger.debug(f"Query to post: {payload}")
-        async with self.session.get(url, params=payload) as resp:
-            res = json.loads(await resp.text())
+        res = json.loads(await self._get_text(url, params=payload))
         self.logger.debug(f"Response: {res}")
+
+        if res.get("status") == "ok":
+            # 変わったマイリストだけを取り直す
+            target = utils.DEFAULT_ID if to_def else list_id_to
+            source = utils.DEFAULT_ID if from_def else list_id_from
+            touched = {"add": [target], "copy": [target], "move": [source, target],
+                       "delete": [source], "purge": [list_id]}.get(mode, [])
+            self._invalidate(*[_id for _id in touched if _id is not None])
         return res
 
     def create_mylist(self, mylist_name, is_public=False, description=""):
@@ -582,6 +650,7 @@ class NicoMyList(utils.Canopy):
         :param str videoids: 追加する動画ID
         :param bool onetime: 全ての動画を一度に処理するかどうか。
                              する場合、結果は、全て成功または全て失敗かのどちらか。
+                             しない場合は一件ずつ処理する。
         :rtype: bool
         """
         if utils.ALL_ITEM == list_id or utils.ALL_ITEM in videoids:
@@ -616,27 +685,9 @@ class NicoMyList(utils.Canopy):
         self.logger.info(Msg.ml_will_add.format(list_name, list(videoids)))
         to_def = (list_id == utils.DEFAULT_ID)
 
-        _done = []
-        for _counter, vd_id in enumerate(videoids):
-            _counter += 1
-            res = await self.get_response("add", to_def=to_def, list_id_to=list_id, video_id=vd_id)
-
-            try:
-                self._should_continue(res, video_id=vd_id, list_name=list_name,
-                                      count_now=_counter, count_whole=len(videoids))
-                self.logger.info(Msg.ml_done_add.format(
-                    now=_counter, all=len(videoids), video_id=vd_id))
-                _done.append(vd_id)
-                await asyncio.sleep(0.5)
-            except MylistAPIError as error:
-                if error.ok:
-                    return True
-                else:
-                    # エラーが起きた場合
-                    self.logger.error(Err.remaining.format(
-                        [i for i in videoids if i not in _done and i != utils.ALL_ITEM]))
-                    raise
-        return True
+        return await self._batch(
+            "add", [(vd_id, None) for vd_id in videoids], list_name, Msg.ml_done_add,
+            to_def=to_def, list_id_to=list_id)
 
     def copy(self, list_id_from, list_id_to, *videoids, onetime=True):
         """
@@ -647,6 +698,9 @@ class NicoMyList(utils.Canopy):
         :param str videoids: 動画ID
         :param bool onetime: 全ての動画を一度に処理するかどうか。
                              する場合、結果は、全て成功または全て失敗かのどちらか。
+                             しない場合は BATCH_SIZE 件ずつまとめて処理し、
+                             失敗したまとまりだけを一件ずつ処理し直す。
+                             とりあえずマイリストへは一件ずつ処理する。
         :rtype: bool
         """
         if len(videoids) > 1 and utils.ALL_ITEM in videoids:
@@ -717,27 +771,9 @@ class NicoMyList(utils.Canopy):
         self.logger.info(Msg.ml_will_copy.format(
             list_name_from, list_name_to, sorted(item_ids.keys())))
 
-        _done = []
-        for _counter, vd_id in enumerate(item_ids):
-            _counter += 1
-            res = await self.get_response("copy", item_id=item_ids[vd_id], video_id=vd_id,
-                                    to_def=to_def, from_def=from_def,
-                                    list_id_to=list_id_to, list_id_from=list_id_from)
-            try:
-                self._should_continue(res, video_id=vd_id, list_name=list_name_to,
-                                      count_now=_counter, count_whole=len(item_ids))
-                self.logger.info(Msg.ml_done_copy.format(
-                    now=_counter, all=len(item_ids), video_id=vd_id))
-                _done.append(vd_id)
-            except MylistAPIError as error:
-                if error.ok:
-                    return True
-                else:
-                    # エラーが起きた場合
-                    self.logger.error(Err.remaining.format(
-                        [i for i in videoids if i not in _done and i != utils.ALL_ITEM]))
-                    raise
-        return True
+        return await self._batch(
+            "copy", list(item_ids.items()), list_name_to, Msg.ml_done_copy,
+            to_def=to_def, from_def=from_def, list_id_to=list_id_to, list_id_from=list_id_from)
 
     def move(self, list_id_from, list_id_to, *videoids, onetime=True):
         """
@@ -748,6 +784,9 @@ class NicoMyList(utils.Canopy):
         :param str videoids: 動画ID
         :param bool onetime: 全ての動画を一度に処理するかどうか。
                              する場合、結果は、全て成功または全て失敗かのどちらか。
+                             しない場合は BATCH_SIZE 件ずつまとめて処理し、
+                             失敗したまとまりだけを一件ずつ処理し直す。
+                             とりあえずマイリストへは一件ずつ処理する。
         :rtype: bool
         """
         if len(videoids) > 1 and utils.ALL_ITEM in videoids:
@@ -829,45 +868,9 @@ class NicoMyList(utils.Canopy):
         self.logger.info(Msg.ml_will_move.format(
             list_name_from, list_name_to, sorted(item_ids.keys())))
 
-        _done = []
-        for _counter, vd_id in enumerate(item_ids):
-            _counter += 1
-            if to_def:
-                # とりあえずマイリストには直接移動できないので、追加と削除を別でやる。
-                res = await self.get_response("add", to_def=True,
-                                        video_id=vd_id, item_id=item_ids[vd_id])
-                try:
-                    self._should_continue(res, video_id=vd_id, list_name=list_name_to,
-                                          count_now=_counter, count_whole=len(item_ids))
-                except MylistAPIError as error:
-                    if error.ok:
-                        return True
-                    else:
-                        # エラーが起きた場合
-                        self.logger.error(Err.remaining.format(
-                            [i for i in videoids if i not in _done and i != utils.ALL_ITEM]))
-                        raise
-                res = await self.get_response("delete", from_def=True,
-                                        video_id=vd_id, item_id=item_ids[vd_id])
-            else:
-                res = await self.get_response("move", item_id=item_ids[vd_id], from_def=from_def,
-                                        list_id_to=list_id_to, list_id_from=list_id_from)
-
-            try:
-                self._should_continue(res, video_id=vd_id, list_name=list_name_to,
-                                      count_now=_counter, count_whole=len(item_ids))
-                self.logger.info(Msg.ml_done_move.format(
-                    now=_counter, all=len(item_ids), video_id=vd_id))
-                _done.append(vd_id)
-            except MylistAPIError as error:
-                if error.ok:
-                    return True
-                else:
-                    # エラーが起きた場合
-                    self.logger.error(Err.remaining.format(
-                        [i for i in videoids if i not in _done and i != utils.ALL_ITEM]))
-                    raise
-        return True
+        return await self._batch(
+            "move", list(item_ids.items()), list_name_to, Msg.ml_done_move,
+            to_def=to_def, from_def=from_def, list_id_to=list_id_to, list_id_from=list_id_from)
 
     def delete(self, list_id, *videoids, confident=False, onetime=True):
         """
@@ -878,6 +881,8 @@ class NicoMyList(utils.Canopy):
         :param bool confident:
         :param bool onetime: 全ての動画を一度に処理するかどうか。
                              する場合、結果は、全て成功または全て失敗かのどちらか。
+                             しない場合は BATCH_SIZE 件ずつまとめて処理し、
+                             失敗したまとまりだけを一件ずつ処理し直す。
         :rtype: bool
         """
         if len(videoids) > 1 and utils.ALL_ITEM in videoids:
@@ -956,28 +961,213 @@ class NicoMyList(utils.Canopy):
             if len(excluded) > 0:
                 self.logger.error(Err.item_not_contained.format(list_name, excluded))
 
-        _done = []
-        for _counter, vd_id in enumerate(item_ids):
-            _counter += 1
-            res = await self.get_response("delete", from_def=from_def,
-                                    list_id_from=list_id, item_id=item_ids[vd_id])
-
-            try:
-                self._should_continue(res, video_id=vd_id, list_name=list_name,
-                                      count_now=_counter, count_whole=len(item_ids))
-                self.logger.info(Msg.ml_done_delete.format(
-                    now=_counter, all=len(item_ids), video_id=vd_id))
-                _done.append(vd_id)
-            except MylistAPIError as error:
-                if error.ok:
-                    return True
-                else:
-                    # エラーが起きた場合
-                    self.logger.error(Err.remaining.format(
-                        [i for i in videoids if i not in _done and i != utils.ALL_ITEM]))
-                    raise
+        return await self._batch(
+            "delete", list(item_ids.items()), list_name, Msg.ml_done_delete,
+            from_def=from_def, list_id_from=list_id)
+
+    async def _batch(self, mode: str, pairs: List[Tuple[str, Optional[str]]], list_name: str,
+                     message: str, **kwargs) -> bool:
+        """
+        動画を BATCH_SIZE 件ずつまとめて API に渡す。
+
+        まとめて渡して失敗したときだけ、そのまとまりを一件ずつ渡し直して、
+        どの動画で失敗したのかを突き止める。 結果の表示は一件ずつ行う。
+        まとめて渡すのは id_list[0][] に item ID を並べる操作だけで、
+        追加の API を使うものは一件ずつ渡す。
+        差し支えないエラー (すでに登録されている、など) が返ってきたら、そこで終える。
+        混雑や上限を示すエラーが返ってきたときは、リクエストの間隔を広げる。
+
+        :param str mode: "add", "delete", "copy", "move" のいずれか
+        :param List[Tuple[str, Optional[str]]] pairs: (動画ID, item ID) の組のリスト。 追加のときの item ID は None。
+        :param str list_name: 結果の表示に使うマイリスト名
+        :param str message: 一件ごとに表示する、成功したときの文言
+        :param kwargs: get_response に渡す、その他の引数
+        :rtype: bool
+        """
+        total = len(pairs)
+        done = []  # type: List[str]
+        size = self._batch_size(mode, kwargs.get("to_def", False))
+
+        for position in range(0, total, size):
+            chunk = pairs[position:position + size]
+            if len(chunk) > 1:
+                res = await self._send(mode, chunk, **kwargs)
+                if res["status"] == "ok":
+                    for vd_id, _ in chunk:
+                        done.append(vd_id)
+                        self.logger.info(message.format(now=len(done), all=total, video_id=vd_id))
+                    continue
+                self.logger.debug(f"Batch failed. Retrying one by one: {res}")
+
+            for vd_id, item_id in chunk:
+                res = await self._send(mode, [(vd_id, item_id)], **kwargs)
+                try:
+                    await self._should_continue(res, video_id=vd_id, list_name=list_name,
+                                                count_now=len(done) + 1, count_whole=total)
+                    done.append(vd_id)
+                    self.logger.info(message.format(now=len(done), all=total, video_id=vd_id))
+                except MylistAPIError as error:
+                    if error.ok:
+                        return True
+                    else:
+                        # エラーが起きた場合
+                        finished = set(done)
+                        self.logger.error(Err.remaining.format(
+                            [_id for _id, _ in pairs if _id not in finished and _id != utils.ALL_ITEM]))
+                        raise
+        return True
+
+    @classmethod
+    def _batch_size(cls, mode: str, to_def: bool=False) -> int:
+        """
+        一度のリクエストでまとめて操作する動画の数を返す。
+
+        削除・コピー・移動の API は id_list[0][] に item ID をいくつも並べて受け取る。
+        追加の API (URL_AddItem, URL_AddDef) は item_id を一つずつ渡すので、
+        追加と、追加を使うとりあえずマイリストへのコピー・移動は一件ずつ行う。
+
+        :param str mode: "add", "delete", "copy", "move" のいずれか
+        :param bool to_def: とりあえずマイリストへの操作かどうか
+        :rtype: int
+        """
+        if mode == "add" or to_def:
+            return 1
+        return cls.BATCH_SIZE
+
+    async def _send(self, mode: str, chunk: List[Tuple[str, Optional[str]]], **kwargs) -> Dict:
+        """
+        _batch から、まとまりひとつ分のリクエストを送る。
+
+        :param str mode: "add", "delete", "copy", "move" のいずれか
+        :param List[Tuple[str, Optional[str]]] chunk: (動画ID, item ID) の組のリスト
+        :rtype: Dict
+        """
+        video_ids = [vd_id for vd_id, _ in chunk]
+        item_ids = [item_id for _, item_id in chunk if item_id is not None]
+        await self.limiter.wait()
+        if mode == "move" and kwargs.get("to_def"):
+            # とりあえずマイリストには直接移動できないので、追加できたときだけ移動元から削除する。
+            res = await self.get_response("add", to_def=True, video_id=video_ids)
+            if res["status"] == "ok":
+                res = await self.get_response("delete", from_def=kwargs.get("from_def"),
+                                              list_id_from=kwargs.get("list_id_from"), item_id=item_ids)
+        else:
+            res = await self.get_response(mode, video_id=video_ids, item_id=item_ids or None, **kwargs)
+
+        if res["status"] == "ok":
+            self.limiter.relax()
+        elif res.get("error", {}).get("code") in self.SLOW_DOWN:
+            self.limiter.back_off()
+        return res
+
+    def sync(self, list_id, desired_ids, dry_run=False, file_name=None, confident=False):
+        """
+        そのマイリストの中身を、指定した動画IDの通りにする。
+
+        今の中身を一度だけ取ってきて、足りないものを追加し、余分なものを削除する。
+        削除と移動は BATCH_SIZE 件ずつまとめて、追加は一件ずつ行う。
+
+        :param int | str list_id: マイリストの名前またはID
+        :param Iterable[str] desired_ids: そのマイリストに登録されているべき動画ID
+        :param bool dry_run: Trueで、実行せずに計画と APIの呼び出し回数の見積もりだけを出力する。
+        :param str | Path | None file_name: dry_run のときに計画を書き出すファイル名
+        :param bool confident: Trueで、削除するものがあっても確認しない。
+        :rtype: bool
+        """
+        return self.sync_many({list_id: desired_ids}, dry_run, file_name, confident)
+
+    def sync_many(self, desired, dry_run=False, file_name=None, confident=False):
+        """
+        複数のマイリストの中身を、それぞれ指定した動画IDの通りにする。
+
+        あるマイリストから外れる動画が別のマイリストに入るときは、
+        削除と追加の代わりに、マイリスト間の移動で済ませる。
+
+        :param dict[int | str, Iterable[str]] desired: {マイリストの名前またはID: 動画IDのリスト}
+        :param bool dry_run: Trueで、実行せずに計画と APIの呼び出し回数の見積もりだけを出力する。
+        :param str | Path | None file_name: dry_run のときに計画を書き出すファイル名
+        :param bool confident: Trueで、削除するものがあっても確認しない。
+        :rtype: bool
+        """
+        return self.loop.run_until_complete(self._sync(desired, dry_run, file_name, confident))
+
+    async def _sync(self, desired, dry_run=False, file_name=None, confident=False):
+        plan = await self.plan_sync(desired)
+        text = plan.describe(self.BATCH_SIZE)
+        if dry_run:
+            return self._writer(text, file_name)
+        if plan.is_empty:
+            self.logger.info(Msg.ml_sync_nothing)
+            return True
+        if plan.deletes and not confident and not self._confirmation(
+                "delete", ", ".join(plan.names[_id] for _id in plan.deletes),
+                [vd_id for pairs in plan.deletes.values() for vd_id, _ in pairs]):
+            print(Msg.ml_answer_no)
+            return False
+        self.logger.info(text)
+
+        # 先に削除して空きを作ってから、移動と追加をする
+        for list_id, pairs in plan.deletes.items():
+            await self._batch("delete", pairs, plan.names[list_id], Msg.ml_done_delete,
+                              from_def=(list_id == utils.DEFAULT_ID), list_id_from=list_id)
+        for (source, target), pairs in plan.moves.items():
+            await self._batch("move", pairs, plan.names[target], Msg.ml_done_move,
+                              to_def=(target == utils.DEFAULT_ID), from_def=(source == utils.DEFAULT_ID),
+                              list_id_to=target, list_id_from=source)
+        for list_id, videoids in plan.adds.items():
+            await self._batch("add", [(vd_id, None) for vd_id in videoids], plan.names[list_id],
+                              Msg.ml_done_add, to_def=(list_id == utils.DEFAULT_ID), list_id_to=list_id)
         return True
 
+    async def plan_sync(self, desired):
+        """
+        マイリストを望みの中身にするための、変更の計画を立てる。
+
+        それぞれのマイリストの中身は一度ずつしか取りに行かず、
+        差分は集合で求めるので、数万件のマイリストでも件数に比例した時間で済む。
+
+        :param dict[int | str, Iterable[str]] desired: {マイリストの名前またはID: 動画IDのリスト}
+        :rtype: SyncPlan
+        """
+        wanted = OrderedDict()  # type: Dict[int, OrderedDict]
+        names = {}  # type: Dict[int, str]
+        for search_for, videoids in desired.items():
+            list_id, list_name = self._get_list_id(search_for)
+            names[list_id] = list_name
+            # 順番を保ったまま、重複を除く
+            wanted.setdefault(list_id, OrderedDict()).update((vd_id, None) for vd_id in videoids)
+
+        contents = await asyncio.gather(*[self._get_contents(list_id) for list_id in wanted])
+        current = {list_id: {item["item_data"]["video_id"]: item["item_id"] for item in items}
+                   for list_id, items in zip(wanted, contents)}
+
+        plan = SyncPlan(names)
+        # どこかのマイリストから外れる動画: {動画ID: [(マイリストID, item ID), ...]}
+        leaving = OrderedDict()  # type: Dict[str, List[Tuple[int, str]]]
+        for list_id, videoids in wanted.items():
+            plan.kept[list_id] = sum(1 for vd_id in videoids if vd_id in current[list_id])
+            for vd_id, item_id in current[list_id].items():
+                if vd_id not in videoids:
+                    leaving.setdefault(vd_id, []).append((list_id, item_id))
+
+        for list_id, videoids in wanted.items():
+            for vd_id in videoids:
+                if vd_id in current[list_id]:
+                    continue
+                donors = leaving.get(vd_id)
+                if donors:
+                    source, item_id = donors.pop(0)
+                    if not donors:
+                        del leaving[vd_id]
+                    plan.moves.setdefault((source, list_id), []).append((vd_id, item_id))
+                else:
+                    plan.adds.setdefault(list_id, []).append(vd_id)
+
+        for vd_id, donors in leaving.items():
+            for list_id, item_id in donors:
+                plan.deletes.setdefault(list_id, []).append((vd_id, item_id))
+        return plan
+
     async def fetch_meta(self, with_header=True):
         """
         マイリストのメタ情報を表示する。
@@ -1002,17 +1192,14 @@ class NicoMyList(utils.Canopy):
         return container
 
     async def _fetch_meta_worker_def(self):
-        async with self.session.get(URL.URL_ListDef) as resp:
-            counts = json.loads(await resp.text())["mylistitem"]
+        counts = len(await self._get_contents(utils.DEFAULT_ID))
         container = [
             utils.DEFAULT_ID, utils.DEFAULT_NAME, counts, "非公開", "--", ""
         ]
         return container
 
     async def _fetch_meta_worker(self, item: dict):
-        async with self.session.get(URL.URL_ListOne, params={"group_id": item["id"]}) as resp:
-            response = json.loads(await resp.text())
-        counts = len(response["mylistitem"])
+        counts = len(await self._get_contents(item[MKey.ID]))
 
         container = [
             item[MKey.ID], item[MKey.NAME], counts, item[MKey.PUBLICITY],
@@ -1037,13 +1224,7 @@ class NicoMyList(utils.Canopy):
         list_id, list_name = self._get_list_id(list_id)
 
         self.logger.info(Msg.ml_showing_mylist.format(list_name))
-        if list_id == utils.DEFAULT_ID:
-            async with self.session.get(URL.URL_ListDef) as resp:
-                jtext = json.loads(await resp.text())
-        else:
-            async with self.session.get(URL.URL_ListOne, params={"group_id": list_id}) as resp:
-                jtext = json.loads(await resp.text())
-        self.logger.debug(f"Returned: {jtext}")
+        contents = await self._get_contents(list_id)
 
         if with_header:
             container = [[
@@ -1057,7 +1238,7 @@ class NicoMyList(utils.Canopy):
         else:
             container = []
 
-        for item in jtext["mylistitem"]:
+        for item in contents:
             data = item[MKey.ITEM_DATA]
             desc = html.unescape(item[MKey.DESCRIPTION])
             duration = int(data[KeyGTI.LENGTH_SECONDS])
@@ -1258,6 +1439,113 @@ class NicoMyList(utils.Canopy):
         return True
 
 
+class SyncPlan:
+    def __init__(self, names: Dict[int, str]):
+        """
+        マイリストを望みの中身にするための、変更の計画。
+
+        * deletes: {マイリストID: [(動画ID, item ID), ...]}
+        * moves: {(移動元のID, 移動先のID): [(動画ID, item ID), ...]}
+        * adds: {マイリストID: [動画ID, ...]}
+        * kept: {マイリストID: そのまま残る件数}
+
+        :param Dict[int, str] names: 扱うマイリストのIDと名前
+        """
+        self.names = names
+        self.deletes = OrderedDict()  # type: Dict[int, List[Tuple[str, str]]]
+        self.moves = OrderedDict()  # type: Dict[Tuple[int, int], List[Tuple[str, str]]]
+        self.adds = OrderedDict()  # type: Dict[int, List[str]]
+        self.kept = OrderedDict()  # type: Dict[int, int]
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.deletes or self.moves or self.adds)
+
+    def calls(self, batch_size: int) -> Tuple[int, int]:
+        """
+        APIを呼び出す回数を見積もる。 まとめて渡して失敗したときの、一件ずつのやり直しは含まない。
+
+        :param int batch_size: 一度のリクエストでまとめて操作する動画の数
+        :return: (中身を取ってくる回数, 変更する回数)
+        :rtype: Tuple[int, int]
+        """
+        def chunks(count):
+            return -(-count // batch_size)
+
+        mutate = sum(chunks(len(pairs)) for pairs in self.deletes.values())
+        # 追加は一件ずつ行う
+        mutate += sum(len(videoids) for videoids in self.adds.values())
+        for (_, target), pairs in self.moves.items():
+            if target == utils.DEFAULT_ID:
+                # とりあえずマイリストへの移動は、一件ごとに追加と削除の二回になる
+                mutate += len(pairs) * 2
+            else:
+                mutate += chunks(len(pairs))
+        return len(self.names), mutate
+
+    def describe(self, batch_size: int) -> str:
+        """
+        計画と、APIの呼び出し回数の見積もりを文章にする。
+
+        :param int batch_size: 一度のリクエストでまとめて操作する動画の数
+        :rtype: str
+        """
+        lines = [Msg.ml_sync_kept.format(self.names[list_id], count) for list_id, count in self.kept.items()]
+        for list_id, pairs in self.deletes.items():
+            lines.append(Msg.ml_will_delete.format(self.names[list_id], [vd_id for vd_id, _ in pairs]))
+        for (source, target), pairs in self.moves.items():
+            lines.append(Msg.ml_will_move.format(
+                self.names[source], self.names[target], [vd_id for vd_id, _ in pairs]))
+        for list_id, videoids in self.adds.items():
+            lines.append(Msg.ml_will_add.format(self.names[list_id], videoids))
+        fetch, mutate = self.calls(batch_size)
+        lines.append(Msg.ml_sync_calls.format(all=fetch + mutate, fetch=fetch, mutate=mutate))
+        return "\n".join(lines)
+
+
+def read_sync_file(file_name, source: Union[str, int], by_id=False) -> Dict[Union[str, int], List[str]]:
+    """
+    --sync に渡されたファイルから、マイリストごとの望みの中身を読む。
+
+    一行にひとつずつ動画IDを書く。 「マイリスト名<タブ>動画ID」と書いた行は、
+    source ではなくそのマイリストに入る。 動画IDを空にした行は、
+    そのマイリストを空にすることを表す。 空行と # で始まる行は読み飛ばす。
+
+    :param str | Path file_name: ファイル名
+    :param str | int source: マイリスト名が書かれていない行の入るマイリスト
+    :param bool by_id: Trueで、マイリスト名の代わりにIDで書かれているとみなす。
+    :rtype: dict[str | int, list[str]]
+    """
+    try:
+        with Path(file_name).open(encoding="utf-8") as fd:
+            lines = fd.read().splitlines()
+    except OSError as error:
+        raise SyntaxError(Err.cant_read_file.format(file_name, error))
+
+    desired = OrderedDict()  # type: Dict[Union[str, int], List[str]]
+    for line in lines:
+        if not line.strip() or line.strip().startswith("#"):
+            continue
+        if "\t" in line:
+            name, video_id = (part.strip() for part in line.split("\t", 1))
+            if by_id and name.isdecimal():
+                name = int(name)
+        elif utils.ALL_ITEM == source:
+            raise SyntaxError(Err.sync_list_not_specified.format(line))
+        else:
+            name, video_id = source, line.strip()
+        videoids = desired.setdefault(name, [])
+        if not video_id:
+            continue
+        validated = utils.validator(video_id)
+        if not validated:
+            raise SyntaxError(Err.invalid_videoid)
+        videoids.append(validated[0])
+    if not desired and utils.ALL_ITEM != source:
+        desired[source] = []
+    return desired
+
+
 def linting(args, dest: Optional[str], source: Union[str, int]) -> None:
     """
 
@@ -1281,8 +1569,10 @@ def linting(args, dest: Optional[str], source: Union[str, int]) -> None:
             (args.copy and len(args.copy) > 1 and utils.ALL_ITEM in args.copy) or
             (args.move and len(args.move) > 1 and utils.ALL_ITEM in args.move)):
         raise SyntaxError(Err.videoids_contain_all)
+    if args.dry_run and not args.sync:
+        raise SyntaxError(Err.not_specified.format("--sync"))
     if not (args.export or args.show or args.create or args.purge
-            or args.add or args.copy or args.move or args.delete):
+            or args.add or args.copy or args.move or args.delete or args.sync):
         raise SyntaxError(Err.no_commands)
 
 
@@ -1320,6 +1610,8 @@ def main(args):
 
     mailadrs = args.mail[0] if args.mail else None
     password = args.password[0] if args.password else None
+    tracer = Tracer()
+    utils.Canopy.set_tracer(tracer)
     instnc = NicoMyList(mail=mailadrs, password=password, logger=logger)
 
     source = args.src[0]
@@ -1334,6 +1626,7 @@ def main(args):
     try:
         linting(args, dest, source)
         operand = linting_2(args)
+        desired = read_sync_file(args.sync[0], source, args.id) if args.sync else None
     except SyntaxError as error:
         # close しないと "Unclosed client session" とのエラーが出る。
         instnc.close()
@@ -1359,8 +1652,11 @@ def main(args):
         res = instnc.copy(source, dest, *operand)
     elif args.move:
         res = instnc.move(source, dest, *operand)
+    elif args.sync:
+        res = instnc.sync_many(desired, dry_run=args.dry_run, file_name=file_name, confident=args.yes)
     else:
         res = instnc.delete(source, *operand, confident=args.yes)
 
     instnc.close()
+    tracer.report(logger, args.trace)
     return res
@@ -0,0 +1,766 @@
+# coding: UTF-8
+import hashlib
+import json
+import os
+import sqlite3
+import struct
+import sys
+import time
+import zlib
+from array import array
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+from xml.etree import ElementTree
+
+from nicotools import utils
+from nicotools.utils import KeyDmc
+
+CACHE_FILE_NAME = "nicotools_cache.sqlite3"
+
+
+class InfoCache:
+    # 動画そのものについての情報。めったに変わらないので長く持っておく。
+    STABLE_KEYS = (
+        KeyDmc.VIDEO_ID, KeyDmc.TITLE, KeyDmc.FILE_NAME, KeyDmc.THUMBNAIL_URL,
+        KeyDmc.MOVIE_TYPE, KeyDmc.IS_DELETED, KeyDmc.IS_PUBLIC, KeyDmc.IS_OFFICIAL,
+        KeyDmc.MSG_SERVER, KeyDmc.THREAD_ID, KeyDmc.OPT_THREAD_ID, KeyDmc.NEEDS_KEY,
+        KeyDmc.IS_DMC, KeyDmc.RECIPE_ID, KeyDmc.CONTENT_ID,
+    )
+
+    def __init__(self,
+                 path: Optional[Union[str, Path]]=None,
+                 stable_ttl: Union[int, float]=7 * 24 * 60 * 60,
+                 session_ttl: Union[int, float]=10 * 60,
+                 max_entries: int=5000,
+                 clock: Callable[[], float]=time.time,
+                 ):
+        """
+        Info が集めた動画の情報をSQLiteのファイルに保存しておく。
+
+        タイトルやスレッドIDのような動画そのものについての情報は stable_ttl 秒のあいだ使い回す。
+        トークンや署名のようなログインに結びついた情報は session_ttl 秒で古くなる。
+        保存する数が max_entries を超えたら、最後に使ってから最も時間が経ったものから捨てる。
+
+        :param Optional[Union[str, Path]] path: 保存先。指定しなければホームディレクトリに置く。
+        :param Union[int, float] stable_ttl: 動画についての情報の有効期限(秒)
+        :param Union[int, float] session_ttl: ログインに結びついた情報の有効期限(秒)
+        :param int max_entries: 保存しておく動画の数の上限
+        :param Callable[[], float] clock: 現在時刻を返す関数
+        """
+        if max_entries < 1:
+            raise ValueError("max_entries must be 1 or more.")
+        path = path or Path.home() / CACHE_FILE_NAME
+        self.path = str(utils.get_dir(path))
+        self.stable_ttl = stable_ttl
+        self.session_ttl = session_ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS info ("
+            " video_id TEXT PRIMARY KEY,"
+            " stable TEXT NOT NULL, stable_at REAL NOT NULL,"
+            " session TEXT NOT NULL, session_at REAL NOT NULL,"
+            " used_at REAL NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS info_used_at ON info (used_at)")
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM info").fetchone()[0]
+
+    def lookup(self, video_ids: Iterable[str], stable_only: bool=False) -> Dict[str, Dict]:
+        """
+        保存しておいた情報のうち、まだ使えるものを返す。
+
+        stable_only が真のときは、ログインに結びついた情報が古くなっていても構わない。
+        その場合、古くなった値は None で埋めて返す。
+
+        :param Iterable[str] video_ids: 動画IDのリスト
+        :param bool stable_only: 動画そのものについての情報だけが必要か
+        :rtype: Dict[str, Dict]
+        """
+        now = self.clock()
+        found = {}
+        for video_id in video_ids:
+            row = self.conn.execute(
+                "SELECT stable, stable_at, session, session_at FROM info WHERE video_id = ?",
+                (video_id,)).fetchone()
+            if row is None:
+                self.misses += 1
+                continue
+            stable, stable_at, session, session_at = row
+            session_fresh = now - session_at < self.session_ttl
+            if now - stable_at >= self.stable_ttl or not (session_fresh or stable_only):
+                self.expired += 1
+                self.misses += 1
+                continue
+            info = json.loads(session)
+            if not session_fresh:
+                info = dict.fromkeys(info)
+            info.update(json.loads(stable))
+            found[video_id] = info
+            self.hits += 1
+        self.conn.executemany("UPDATE info SET used_at = ? WHERE video_id = ?",
+                              [(now, video_id) for video_id in found])
+        self.conn.commit()
+        return found
+
+    def store(self, infos: Dict[str, Dict]) -> None:
+        """
+        動画の情報を保存する。 保存する数が上限を超えたら古いものを捨てる。
+
+        :param Dict[str, Dict] infos: 動画IDとその情報の辞書
+        :rtype: None
+        """
+        now = self.clock()
+        rows = []
+        for video_id, info in infos.items():
+            if not isinstance(info, dict):
+                continue
+            stable = {key: value for key, value in info.items() if key in self.STABLE_KEYS}
+            session = {key: value for key, value in info.items() if key not in self.STABLE_KEYS}
+            rows.append((video_id, json.dumps(stable, ensure_ascii=False), now,
+                         json.dumps(session, ensure_ascii=False), now, now))
+        self.conn.executemany("INSERT OR REPLACE INTO info VALUES (?, ?, ?, ?, ?, ?)", rows)
+        cursor = self.conn.execute(
+            "DELETE FROM info WHERE video_id IN"
+            " (SELECT video_id FROM info ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,))
+        self.evicted += max(0, cursor.rowcount)
+        self.conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        ヒットした数、外れた数、期限切れだった数、捨てた数を返す。
+
+        :rtype: Dict[str, int]
+        """
+        return {"hits": self.hits, "misses": self.misses, "expired": self.expired,
+                "evicted": self.evicted, "entries": len(self)}
+
+
+class RangeJournal:
+    SUFFIX = ".journal"
+
+    def __init__(self,
+                 file_path: Union[str, Path],
+                 file_size: int,
+                 interval: Union[int, float]=1,
+                 clock: Callable[[], float]=time.monotonic,
+                 ):
+        """
+        分割ダウンロードで、ファイルのどこまでを書き終えたかを記録する。
+
+        記録はファイルの隣に "<ファイル名>.journal" として置き、
+        interval 秒に一度だけ、書き換えの途中で壊れないように置き換える形で保存する。
+        記録にある大きさとサーバーの content-length が違えば、最初からやり直す。
+
+        :param Union[str, Path] file_path: 保存先のファイル
+        :param int file_size: サーバーが返した content-length
+        :param Union[int, float] interval: 記録を保存する間隔(秒)
+        :param Callable[[], float] clock: 時刻を返す関数
+        """
+        self.file_path = Path(file_path)
+        self.path = self.file_path.with_name(self.file_path.name + self.SUFFIX)
+        self.file_size = file_size
+        self.interval = interval
+        self.clock = clock
+        self.saved_at = clock()
+        # 書き終えた区間を [始まり, 終わり) の組で、始まりの順に並べて持つ。
+        self.done = []  # type: List[List[int]]
+        self.resumed = False
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with self.path.open(encoding="utf-8") as fd:
+                data = json.load(fd)
+            if (data["size"] == self.file_size and self.file_path.is_file()
+                    and self.file_path.stat().st_size == self.file_size):
+                self.done = [[int(begin), int(end)] for begin, end in data["done"]]
+                self._normalize()
+                self.resumed = True
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    def _normalize(self) -> None:
+        merged = []
+        for begin, end in sorted(self.done):
+            if merged and begin <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([begin, end])
+        self.done = merged
+
+    @property
+    def done_size(self) -> int:
+        return sum(end - begin for begin, end in self.done)
+
+    def missing(self) -> List[Tuple[int, int]]:
+        """
+        まだ書いていない区間を (始まり, 終わり) の組で返す。 終わりの位置も含む。
+
+        :rtype: List[Tuple[int, int]]
+        """
+        result = []
+        position = 0
+        for begin, end in self.done:
+            if position < begin:
+                result.append((position, begin - 1))
+            position = max(position, end)
+        if position < self.file_size:
+            result.append((position, self.file_size - 1))
+        return result
+
+    def commit(self, begin: int, size: int) -> None:
+        """
+        begin から size バイトを書き終えたことを記録する。
+
+        :param int begin: 書き込んだ位置
+        :param int size: 書き込んだ大きさ
+        :rtype: None
+        """
+        if size <= 0:
+            return
+        self.done.append([begin, begin + size])
+        self._normalize()
+        if self.clock() - self.saved_at >= self.interval:
+            self.save()
+
+    def save(self) -> None:
+        """ 記録をファイルに保存する。 """
+        temporary = self.path.with_name(self.path.name + ".tmp")
+        with temporary.open("w", encoding="utf-8") as fd:
+            json.dump({"size": self.file_size, "done": self.done}, fd)
+        os.replace(str(temporary), str(self.path))
+        self.saved_at = self.clock()
+
+    def finish(self) -> None:
+        """ ダウンロードが終わったので記録を消す。 """
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class BlockHasher:
+    ALGORITHM = "blake2b"
+    # ブロックの大きさ。 区間の継ぎ目をまたぐブロックだけを読み直すので、小さいほど読み直す量は減る。
+    BLOCK_SIZE = 4 * 1024 * 1024
+
+    def __init__(self, file_size: int, block_size: int=BLOCK_SIZE):
+        """
+        書き込むデータを、書き込むついでにハッシュにかける。
+
+        分割ダウンロードでは区間がばらばらの順に届くので、ファイルを block_size ごとのブロックに分け、
+        ブロックごとに BLAKE2b をとり、最後にそれらを順に並べたものの BLAKE2b をとる。
+        ブロックの頭から順に届いたデータはその場でハッシュにかけるので、ファイルを読み直さない。
+        区間の継ぎ目などで順番どおりに届かなかったブロックだけは、最後にファイルから読み直す。
+
+        使い方:
+
+            hasher = BlockHasher(file_size)
+            hasher.update(position, data)
+            ...
+            digest = hasher.hexdigest(file_path)
+
+        :param int file_size: ファイル全体の大きさ
+        :param int block_size: ブロックの大きさ
+        """
+        if block_size < 1:
+            raise ValueError("block_size must be 1 or more.")
+        self.file_size = file_size
+        self.block_size = block_size
+        self.digests = [None] * -(-file_size // block_size)  # type: List[Optional[bytes]]
+        # ハッシュにかけている途中のブロック: {ブロックの番号: [hashlib のオブジェクト, どこまでかけたか]}
+        self.partial = {}  # type: Dict[int, list]
+        # 順番どおりに届かなかったので、あとで読み直すブロック
+        self.broken = set()  # type: Set[int]
+        self.reread = 0
+
+    @classmethod
+    def block_size_for(cls, file_size: int, parts: int, smallest: int=64 * 1024) -> int:
+        """
+        file_size を parts 個以上のブロックに分けられる大きさを返す。
+
+        BLOCK_SIZE から半分ずつ小さくしていき、 smallest より小さくはしない。
+        分割ダウンロードの区間の切れ目をこの大きさにそろえれば、どのブロックも頭から順に届くので読み直さずに済む。
+
+        :param int file_size: ファイル全体の大きさ
+        :param int parts: 分けたい数
+        :param int smallest: ブロックの大きさの下限
+        :rtype: int
+        """
+        size = cls.BLOCK_SIZE
+        while size > smallest and file_size < size * parts:
+            size //= 2
+        return size
+
+    def _block_length(self, index: int) -> int:
+        return min(self.block_size, self.file_size - index * self.block_size)
+
+    def update(self, position: int, data: Union[bytes, memoryview]) -> None:
+        """
+        position の位置に書き込んだ data をハッシュにかける。
+
+        :param int position: 書き込んだ位置
+        :param Union[bytes, memoryview] data: 書き込んだデータ
+        :rtype: None
+        """
+        view = memoryview(data)
+        while view:
+            index, offset = divmod(position, self.block_size)
+            take = min(len(view), self.block_size - offset)
+            if index < len(self.digests) and index not in self.broken and self.digests[index] is None:
+                state = self.partial.get(index)
+                if state is None and offset == 0:
+                    state = self.partial[index] = [hashlib.blake2b(), 0]
+                if state is not None and state[1] == offset:
+                    state[0].update(view[:take])
+                    state[1] += take
+                    if state[1] >= self._block_length(index):
+                        self.digests[index] = state[0].digest()
+                        del self.partial[index]
+                else:
+                    self.partial.pop(index, None)
+                    self.broken.add(index)
+            position += take
+            view = view[take:]
+
+    def hexdigest(self, file_path: Union[str, Path]) -> str:
+        """
+        ファイル全体のハッシュを返す。 ハッシュにかけ終えていないブロックはファイルから読み直す。
+
+        :param Union[str, Path] file_path: 書き込んだファイル
+        :rtype: str
+        """
+        missing = [index for index, digest in enumerate(self.digests) if digest is None]
+        if missing:
+            with Path(str(file_path)).open("rb") as fd:
+                for index in missing:
+                    fd.seek(index * self.block_size)
+                    self.digests[index] = hashlib.blake2b(fd.read(self._block_length(index))).digest()
+            self.reread += len(missing)
+            self.partial.clear()
+            self.broken.clear()
+        return _combine(self.digests)
+
+
+def _combine(digests: Iterable[bytes]) -> str:
+    """ ブロックごとのハッシュを順に並べたもののハッシュ """
+    whole = hashlib.blake2b()
+    for digest in digests:
+        whole.update(digest)
+    return whole.hexdigest()
+
+
+def file_digest(file_path: Union[str, Path], block_size: int=BlockHasher.BLOCK_SIZE) -> str:
+    """
+    ファイルを読んで、 BlockHasher と同じやり方でハッシュをとる。
+
+    :param Union[str, Path] file_path: ファイル
+    :param int block_size: ブロックの大きさ
+    :rtype: str
+    """
+    digests = []
+    with Path(str(file_path)).open("rb") as fd:
+        for block in iter(lambda: fd.read(block_size), b""):
+            digests.append(hashlib.blake2b(block).digest())
+    return _combine(digests)
+
+
+class Manifest:
+    FILE_NAME = "nicotools_manifest.json"
+
+    def __init__(self,
+                 directory: Union[str, Path],
+                 interval: Optional[Union[int, float]]=None,
+                 batch: Optional[int]=None,
+                 clock: Callable[[], float]=time.monotonic,
+                 ):
+        """
+        保存したファイルの大きさとハッシュを、同じフォルダーの "nicotools_manifest.json" に記録する。
+
+        同じフォルダーに複数の段階 (サムネイルと動画など) が書き込んでも消し合わないように、
+        保存するときはファイルを読み直して、自分が記録した分だけを上書きする。
+        小さなファイルをたくさん記録するときは、そのたびに全体を書き直さないように、
+        batch 件たまるか interval 秒たったときだけ書き出す。 どちらも None なら記録するたびに書き出す。
+        残りは最後に save() を呼んで書き出すこと。
+
+        :param Union[str, Path] directory: 保存先のフォルダー
+        :param Optional[Union[int, float]] interval: 書き出す間隔(秒)
+        :param Optional[int] batch: 何件たまったら書き出すか
+        :param Callable[[], float] clock: 時刻を返す関数
+        """
+        self.directory = Path(str(directory))
+        self.path = self.directory / self.FILE_NAME
+        self.interval = interval
+        self.batch = batch
+        self.clock = clock
+        self.saved_at = clock()
+        self.pending = {}  # type: Dict[str, Dict]
+
+    def load(self) -> Dict[str, Dict]:
+        """
+        記録を読み込む。 {ファイル名: {"size", "algorithm", "block_size", "digest"}}
+
+        :rtype: Dict[str, Dict]
+        """
+        try:
+            with self.path.open(encoding="utf-8") as fd:
+                entries = json.load(fd)["files"]
+            return entries if isinstance(entries, dict) else {}
+        except (OSError, ValueError, KeyError, TypeError):
+            return {}
+
+    def record(self, file_path: Union[str, Path], size: int, digest: str,
+               block_size: int=BlockHasher.BLOCK_SIZE, save: bool=True, **extra: Optional[str]) -> None:
+        """
+        ファイルの大きさとハッシュを記録する。
+
+        extra には、次に取りに行くときに使う ETag (etag) や Last-Modified (last_modified) などを渡す。
+        値が None のものは記録しない。
+
+        :param Union[str, Path] file_path: 保存したファイル
+        :param int size: サーバーが返した大きさ
+        :param str digest: BlockHasher.hexdigest() の値
+        :param int block_size: ハッシュをとったときのブロックの大きさ
+        :param bool save: 書き出す頃合いなら書き出すかどうか。 False なら save() を呼ぶまで溜めておく。
+        :param Optional[str] extra: 一緒に記録するもの
+        :rtype: None
+        """
+        entry = {"size": size, "algorithm": BlockHasher.ALGORITHM, "block_size": block_size, "digest": digest}
+        entry.update((key, value) for key, value in extra.items() if value is not None)
+        self.pending[Path(str(file_path)).name] = entry
+        if save and self._due():
+            self.save()
+
+    def _due(self) -> bool:
+        """ 溜めておいた記録を書き出す頃合いかどうか。 """
+        if self.interval is None and self.batch is None:
+            return True
+        return ((self.batch is not None and len(self.pending) >= self.batch)
+                or (self.interval is not None and self.clock() - self.saved_at >= self.interval))
+
+    def save(self) -> None:
+        """ 記録したものをファイルに書き出す。 """
+        self.saved_at = self.clock()
+        if not self.pending:
+            return
+        entries = self.load()
+        entries.update(self.pending)
+        temporary = self.path.with_name(self.path.name + ".tmp")
+        with temporary.open("w", encoding="utf-8") as fd:
+            json.dump({"files": entries}, fd, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(str(temporary), str(self.path))
+        self.pending = {}
+
+
+class FileIndex:
+    def __init__(self, directory: Union[str, Path]):
+        """
+        フォルダーの中にあるファイルを、名前から引けるようにしておく。
+
+        ファイルごとに stat を呼ぶ代わりに、最初に問い合わせたときに一度だけフォルダーを走査する。
+        大きさや更新日時は、問い合わせのあった名前についてだけ調べる。
+        走査したあとに書いたファイルは載らないので、すでにあったものを確かめるために使う。
+
+        :param Union[str, Path] directory: 調べるフォルダー
+        """
+        self.directory = Path(str(directory))
+        self.__entries = None  # type: Optional[Dict[str, os.DirEntry]]
+
+    @property
+    def entries(self) -> Dict[str, "os.DirEntry"]:
+        if self.__entries is None:
+            try:
+                with os.scandir(str(self.directory)) as iterator:
+                    self.__entries = {entry.name: entry for entry in iterator if entry.is_file()}
+            except FileNotFoundError:
+                self.__entries = {}
+        return self.__entries
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.entries
+
+    def size(self, name: str) -> Optional[int]:
+        """
+        ファイルの大きさを返す。 なければ None。
+
+        :param str name: ファイル名
+        :rtype: Optional[int]
+        """
+        entry = self.entries.get(name)
+        return None if entry is None else entry.stat().st_size
+
+    def mtime(self, name: str) -> Optional[float]:
+        """
+        ファイルの更新日時 (UNIX時間) を返す。 なければ None。
+
+        :param str name: ファイル名
+        :rtype: Optional[float]
+        """
+        entry = self.entries.get(name)
+        return None if entry is None else entry.stat().st_mtime
+
+
+def verify_file(file_path: Union[str, Path], entry: Dict) -> Optional[str]:
+    """
+    ファイルが記録どおりの大きさとハッシュを持つか確かめる。
+    別のプロセスで動かせるように、モジュールの直下に置いている。
+
+    :param Union[str, Path] file_path: 確かめるファイル
+    :param Dict entry: Manifest に記録されたもの
+    :return: 問題があればその内容 ("missing", "size", "digest", "algorithm")、 なければ None
+    :rtype: Optional[str]
+    """
+    file_path = Path(str(file_path))
+    if entry.get("algorithm") != BlockHasher.ALGORITHM:
+        return "algorithm"
+    try:
+        if file_path.stat().st_size != entry["size"]:
+            return "size"
+        if file_digest(file_path, entry["block_size"]) != entry["digest"]:
+            return "digest"
+    except FileNotFoundError:
+        return "missing"
+    return None
+
+
+def _typecode(candidates: str, size: int) -> str:
+    """ 大きさが size バイトになる array の型を選ぶ """
+    return next(code for code in candidates if array(code).itemsize == size)
+
+
+class ChatStore:
+    # ファイルの先頭に置く目印
+    MAGIC = b"NTCHATS\x01"
+    # 各ブロックの先頭: 目印, フラグ, スレッドID, コメント数, 中身の大きさ
+    BLOCK = struct.Struct("<4sBqII")
+    BLOCK_MAGIC = b"BLK1"
+    FLAG_ZLIB = 0x01
+
+    THREAD = "thread"
+    NO = "no"
+    VPOS = "vpos"
+    DATE = "date"
+    FORK = "fork"
+    USER_ID = "user_id"
+    MAIL = "mail"
+    CONTENT = "content"
+    # 数値の列とその array の型
+    NUMBERS = ((NO, _typecode("IL", 4)), (VPOS, _typecode("il", 4)),
+               (DATE, _typecode("IL", 4)), (FORK, "B"))
+    # 文字列の列。 中身は文字列表の番号として持つ。
+    STRINGS = (USER_ID, MAIL, CONTENT)
+    _INDEX = _typecode("IL", 4)
+
+    def __init__(self, path: Union[str, Path]):
+        """
+        コメントを列ごとにまとめて保存する。
+
+        ファイルは自己完結したブロックの並びで、ひとつのブロックはひとつのスレッドのコメントを持つ。
+        数値の列は array のまま、文字列の列は重複を除いた文字列表への番号として書き込み、
+        必要なら zlib で圧縮する。読み込むときは JSON や XML を解析し直す必要がない。
+        同じスレッドのブロックが複数あれば、読み込むときにコメント番号で重複を除いてまとめる。
+
+        :param Union[str, Path] path: 保存先
+        """
+        self.path = Path(path)
+
+    def append(self, chats: Iterable[Dict], compress: bool=True) -> int:
+        """
+        コメントをスレッドごとのブロックにしてファイルの末尾に書き足す。
+
+        :param Iterable[Dict] chats: コメントの辞書の並び
+        :param bool compress: zlib で圧縮するか
+        :return: 書き足したコメントの数
+        :rtype: int
+        """
+        threads = {}  # type: Dict[int, List[Dict]]
+        for chat in chats:
+            threads.setdefault(int(chat[self.THREAD]), []).append(chat)
+        is_new = not self.path.exists() or self.path.stat().st_size == 0
+        with self.path.open("ab") as fd:
+            if is_new:
+                fd.write(self.MAGIC)
+            for thread, rows in threads.items():
+                fd.write(self._encode(thread, rows, compress))
+        return sum(len(rows) for rows in threads.values())
+
+    def _encode(self, thread: int, rows: List[Dict], compress: bool) -> bytes:
+        table = {}  # type: Dict[str, int]
+        parts = []
+        for column, code in self.NUMBERS:
+            parts.append(self._to_bytes(array(code, (int(row.get(column) or 0) for row in rows))))
+        for column in self.STRINGS:
+            indices = array(self._INDEX, (table.setdefault(row.get(column) or "", len(table)) for row in rows))
+            parts.append(self._to_bytes(indices))
+        encoded = [text.encode("utf-8") for text in table]
+        parts.append(struct.pack("<I", len(encoded)))
+        parts.append(self._to_bytes(array(self._INDEX, map(len, encoded))))
+        parts.append(b"".join(encoded))
+        payload = b"".join(parts)
+        flags = 0
+        if compress:
+            payload = zlib.compress(payload)
+            flags |= self.FLAG_ZLIB
+        return self.BLOCK.pack(self.BLOCK_MAGIC, flags, thread, len(rows), len(payload)) + payload
+
+    @staticmethod
+    def _to_bytes(values: array) -> bytes:
+        # ファイルの中ではリトルエンディアンにそろえる
+        if sys.byteorder == "big":
+            values = array(values.typecode, values)
+            values.byteswap()
+        return values.tobytes()
+
+    @staticmethod
+    def _from_bytes(code: str, data: memoryview, count: int, offset: int) -> Tuple[array, int]:
+        values = array(code)
+        end = offset + values.itemsize * count
+        values.frombytes(data[offset:end])
+        if sys.byteorder == "big":
+            values.byteswap()
+        return values, end
+
+    def blocks(self) -> Iterator[Tuple[int, Dict[str, Union[array, List[str]]]]]:
+        """
+        ブロックをひとつずつ (スレッドID, 列の辞書) の組にして返す。
+
+        :rtype: Iterator[Tuple[int, Dict[str, Union[array, List[str]]]]]
+        """
+        with self.path.open("rb") as fd:
+            if fd.read(len(self.MAGIC)) != self.MAGIC:
+                raise ValueError(f"Not a chat store: {self.path}")
+            while True:
+                header = fd.read(self.BLOCK.size)
+                if not header:
+                    break
+                if len(header) < self.BLOCK.size:
+                    raise ValueError(f"Truncated block header: {self.path}")
+                magic, flags, thread, count, length = self.BLOCK.unpack(header)
+                if magic != self.BLOCK_MAGIC:
+                    raise ValueError(f"Broken block: {self.path}")
+                payload = fd.read(length)
+                if len(payload) < length:
+                    raise ValueError(f"Truncated block: {self.path}")
+                if flags & self.FLAG_ZLIB:
+                    payload = zlib.decompress(payload)
+                yield thread, self._decode(memoryview(payload), count)
+
+    def _decode(self, data: memoryview, count: int) -> Dict[str, Union[array, List[str]]]:
+        columns = {}
+        offset = 0
+        for column, code in self.NUMBERS:
+            columns[column], offset = self._from_bytes(code, data, count, offset)
+        indices = {}
+        for column in self.STRINGS:
+            indices[column], offset = self._from_bytes(self._INDEX, data, count, offset)
+        size = struct.unpack_from("<I", data, offset)[0]
+        lengths, offset = self._from_bytes(self._INDEX, data, size, offset + 4)
+        table = []
+        for length in lengths:
+            table.append(bytes(data[offset:offset + length]).decode("utf-8"))
+            offset += length
+        for column in self.STRINGS:
+            columns[column] = [table[index] for index in indices[column]]
+        return columns
+
+    def load(self, thread: Optional[int]=None) -> Dict[str, Union[array, List[str]]]:
+        """
+        コメントを列の辞書として読み込む。
+
+        同じコメント (スレッド, fork, 番号が同じもの) が複数のブロックにあれば、後のものを使う。
+        結果はスレッド, fork, 番号の順に並ぶ。
+
+        :param Optional[int] thread: このスレッドのコメントだけを読む。 None ならすべて。
+        :rtype: Dict[str, Union[array, List[str]]]
+        """
+        rows = {}
+        for thread_id, columns in self.blocks():
+            if thread is not None and thread_id != int(thread):
+                continue
+            for i, (no, fork) in enumerate(zip(columns[self.NO], columns[self.FORK])):
+                rows[(thread_id, fork, no)] = (columns, i)
+        result = {self.THREAD: array("q")}
+        result.update({column: array(code) for column, code in self.NUMBERS})
+        result.update({column: [] for column in self.STRINGS})
+        for key in sorted(rows):
+            columns, i = rows[key]
+            result[self.THREAD].append(key[0])
+            for column in result:
+                if column != self.THREAD:
+                    result[column].append(columns[column][i])
+        return result
+
+    def last_numbers(self) -> Dict[Tuple[int, int], int]:
+        """
+        (スレッドID, fork) ごとに、保存してあるコメント番号の最大値を返す。
+
+        :rtype: Dict[Tuple[int, int], int]
+        """
+        result = {}
+        if not self.path.exists():
+            return result
+        for thread_id, columns in self.blocks():
+            for no, fork in zip(columns[self.NO], columns[self.FORK]):
+                key = (thread_id, fork)
+                result[key] = max(no, result.get(key, 0))
+        return result
+
+    def __len__(self) -> int:
+        return len(self.load()[self.NO])
+
+
+def chats_from_json(text: str) -> List[Dict]:
+    """
+    コメントサーバーが返したJSONから、コメントを辞書のリストにして取り出す。
+
+    :param str text: JSONの文字列
+    :rtype: List[Dict]
+    """
+    result = []
+    for item in json.loads(text):
+        chat = item.get("chat")
+        if chat:
+            result.append({
+                ChatStore.THREAD : int(chat["thread"]),
+                ChatStore.NO     : chat.get("no", 0),
+                ChatStore.VPOS   : chat.get("vpos", 0),
+                ChatStore.DATE   : chat.get("date", 0),
+                ChatStore.FORK   : chat.get("fork", 0),
+                ChatStore.USER_ID: chat.get("user_id", ""),
+                ChatStore.MAIL   : chat.get("mail", ""),
+                ChatStore.CONTENT: chat.get("content", ""),
+            })
+    return result
+
+
+def chats_from_xml(text: str) -> List[Dict]:
+    """
+    コメントサーバーが返したXMLから、コメントを辞書のリストにして取り出す。
+
+    :param str text: XMLの文字列
+    :rtype: List[Dict]
+    """
+    result = []
+    for chat in ElementTree.fromstring(text).iter("chat"):
+        result.append({
+            ChatStore.THREAD : int(chat.get("thread")),
+            ChatStore.NO     : int(chat.get("no", 0)),
+            ChatStore.VPOS   : int(chat.get("vpos", 0)),
+            ChatStore.DATE   : int(chat.get("date", 0)),
+            ChatStore.FORK   : int(chat.get("fork", 0)),
+            ChatStore.USER_ID: chat.get("user_id", ""),
+            ChatStore.MAIL   : chat.get("mail", ""),
+            ChatStore.CONTENT: chat.text or "",
+        })
+    return result
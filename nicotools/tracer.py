@@ -0,0 +1,266 @@
+# coding: UTF-8
+import json
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional, Union
+
+import aiohttp
+
+from nicotools import utils
+from nicotools.utils import Msg
+
+try:
+    from prettytable import PrettyTable
+except ImportError:
+    PrettyTable = False
+
+
+class TraceContext:
+    def __init__(self, stage: str, attempt: int=0):
+        """
+        リクエストにつける目印。 session.get(url, trace_request_ctx=...) として渡す。
+
+        本文を content.read() で少しずつ読む場合は aiohttp が受信を知らせてくれないので、
+        読んだ大きさを received() で伝える。
+
+        :param str stage: 段階の名前
+        :param int attempt: 何回目の再試行か (最初は 0)
+        """
+        self.stage = stage
+        self.attempt = attempt
+        self.record = None  # type: Optional[TraceRecord]
+
+    def received(self, size: int) -> None:
+        if self.record is not None:
+            self.record.received(size)
+
+
+class TraceRecord:
+    FIELDS = ("stage", "method", "url", "status", "started", "dns", "connect",
+              "ttfb", "transfer", "bytes", "retry", "reused", "error")
+
+    def __init__(self, stage: str, method: str, url: str, retry: int, clock: Callable[[], float]):
+        """
+        ひとつのリクエストにかかった時間の記録。 時間はすべて秒。
+
+        * dns: 名前解決にかかった時間
+        * connect: 接続を張るのにかかった時間 (名前解決を含む)。 使い回した場合は 0。
+        * ttfb: 接続ができてから、応答のヘッダーが届くまでの時間
+        * transfer: ヘッダーが届いてから、本文の最後が届くまでの時間
+        """
+        self.clock = clock
+        self.stage = stage
+        self.method = method
+        self.url = url
+        self.retry = retry
+        self.status = None  # type: Optional[int]
+        self.error = None  # type: Optional[str]
+        self.started = time.time()
+        self.dns = 0.0
+        self.connect = 0.0
+        self.reused = False
+        self.bytes = 0
+        self.begin = clock()
+        self.connected = None  # type: Optional[float]
+        self.headers = None  # type: Optional[float]
+        self.last = None  # type: Optional[float]
+
+    def received(self, size: int) -> None:
+        self.bytes += size
+        self.last = self.clock()
+
+    @property
+    def ttfb(self) -> float:
+        if self.headers is None:
+            return 0.0
+        return self.headers - (self.connected or self.begin)
+
+    @property
+    def transfer(self) -> float:
+        if self.headers is None or self.last is None:
+            return 0.0
+        return max(0.0, self.last - self.headers)
+
+    def to_dict(self) -> Dict[str, Union[str, int, float, bool, None]]:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+
+class Tracer:
+    INFO = "info"
+    THUMBNAIL = "thumbnail"
+    COMMENT = "comment"
+    DMC_NEGOTIATE = "dmc-negotiate"
+    DMC_HEARTBEAT = "dmc-heartbeat"
+    VIDEO_RANGE = "video-range"
+    MYLIST = "mylist"
+    OTHER = "other"
+
+    def __init__(self, clock: Callable[[], float]=time.monotonic):
+        """
+        aiohttp の TraceConfig を使って、すべてのリクエストの所要時間を記録する。
+
+        使い方:
+
+            tracer = Tracer()
+            utils.Canopy.set_tracer(tracer)
+            ... (Canopy を継承したクラスが作るセッションはすべて記録される)
+            print(tracer.summary())
+            tracer.dump("trace.jsonl")
+
+        段階は、リクエストに渡した TraceContext か、セッションを作るときに決めた既定の段階で決まる。
+
+        :param clock: 時刻を返す関数
+        """
+        self.clock = clock
+        self.records = []  # type: List[TraceRecord]
+
+    @staticmethod
+    def tag(stage: str, attempt: int=0) -> TraceContext:
+        """
+        リクエストにつける目印を作る。
+
+        :param str stage: 段階の名前
+        :param int attempt: 何回目の再試行か
+        :rtype: TraceContext
+        """
+        return TraceContext(stage, attempt)
+
+    def config(self, stage: Optional[str]=None) -> aiohttp.TraceConfig:
+        """
+        セッションに渡す TraceConfig を作る。
+
+        :param Optional[str] stage: 目印のないリクエストに使う段階の名前
+        :rtype: aiohttp.TraceConfig
+        """
+        def factory(trace_request_ctx=None):
+            return SimpleNamespace(trace_request_ctx=trace_request_ctx, stage=stage or self.OTHER)
+
+        config = aiohttp.TraceConfig(trace_config_ctx_factory=factory)
+        config.on_request_start.append(self._on_request_start)
+        config.on_dns_resolvehost_start.append(self._on_dns_start)
+        config.on_dns_resolvehost_end.append(self._on_dns_end)
+        config.on_connection_create_start.append(self._on_connection_start)
+        config.on_connection_create_end.append(self._on_connection_end)
+        config.on_connection_reuseconn.append(self._on_connection_reuse)
+        config.on_request_end.append(self._on_request_end)
+        config.on_response_chunk_received.append(self._on_chunk)
+        config.on_request_exception.append(self._on_request_exception)
+        config.freeze()
+        return config
+
+    async def _on_request_start(self, _, context, params) -> None:
+        tag = context.trace_request_ctx
+        stage = tag.stage if isinstance(tag, TraceContext) else context.stage
+        attempt = tag.attempt if isinstance(tag, TraceContext) else 0
+        record = TraceRecord(stage, params.method, str(params.url), attempt, self.clock)
+        if isinstance(tag, TraceContext):
+            tag.record = record
+        context.record = record
+        self.records.append(record)
+
+    async def _on_dns_start(self, _, context, __) -> None:
+        context.dns_begin = self.clock()
+
+    async def _on_dns_end(self, _, context, __) -> None:
+        if hasattr(context, "record") and hasattr(context, "dns_begin"):
+            context.record.dns = self.clock() - context.dns_begin
+
+    async def _on_connection_start(self, _, context, __) -> None:
+        context.connection_begin = self.clock()
+
+    async def _on_connection_end(self, _, context, __) -> None:
+        if hasattr(context, "record"):
+            now = self.clock()
+            context.record.connect = now - getattr(context, "connection_begin", now)
+            context.record.connected = now
+
+    async def _on_connection_reuse(self, _, context, __) -> None:
+        if hasattr(context, "record"):
+            context.record.reused = True
+            context.record.connected = self.clock()
+
+    async def _on_request_end(self, _, context, params) -> None:
+        if hasattr(context, "record"):
+            context.record.headers = self.clock()
+            context.record.status = params.response.status
+
+    async def _on_chunk(self, _, context, params) -> None:
+        if hasattr(context, "record"):
+            context.record.received(len(params.chunk))
+
+    async def _on_request_exception(self, _, context, params) -> None:
+        if hasattr(context, "record"):
+            context.record.error = repr(params.exception)
+
+    def stats(self) -> Dict[str, Dict[str, Union[int, float]]]:
+        """
+        段階ごとにまとめた件数・失敗数・再試行数・受信量と、各時間の平均を返す。
+
+        :rtype: Dict[str, Dict[str, Union[int, float]]]
+        """
+        grouped = {}  # type: Dict[str, List[TraceRecord]]
+        for record in self.records:
+            grouped.setdefault(record.stage, []).append(record)
+        result = {}
+        for stage, records in sorted(grouped.items()):
+            count = len(records)
+            result[stage] = {
+                "count"   : count,
+                "errors"  : sum(1 for r in records if r.error or (r.status or 0) >= 400),
+                "retries" : sum(1 for r in records if r.retry > 0),
+                "bytes"   : sum(r.bytes for r in records),
+                "dns"     : sum(r.dns for r in records) / count,
+                "connect" : sum(r.connect for r in records) / count,
+                "ttfb"    : sum(r.ttfb for r in records) / count,
+                "transfer": sum(r.transfer for r in records) / count,
+            }
+        return result
+
+    def summary(self) -> str:
+        """
+        段階ごとの集計を表にする。 prettytable がなければタブ区切りにする。
+
+        :rtype: str
+        """
+        header = ["stage", "count", "errors", "retries", "bytes", "dns", "connect", "ttfb", "transfer"]
+        rows = []
+        for stage, stat in self.stats().items():
+            rows.append([stage, stat["count"], stat["errors"], stat["retries"], stat["bytes"]] +
+                        ["{:.3f}".format(stat[key]) for key in ("dns", "connect", "ttfb", "transfer")])
+        if PrettyTable:
+            table = PrettyTable(header)
+            for row in rows:
+                table.add_row(row)
+            return table.get_string()
+        return "\n".join("\t".join(str(item) for item in row) for row in [header] + rows)
+
+    def dump(self, file_name: Union[str, Path]) -> int:
+        """
+        すべてのリクエストの記録を、一行にひとつずつのJSONとして書き出す。
+
+        :param Union[str, Path] file_name: 書き出す先
+        :return: 書き出した行数
+        :rtype: int
+        """
+        with Path(file_name).open("w", encoding="utf-8") as fd:
+            for record in self.records:
+                fd.write(json.dumps(record.to_dict(), ensure_ascii=False) + "\n")
+        return len(self.records)
+
+    def report(self, logger: utils.NTLogger, file_name: Optional[Union[str, Path]]=None) -> None:
+        """
+        集計の表をログに出し、file_name があれば記録を書き出す。
+
+        書き出し先を指定したときは表を INFO で、そうでなければ DEBUG で出す。
+
+        :param utils.NTLogger logger: ロガー
+        :param Optional[Union[str, Path]] file_name: 書き出す先
+        """
+        if not self.records:
+            return
+        if file_name:
+            logger.info(Msg.nd_trace_summary.format(self.summary()))
+            logger.info(Msg.nd_trace_written.format(count=self.dump(file_name), path=file_name))
+        else:
+            logger.debug(Msg.nd_trace_summary.format(self.summary()))
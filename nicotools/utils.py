@@ -1,17 +1,20 @@
 # coding: UTF-8
 import asyncio
-import inspect
+import codecs
+import html
 import logging
 import os
+import random
 import re
 import sys
+import time
 from argparse import ArgumentParser
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from getpass import getpass
 from pathlib import Path
-from urllib.parse import parse_qs
-
-import requests
-from requests import cookies
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
+from urllib.parse import parse_qs, urlparse
 
 ALL_ITEM = "*"
 DEFAULT_NAME = "とりあえずマイリスト"
@@ -203,6 +206,92 @@ def extract_getflv(content):
     return result
 
 
+class WatchDataScanner:
+    """
+    動画視聴ページのHTMLを先頭から少しずつ調べ、動画の情報が入ったJSONだけを切り出す。
+
+    BeautifulSoup でページ全体を解析するよりもずっと速い。
+    JSONを最後まで取り出せた時点で、それ以降は調べない。
+
+    使い方:
+
+        scanner = WatchDataScanner()
+        for chunk in chunks:
+            if scanner.feed(chunk):
+                break
+        scanner.kind     # => "data_api" または "watch_api"
+        scanner.payload  # => JSONの文字列
+    """
+    DATA_API = "data_api"
+    WATCH_API = "watch_api"
+
+    _MARKERS = (
+        (DATA_API, b'id="js-initial-watch-data"'),
+        (WATCH_API, b'id="watchAPIDataContainer"'),
+    )
+    _ATTRIBUTE = b'data-api-data="'
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.kind = None  # type: str
+        self.payload = None  # type: str
+        self.__searched = 0
+        self.__found = None
+
+    @property
+    def done(self) -> bool:
+        return self.payload is not None
+
+    def feed(self, chunk: bytes) -> bool:
+        """
+        HTMLの続きを読み込ませる。
+
+        :param bytes chunk: HTMLの断片
+        :return: JSONを取り出せたかどうか
+        :rtype: bool
+        """
+        if self.done:
+            return True
+        self.buffer += chunk
+        if self.__found is None:
+            self.__found = self._find_marker()
+            if self.__found is None:
+                return False
+
+        kind, position = self.__found
+        if kind == self.DATA_API:
+            # <div id="js-initial-watch-data" data-api-data="{&quot;video&quot;: ...}" ...>
+            tag_start = self.buffer.rfind(b"<", 0, position)
+            attribute = self.buffer.find(self._ATTRIBUTE, tag_start)
+            if attribute < 0:
+                return False
+            begin = attribute + len(self._ATTRIBUTE)
+            end = self.buffer.find(b'"', begin)
+        else:
+            # <div id="watchAPIDataContainer" style="display:none">{&quot;flashvars&quot;: ...}</div>
+            begin = self.buffer.find(b">", position)
+            if begin < 0:
+                return False
+            begin += 1
+            end = self.buffer.find(b"<", begin)
+        if end < 0:
+            return False
+
+        self.kind = kind
+        self.payload = html.unescape(self.buffer[begin:end].decode("utf-8", BACKSLASH))
+        return True
+
+    def _find_marker(self):
+        # 断片の境目で切れた目印を見逃さないよう、前回調べた末尾より少し手前から探す
+        start = max(0, self.__searched - max(len(mark) for _, mark in self._MARKERS))
+        for kind, mark in self._MARKERS:
+            position = self.buffer.find(mark, start)
+            if position >= 0:
+                return kind, position
+        self.__searched = len(self.buffer)
+        return None
+
+
 class MylistAPIError(Exception):
     """ APIの操作の結果が好ましくない場合に発生させるエラー """
     def __init__(self, code=None, msg=None, ok=False):
@@ -225,17 +314,917 @@ def make_name(data: dict, save_dir: Path, extention: str=None):
     :param str extention: 拡張子
     :rtype: Path
     """
-    ext = data[KeyDmc.MOVIE_TYPE]
-    if extention:
-        ext = extention
+    # getthumbinfo から作った情報には movie_type がないので、拡張子の指定があればそちらを使う
+    ext = extention or data[KeyDmc.MOVIE_TYPE]
     file_name =  Msg.nd_file_name.format(vid=data[KeyDmc.VIDEO_ID], ext=ext, name=data[KeyGTI.FILE_NAME])
     return Path(save_dir).resolve() / file_name
 
 
+class _HostGate:
+    def __init__(self, max_in_flight: int, rate: float=None, burst: int=None):
+        """
+        ひとつのホストに対する同時接続数と、一秒あたりのリクエスト数を制限する。
+
+        :param int max_in_flight: 同時に通信してよい最大数
+        :param float | None rate: 一秒あたりのリクエスト数。 None か 0 なら制限しない。
+        :param int | None burst: トークンバケツの容量。 None なら max_in_flight と同じ。
+        """
+        self.loop = asyncio.get_event_loop()
+        self.semaphore = asyncio.Semaphore(max(1, max_in_flight))
+        self.lock = asyncio.Lock()
+        self.rate = rate
+        self.capacity = max(1, burst or max_in_flight)
+        self.tokens = float(self.capacity)
+        self.stamp = time.monotonic()
+        self.queued = 0
+        self.in_flight = 0
+        self.completed = 0
+
+    async def take_token(self):
+        """ トークンバケツから一つ取り出す。空ならば溜まるまで待つ。 """
+        if not self.rate:
+            return
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class _Slot:
+    def __init__(self, gate: _HostGate, semaphore: asyncio.Semaphore=None):
+        """
+        Governor.slot() が返す非同期コンテキストマネージャー。
+
+        :param _HostGate gate:
+        :param asyncio.Semaphore | None semaphore: 呼び出し元ごとの同時接続数の制限
+        """
+        self.gate = gate
+        self.semaphore = semaphore
+
+    async def __aenter__(self):
+        self.gate.queued += 1
+        try:
+            if self.semaphore is not None:
+                await self.semaphore.acquire()
+            try:
+                await self.gate.semaphore.acquire()
+                try:
+                    await self.gate.take_token()
+                except BaseException:
+                    self.gate.semaphore.release()
+                    raise
+            except BaseException:
+                if self.semaphore is not None:
+                    self.semaphore.release()
+                raise
+        finally:
+            self.gate.queued -= 1
+        self.gate.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.gate.in_flight -= 1
+        self.gate.completed += 1
+        self.gate.semaphore.release()
+        if self.semaphore is not None:
+            self.semaphore.release()
+        return False
+
+
+class Governor:
+    def __init__(self, max_in_flight: int=4, rate: float=None, burst: int=None):
+        """
+        ホストごとに、同時接続数と一秒あたりのリクエスト数を制限する。
+
+        Canopy を継承したクラスの全てがひとつのインスタンスを共有する。
+        使い方:
+
+            async with governor.slot(url):
+                async with session.get(url) as resp:
+                    ...
+
+        :param int max_in_flight: ホストごとに同時に通信してよい最大数
+        :param float | None rate: ホストごとの一秒あたりのリクエスト数。 None か 0 なら制限しない。
+        :param int | None burst: 一度に連続して送ってよいリクエスト数
+        """
+        if max_in_flight < 1:
+            raise ValueError("Invalid max_in_flight: {}".format(max_in_flight))
+        if rate is not None and rate < 0:
+            raise ValueError("Invalid rate: {}".format(rate))
+        self.max_in_flight = max_in_flight
+        self.rate = rate
+        self.burst = burst
+        self.__gates = {}  # type: Dict[str, _HostGate]
+
+    def _gate(self, host: str) -> _HostGate:
+        gate = self.__gates.get(host)
+        if gate is None or gate.loop is not asyncio.get_event_loop():
+            # イベントループが変わった場合は、古いセマフォは使えないので作り直す。
+            new_gate = _HostGate(self.max_in_flight, self.rate, self.burst)
+            if gate is not None:
+                new_gate.completed = gate.completed
+            gate = self.__gates[host] = new_gate
+        return gate
+
+    def slot(self, url: str, semaphore: asyncio.Semaphore=None) -> _Slot:
+        """
+        そのURLのホストへ通信する許可を待つための非同期コンテキストマネージャーを返す。
+
+        :param str url:
+        :param asyncio.Semaphore | None semaphore: 併せて取得するセマフォ
+        :rtype: _Slot
+        """
+        return _Slot(self._gate(urlparse(url).netloc), semaphore)
+
+    @property
+    def queued(self) -> int:
+        return sum(gate.queued for gate in self.__gates.values())
+
+    @property
+    def in_flight(self) -> int:
+        return sum(gate.in_flight for gate in self.__gates.values())
+
+    @property
+    def completed(self) -> int:
+        return sum(gate.completed for gate in self.__gates.values())
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        ホストごとの待機中・通信中・完了済みのリクエストの数を返す。
+
+        :rtype: Dict[str, Dict[str, int]]
+        """
+        return {host: {"queued": gate.queued, "in_flight": gate.in_flight, "completed": gate.completed}
+                for host, gate in self.__gates.items()}
+
+
+class AdaptiveLimiter:
+    def __init__(self, interval: float=0.1, maximum: float=8.0, factor: float=2.0,
+                 clock: Callable[[], float]=time.monotonic):
+        """
+        リクエストとリクエストの間を空ける。
+
+        混雑や上限を示すエラーが返ってきたときだけ間隔を広げ、成功するたびに元の間隔まで戻していく。
+        使い方:
+
+            await limiter.wait()
+            res = ...
+            if 混雑を示すエラー:
+                limiter.back_off()
+            elif 成功:
+                limiter.relax()
+
+        :param float interval: 最も短い間隔 (秒)
+        :param float maximum: 最も長い間隔 (秒)
+        :param float factor: 間隔を広げる (狭める) ときの倍率
+        :param clock: 時刻を返す関数
+        """
+        if interval <= 0 or maximum < interval or factor <= 1:
+            raise ValueError("Invalid interval: {}, maximum: {}, factor: {}".format(interval, maximum, factor))
+        self.minimum = interval
+        self.maximum = maximum
+        self.factor = factor
+        self.interval = interval
+        self.clock = clock
+        self.last = None  # type: Optional[float]
+        self.back_offs = 0
+
+    async def wait(self) -> None:
+        """ 前のリクエストから interval 秒たつまで待つ。 """
+        if self.last is not None:
+            delay = self.last + self.interval - self.clock()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        self.last = self.clock()
+
+    def back_off(self) -> None:
+        self.back_offs += 1
+        self.interval = min(self.maximum, self.interval * self.factor)
+
+    def relax(self) -> None:
+        self.interval = max(self.minimum, self.interval / self.factor)
+
+
+def parse_size(text: str) -> Optional[float]:
+    """
+    "500K" や "2M" のような大きさ (バイト, 1K = 1024) を数にする。 "0" や空なら None (制限しない)。
+
+    :param str text: 大きさを表す文字列
+    :rtype: float | None
+    """
+    text = text.strip().upper().rstrip("B")
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    scale = units.get(text[-1:], 1)
+    if text[-1:] in units:
+        text = text[:-1]
+    if not text:
+        return None
+    value = float(text) * scale
+    if value < 0:
+        raise ValueError("Invalid size: {}".format(text))
+    return value or None
+
+
+def parse_schedule(text: str) -> List[Tuple[int, int, Optional[float]]]:
+    """
+    "01:00-07:00=0,07:00-01:00=2M" のような時間帯ごとの上限を、
+    (始まりの分, 終わりの分, バイト毎秒) の組のリストにする。 終わりが始まりより前なら日をまたぐ。
+
+    :param str text: 時間帯ごとの上限
+    :rtype: List[Tuple[int, int, float | None]]
+    """
+    def minutes(clock: str) -> int:
+        hour, minute = clock.strip().split(":")
+        if not (0 <= int(hour) <= 24 and 0 <= int(minute) < 60):
+            raise ValueError("Invalid time: {}".format(clock))
+        return int(hour) * 60 + int(minute)
+
+    schedule = []
+    for part in text.split(","):
+        if not part.strip():
+            continue
+        span, rate = part.split("=")
+        begin, end = span.split("-")
+        schedule.append((minutes(begin), minutes(end), parse_size(rate)))
+    return schedule
+
+
+class TokenBucket:
+    def __init__(self, rate: Optional[float]=None, burst: Optional[float]=None):
+        """
+        バイト数を数えるトークンバケツ。
+
+        先に使った分を借りにしておき、借りを返せるまでの秒数を返す。
+        待つ側はその時間だけ眠ればよいので、ロックも待ち行列も要らない。
+
+        :param float | None rate: 一秒あたりのバイト数。 None か 0 なら制限しない。
+        :param float | None burst: トークンバケツの容量。 None なら一秒分。
+        """
+        self.rate = None  # type: Optional[float]
+        self.burst = burst
+        self.capacity = 0.0
+        self.tokens = 0.0
+        self.stamp = time.monotonic()
+        self.set_rate(rate)
+        # はじめは満杯にしておく
+        self.tokens = self.capacity
+
+    def set_rate(self, rate: Optional[float]) -> None:
+        """
+        一秒あたりのバイト数を変える。 溜まっていた分は新しい容量を超えない。
+
+        :param float | None rate: 一秒あたりのバイト数。 None か 0 なら制限しない。
+        """
+        if rate is not None and rate < 0:
+            raise ValueError("Invalid rate: {}".format(rate))
+        self.rate = rate or None
+        self.capacity = float(self.burst or rate or 0)
+        self.tokens = min(self.tokens, self.capacity) if self.rate else 0.0
+
+    def take(self, size: int, now: float) -> float:
+        """
+        size バイトを使い、使いすぎた分を返せるまでの秒数を返す。
+
+        :param int size: 使うバイト数
+        :param float now: 今の時刻
+        :rtype: float
+        """
+        if self.rate is None:
+            return 0.0
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        self.tokens -= size
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+
+class ByteLimiter:
+    def __init__(self, rate: Optional[float]=None, per_video: Optional[float]=None,
+                 schedule: Optional[List[Tuple[int, int, Optional[float]]]]=None,
+                 control_file: Optional[Union[str, Path]]=None, interval: float=1.0,
+                 clock: Callable[[], float]=time.monotonic, now: Callable[[], datetime]=datetime.now):
+        """
+        動画のダウンロード全体で、一秒あたりに受け取るバイト数を制限する。
+
+        Canopy を通して VideoSmile と VideoDmc の全ての担当者がひとつのインスタンスを共有し、
+        受け取った分だけ consume() を呼ぶ。 per_video を指定すると、動画ごとの上限も設ける。
+
+        全体の上限は、次の順に決める。 確かめるのは interval 秒に一度だけ。
+
+        1. control_file があれば、その中身 ("2M" など。 "0" なら制限しない)。 書き換えればすぐに変わる。
+        2. schedule のうち、今の時刻を含む時間帯のもの
+        3. rate
+
+        reload() を呼ぶと (download のコマンドでは SIGUSR1 を受け取ると)、次の consume() で確かめ直す。
+
+        使い方:
+
+            cap = limiter.cap()
+            ...
+            await limiter.consume(len(data), cap)
+
+        :param float | None rate: 全体の一秒あたりのバイト数。 None なら制限しない。
+        :param float | None per_video: 動画ごとの一秒あたりのバイト数。 None なら制限しない。
+        :param schedule: parse_schedule() が返す、時間帯ごとの上限
+        :param str | Path | None control_file: 上限を書いておくファイル
+        :param float interval: 上限が変わっていないか確かめる間隔 (秒)
+        :param clock: 時刻を返す関数
+        :param now: 今の日時を返す関数 (時間帯を決めるのに使う)
+        """
+        self.rate = rate
+        self.per_video = per_video
+        self.schedule = schedule or []
+        self.control_file = Path(control_file) if control_file else None
+        self.interval = interval
+        self.clock = clock
+        self.now = now
+        self.bucket = TokenBucket(rate)
+        self.waited = 0.0
+        self.__checked_at = None  # type: Optional[float]
+        self.__stamp = None  # type: Optional[float]
+        self.__controlled = None  # type: Optional[float]
+
+    def cap(self) -> Optional[TokenBucket]:
+        """
+        動画ひとつ分の上限を返す。 動画ごとの上限がなければ None。
+
+        :rtype: TokenBucket | None
+        """
+        return TokenBucket(self.per_video) if self.per_video else None
+
+    def reload(self) -> None:
+        """ 次に consume() を呼んだときに、上限を確かめ直す。 シグナルハンドラーから呼んでよい。 """
+        self.__checked_at = None
+        self.__stamp = None
+
+    def current_rate(self) -> Optional[float]:
+        """
+        今の全体の上限を決める。
+
+        :rtype: float | None
+        """
+        if self.control_file is not None:
+            try:
+                stamp = self.control_file.stat().st_mtime
+                if stamp != self.__stamp:
+                    self.__controlled = parse_size(self.control_file.read_text(encoding="utf-8"))
+                    self.__stamp = stamp
+                return self.__controlled
+            except (OSError, ValueError):
+                # 読めなければ、ファイルがないものとして扱う
+                self.__stamp = None
+        if self.schedule:
+            moment = self.now()
+            minute = moment.hour * 60 + moment.minute
+            for begin, end, rate in self.schedule:
+                if begin <= minute < end or (end < begin and (minute >= begin or minute < end)):
+                    return rate
+        return self.rate
+
+    async def consume(self, size: int, cap: Optional[TokenBucket]=None) -> None:
+        """
+        size バイトを受け取ったことを伝え、上限を超えていれば、その分だけ待つ。
+
+        :param int size: 受け取ったバイト数
+        :param TokenBucket | None cap: cap() が返した、その動画の上限
+        :rtype: None
+        """
+        now = self.clock()
+        if self.__checked_at is None or now - self.__checked_at >= self.interval:
+            self.__checked_at = now
+            rate = self.current_rate()
+            if rate != self.bucket.rate:
+                self.bucket.set_rate(rate)
+        wait = self.bucket.take(size, now)
+        if cap is not None:
+            wait = max(wait, cap.take(size, now))
+        if wait > 0:
+            self.waited += wait
+            await asyncio.sleep(wait)
+
+
+class RetryPolicy:
+    # やり直す応答のステータスコードと、その失敗の種類
+    STATUS = {408: "timeout", 429: "throttled", 500: "server", 502: "server", 503: "throttled", 504: "server"}
+
+    def __init__(self, retries: int=3, base: float=1.0, factor: float=2.0, cap: float=60.0,
+                 deadline: Optional[float]=None, rules: Optional[Dict[str, int]]=None, resumes: int=16,
+                 clock: Callable[[], float]=time.monotonic, randomness: Callable[[], float]=random.random):
+        """
+        失敗したリクエストをやり直すかどうかと、やり直すまでの待ち時間を決める。
+
+        待ち時間は、回数に応じて指数的に伸ばした上限 (base * factor ** 回数, ただし cap まで) から
+        一様に選ぶ (full jitter)。 応答に Retry-After があれば、少なくともその時間は待つ。
+        最初の試行から deadline 秒を過ぎてしまうなら、やり直さずに諦める。
+
+        失敗は次の種類に分け、 rules で種類ごとにやり直す回数を変えられる。
+        これ以外 (404 など) はやり直さない。
+
+        call に progress (どこまで受け取ったかを返す関数) を渡したときは、
+        前の試行から少しでも先に進んでいれば、待たずに続きから取りに行く。
+        このときはやり直しの回数に数えないが、 resumes 回を超えたら普通のやり直しに戻る。
+        続きから取りに行っても締め切りは延びず、最初の試行から deadline 秒を過ぎたら諦める。
+
+        * throttled: 429, 503 (混雑している)
+        * server: 500, 502, 504
+        * timeout: 時間切れ, 408
+        * connection: 接続が切れた、本文が途中で途切れた
+
+        使い方:
+
+            async def attempt(number):
+                async with session.get(url, trace_request_ctx=Tracer.tag(stage, number)) as resp:
+                    resp.raise_for_status()
+                    return await resp.read()
+
+            body = await policy.call(attempt, logger, video_id)
+
+        :param int retries: やり直す最大の回数
+        :param float base: 最初にやり直すときの待ち時間の上限 (秒)
+        :param float factor: やり直すたびに待ち時間の上限を伸ばす倍率
+        :param float cap: 待ち時間の上限の最大値 (秒)
+        :param float | None deadline: 最初の試行からこれだけの秒数を過ぎたら諦める。 None なら制限しない。
+        :param dict[str, int] | None rules: {失敗の種類: やり直す最大の回数}
+        :param int resumes: 先に進んでいたときに、待たずに続きから取りに行く最大の回数
+        :param clock: 時刻を返す関数
+        :param randomness: 0 以上 1 未満の数を返す関数
+        """
+        if retries < 0 or base < 0 or factor < 1 or cap < base or resumes < 0:
+            raise ValueError("Invalid retries: {}, base: {}, factor: {}, cap: {}, resumes: {}".format(
+                retries, base, factor, cap, resumes))
+        self.retries = retries
+        self.base = base
+        self.factor = factor
+        self.cap = cap
+        self.deadline = deadline
+        self.rules = rules or {}
+        self.resumes = resumes
+        self.clock = clock
+        self.randomness = randomness
+        self.retried = 0
+        self.gave_up = 0
+        self.resumed = 0
+
+    def classify(self, error: BaseException) -> Optional[str]:
+        """
+        失敗の種類を返す。 やり直すべきでない失敗なら None。
+
+        :param BaseException error: 起きた例外
+        :rtype: str | None
+        """
+        # aiohttp は通信するときにしか要らないので、ここで読み込む
+        import aiohttp
+
+        if isinstance(error, aiohttp.ClientResponseError):
+            return self.STATUS.get(error.status)
+        if isinstance(error, asyncio.TimeoutError):
+            return "timeout"
+        if isinstance(error, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, ConnectionError)):
+            return "connection"
+        return None
+
+    @staticmethod
+    def retry_after(error: BaseException) -> Optional[float]:
+        """
+        応答の Retry-After (秒数か日時) から、待つべき秒数を返す。 なければ None。
+
+        :param BaseException error: 起きた例外
+        :rtype: float | None
+        """
+        headers = getattr(error, "headers", None)
+        value = headers.get("Retry-After") if headers else None
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            moment = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return max(0.0, (moment - datetime.now(timezone.utc)).total_seconds())
+
+    def delay(self, attempt: int, retry_after: Optional[float]=None) -> float:
+        """
+        attempt 回目のやり直しの前に待つ秒数を返す。
+
+        :param int attempt: 何回目のやり直しか (最初は 0)
+        :param float | None retry_after: サーバーが指定した待ち時間
+        :rtype: float
+        """
+        wait = self.randomness() * min(self.cap, self.base * self.factor ** attempt)
+        if retry_after is not None:
+            wait = max(wait, retry_after)
+        return wait
+
+    def plan(self, error: BaseException, attempt: int, elapsed: float) -> Optional[float]:
+        """
+        やり直すなら待つ秒数を、諦めるなら None を返す。
+
+        :param BaseException error: 起きた例外
+        :param int attempt: これまでにやり直した回数
+        :param float elapsed: 最初の試行からの経過時間
+        :rtype: float | None
+        """
+        kind = self.classify(error)
+        if kind is None:
+            return None
+        wait = self.delay(attempt, self.retry_after(error))
+        if (attempt >= self.rules.get(kind, self.retries) or
+                (self.deadline is not None and elapsed + wait > self.deadline)):
+            self.gave_up += 1
+            return None
+        return wait
+
+    async def call(self, func: Callable[[int], Awaitable[Any]], logger=None, name: str="",
+                   progress: Optional[Callable[[], int]]=None) -> Any:
+        """
+        func を、成功するか諦めるまで繰り返し呼ぶ。 諦めたときは最後の例外をそのまま投げる。
+
+        :param func: 何回目のやり直しか (最初は 0) を受け取るコルーチン関数
+        :param NTLogger | None logger: やり直すことを知らせるロガー
+        :param str name: ログに出す、対象の名前
+        :param progress: どこまで受け取ったか (バイト数など) を返す関数
+        :return: func の返り値
+        """
+        began = self.clock()
+        attempt = 0
+        mark = progress() if progress else None
+        resumed = 0
+        while True:
+            try:
+                return await func(attempt)
+            except Exception as error:
+                position = progress() if progress else None
+                elapsed = self.clock() - began
+                if (position != mark and resumed < self.resumes and self.classify(error) is not None
+                        and (self.deadline is None or elapsed < self.deadline)):
+                    # 前の試行から先に進んでいたので、回数と待ち時間だけを数え直して続きを取りに行く
+                    mark = position
+                    resumed += 1
+                    self.resumed += 1
+                    attempt = 0
+                    if logger is not None:
+                        logger.warning(Msg.nd_resuming.format(
+                            name=name, error=repr(error), position=position, count=resumed))
+                    continue
+                wait = self.plan(error, attempt, elapsed)
+                if wait is None:
+                    raise
+                self.retried += 1
+                attempt += 1
+                if logger is not None:
+                    logger.warning(Msg.nd_retrying.format(name=name, error=repr(error), wait=wait, attempt=attempt))
+                await asyncio.sleep(wait)
+
+
+class StageMetrics:
+    def __init__(self, clock=time.monotonic):
+        """
+        段階ごとに分かれた処理の、段階ごとの所要時間と全体の処理量を記録する。
+
+        使い方:
+
+            metrics.start()
+            ...
+            metrics.record("video", latency, waited)
+            metrics.complete()
+            ...
+            metrics.stop()
+
+        :param clock: 時刻を返す関数
+        """
+        self.clock = clock
+        self.began = None  # type: Optional[float]
+        self.ended = None  # type: Optional[float]
+        self.completed = 0
+        self.__latencies = {}  # type: Dict[str, List[float]]
+        self.__waits = {}  # type: Dict[str, List[float]]
+
+    def start(self) -> None:
+        self.began = self.clock()
+        self.ended = None
+
+    def stop(self) -> None:
+        self.ended = self.clock()
+
+    def record(self, stage: str, latency: float, waited: float=0) -> None:
+        """
+        ひとつの動画がひとつの段階を終えたことを記録する。
+
+        :param str stage: 段階の名前
+        :param float latency: その段階の処理にかかった秒数
+        :param float waited: その段階の列で待っていた秒数
+        """
+        self.__latencies.setdefault(stage, []).append(latency)
+        self.__waits.setdefault(stage, []).append(waited)
+
+    def complete(self) -> None:
+        """ ひとつの動画がすべての段階を終えたことを記録する。 """
+        self.completed += 1
+
+    @property
+    def elapsed(self) -> float:
+        if self.began is None:
+            return 0
+        return (self.ended if self.ended is not None else self.clock()) - self.began
+
+    @property
+    def throughput(self) -> float:
+        """ 一秒あたりにすべての段階を終えた動画の数 """
+        elapsed = self.elapsed
+        return self.completed / elapsed if elapsed > 0 else 0
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        段階ごとの件数と、所要時間の平均・95パーセンタイル・最大、列で待っていた時間の平均を返す。
+
+        :rtype: Dict[str, Dict[str, float]]
+        """
+        result = {}
+        for stage, latencies in self.__latencies.items():
+            ordered = sorted(latencies)
+            waits = self.__waits[stage]
+            result[stage] = {
+                "count": len(ordered),
+                "mean" : sum(ordered) / len(ordered),
+                "p95"  : ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                "max"  : ordered[-1],
+                "wait" : sum(waits) / len(waits),
+            }
+        return result
+
+
+class Assignment:
+    def __init__(self, begin: int, end: int):
+        """
+        ChunkScheduler が担当者に渡す区間。
+
+        position はこれから書き込む位置で、担当者が進める。
+        end は他の担当者に後ろ半分を譲ると縮む。
+
+        :param int begin: 区間の始まり
+        :param int end: 区間の終わり (この位置も含む)
+        """
+        self.begin = begin
+        self.end = end
+        self.position = begin
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.end - self.position + 1)
+
+    def __repr__(self):
+        return f"<Assignment {self.position}-{self.end}>"
+
+
+class ChunkScheduler:
+    def __init__(self,
+                 missing: List[Tuple[int, int]],
+                 workers: int=4,
+                 max_workers: int=None,
+                 chunk_size: int=None,
+                 block: int=64 * 1024,
+                 ):
+        """
+        分割ダウンロードの区間を、共有の列から小分けにして担当者へ配る。
+
+        列が空になった後で手の空いた担当者がいれば、残りの最も大きい区間の後ろ半分を譲り受ける。
+        区間の切れ目は block の倍数にそろえる。
+        また、接続ごとの速さを測り、速さが落ちない間は担当者を増やし、落ちたら減らす。
+        担当者の番号は join() で受け取る。 番号は target より小さいうちの空いているものを使い回すので、
+        減らしたあとで増やしても、新しい担当者はすぐに働ける。
+
+        :param List[Tuple[int, int]] missing: ダウンロードする区間。終わりの位置も含む。
+        :param int workers: 最初の担当者の数
+        :param int | None max_workers: 担当者の数の上限。 None なら workers の2倍。
+        :param int | None chunk_size: 一度に配る大きさ。 None なら全体と担当者の数から決める。
+        :param int block: 区間の切れ目をそろえる単位
+        """
+        if workers < 1:
+            raise ValueError("workers must be 1 or more.")
+        self.block = block
+        self.max_workers = max(workers, max_workers or workers * 2)
+        self.target = workers
+        # 働いている担当者の番号
+        self.slots = set()  # type: Set[int]
+        self.active = {}  # type: Dict[int, Assignment]
+        self.window = []  # type: List[float]
+        self.last_rate = None  # type: Optional[float]
+        total = sum(end - begin + 1 for begin, end in missing)
+        if chunk_size is None:
+            chunk_size = min(8 * 1024 * 1024, total // (workers * 4))
+        self.chunk_size = max(block, chunk_size // block * block)
+        self.pending = []  # type: List[Tuple[int, int]]
+        for begin, end in missing:
+            position = begin
+            while position <= end:
+                # 次の切れ目を block の倍数にそろえる
+                cut = min(end, (position + self.chunk_size) // block * block - 1)
+                self.pending.append((position, cut))
+                position = cut + 1
+
+    @property
+    def remaining(self) -> int:
+        """ まだ書いていない大きさ """
+        return (sum(end - begin + 1 for begin, end in self.pending)
+                + sum(assignment.remaining for assignment in self.active.values()))
+
+    def join(self) -> Optional[int]:
+        """
+        新しい担当者に、 target より小さいうちで最も小さい空いた番号を渡す。 空きがなければ None。
+
+        :rtype: Optional[int]
+        """
+        for number in range(self.target):
+            if number not in self.slots:
+                self.slots.add(number)
+                return number
+        return None
+
+    def leave(self, number: int) -> None:
+        """
+        担当者が終わったので、その番号を空ける。
+
+        :param int number: 何番目の担当者か
+        """
+        self.slots.discard(number)
+
+    def retire(self, number: int) -> bool:
+        """
+        担当者の数を減らしたので、この担当者はもう終わってよいか。 終わってよければ番号を空ける。
+
+        :param int number: 何番目の担当者か
+        :rtype: bool
+        """
+        if number >= self.target:
+            self.leave(number)
+            return True
+        return False
+
+    def take(self, number: int) -> Optional[Assignment]:
+        """
+        次に受け持つ区間を返す。 何もなければ None を返す。
+
+        :param int number: 何番目の担当者か
+        :rtype: Optional[Assignment]
+        """
+        if self.pending:
+            assignment = Assignment(*self.pending.pop(0))
+        else:
+            assignment = self._steal()
+        if assignment is not None:
+            self.active[number] = assignment
+        return assignment
+
+    def _steal(self) -> Optional[Assignment]:
+        if not self.active:
+            return None
+        victim = max(self.active.values(), key=lambda a: a.remaining)
+        if victim.remaining < self.block * 2:
+            return None
+        middle = (victim.position + victim.remaining // 2 + self.block - 1) // self.block * self.block
+        if not victim.position < middle <= victim.end:
+            return None
+        stolen = Assignment(middle, victim.end)
+        victim.end = middle - 1
+        return stolen
+
+    def release(self, number: int, size: int, seconds: float) -> bool:
+        """
+        担当者が区間を手放す。 書ききれなかった部分は列に戻す。
+
+        size バイトを seconds 秒で書いたことから担当者の数を調整する。
+        担当者を増やすべきなら True を返す。
+
+        :param int number: 何番目の担当者か
+        :param int size: 書いた大きさ
+        :param float seconds: かかった時間
+        :rtype: bool
+        """
+        assignment = self.active.pop(number, None)
+        if assignment is not None and assignment.remaining:
+            self.pending.insert(0, (assignment.position, assignment.end))
+        if size <= 0 or seconds <= 0:
+            return False
+        self.window.append(size / seconds)
+        if len(self.window) < self.target:
+            return False
+        rate = sum(self.window) / len(self.window)
+        self.window = []
+        previous, self.last_rate = self.last_rate, rate
+        if previous is None or rate >= previous * 0.9:
+            # 接続を増やしても一本あたりの速さが落ちないうちは増やす
+            if self.target < self.max_workers and self.pending:
+                self.target += 1
+                return True
+        elif rate < previous * 0.7 and self.target > 1:
+            self.target -= 1
+        return False
+
+
 class Canopy:
-    def __init__(self, loop: asyncio.AbstractEventLoop=None, logger=None):
+    # 全てのサブクラスで共有する、ホストごとのアクセス制限
+    __governor = None  # type: Governor
+    # 全てのサブクラスで共有する、リクエストの記録係 (nicotools.tracer.Tracer)
+    __tracer = None
+    # 全てのサブクラスで共有する、失敗したリクエストをやり直す方針
+    __retry_policy = None  # type: RetryPolicy
+    # 全てのサブクラスで共有する、動画を受け取る速さの制限。 None なら制限しない。
+    __byte_limiter = None  # type: Optional[ByteLimiter]
+
+    def __init__(self, loop: asyncio.AbstractEventLoop=None, logger=None, limit: int=None):
+        """
+        :param asyncio.AbstractEventLoop loop: イベントループ
+        :param NTLogger logger: ロガー
+        :param int | None limit: このインスタンスから同時にアクセスする最大数
+        """
         self.logger = self.get_logger(logger)  # type: NTLogger
         self.loop = loop or asyncio.get_event_loop()  # type: asyncio.AbstractEventLoop
+        self.__limit = limit
+        self.__semaphore = None  # type: asyncio.Semaphore
+        self.__retry = None  # type: Optional[RetryPolicy]
+
+    @classmethod
+    def get_governor(cls) -> Governor:
+        if Canopy.__governor is None:
+            Canopy.__governor = Governor()
+        return Canopy.__governor
+
+    @classmethod
+    def set_governor(cls, governor: Governor) -> None:
+        Canopy.__governor = governor
+
+    @property
+    def governor(self) -> Governor:
+        return self.get_governor()
+
+    @classmethod
+    def get_retry_policy(cls) -> RetryPolicy:
+        if Canopy.__retry_policy is None:
+            Canopy.__retry_policy = RetryPolicy()
+        return Canopy.__retry_policy
+
+    @classmethod
+    def set_retry_policy(cls, policy: RetryPolicy) -> None:
+        Canopy.__retry_policy = policy
+
+    @property
+    def retry(self) -> RetryPolicy:
+        """ このインスタンスだけの方針があればそれを、なければ全体で共有する方針を返す。 """
+        return self.__retry or self.get_retry_policy()
+
+    @retry.setter
+    def retry(self, policy: Optional[RetryPolicy]) -> None:
+        self.__retry = policy
+
+    @classmethod
+    def get_byte_limiter(cls) -> Optional[ByteLimiter]:
+        return Canopy.__byte_limiter
+
+    @classmethod
+    def set_byte_limiter(cls, limiter: Optional[ByteLimiter]) -> None:
+        Canopy.__byte_limiter = limiter
+
+    @classmethod
+    def get_tracer(cls):
+        return Canopy.__tracer
+
+    @classmethod
+    def set_tracer(cls, tracer) -> None:
+        """
+        :param nicotools.tracer.Tracer | None tracer: リクエストの記録係。 None なら記録しない。
+        """
+        Canopy.__tracer = tracer
+
+    def trace_configs(self, stage: str=None) -> List:
+        """
+        セッションを作るときに渡す trace_configs を返す。 記録係がいなければ空のリスト。
+
+        :param str | None stage: 目印のないリクエストに使う段階の名前
+        :rtype: List[aiohttp.TraceConfig]
+        """
+        tracer = self.get_tracer()
+        return [tracer.config(stage)] if tracer is not None else []
+
+    def slot(self, url: str) -> _Slot:
+        """
+        インスタンスごとの同時接続数と、全体で共有するホストごとの制限の両方を待つ。
+
+        :param str url: アクセスする先
+        :rtype: _Slot
+        """
+        if self.__limit and self.__semaphore is None:
+            # セマフォはイベントループの中で作る
+            self.__semaphore = asyncio.Semaphore(self.__limit)
+        return self.governor.slot(url, self.__semaphore)
 
     def get_logger(self, logger):
         """
@@ -293,6 +1282,9 @@ class LogIn:
         :param dict[str, str] | None auth:
         :rtype: requests.Session
         """
+        # requests はログインするときだけ使うので、ここで読み込む
+        import requests
+        from requests import cookies
 
         session = requests.session()
         cook = self.load_cookies()
@@ -413,6 +1405,14 @@ class NTLogger(logging.Logger):
         logging.Logger.__init__(self, name, log_level)
         self.logger = logging.getLogger(name=name)
 
+        # 文字コードはログを出すたびに調べずに、ここで一度だけ決めておく。
+        # UTF-8 ならどんな文字でも書けるので、置き換える必要はない。
+        self.encoding = get_encoding()
+        try:
+            self.__needs_escape = codecs.lookup(self.encoding).name != "utf-8"
+        except LookupError:
+            self.__needs_escape = True
+
         # 標準出力用ハンドラー
         log_stdout = logging.StreamHandler(sys.stdout)
         log_stdout.setLevel(log_level)
@@ -450,24 +1450,32 @@ class NTLogger(logging.Logger):
         return fmt
 
     def forwarding(self, level, msg, *args, **kwargs):
-        _enco = get_encoding()
+        # 出力されないログのためには何もしない
+        if not self.isEnabledFor(level):
+            return
         if self.is_debug:
             # [YYYY-MM-DD hh:mm:ss,ms| level |line:n|<...> from <...> from <...>]\t{message}
-            history = inspect.stack()
-            funcs = "line:{}|{}".format(
-                # ログを呼び出した場所の行数
-                history[2][2],
-                # ログを呼び出した関数の名前をつなげる
-                " from ".join(["<{}>".format(item[3]) for item in history[2:5]])
-            )
+            # inspect.stack() はすべてのフレームのソースを読みに行くので遅い。
+            # ここから二つ上 (debug() などを呼んだ場所) から順に、三つまでのフレームだけを見る。
+            frame = sys._getframe(2)
+            lineno = frame.f_lineno
+            names = []
+            while frame is not None and len(names) < 3:
+                names.append("<{}>".format(frame.f_code.co_name))
+                frame = frame.f_back
+            funcs = "line:{}|{}".format(lineno, " from ".join(names))
             if level <= logging.DEBUG:
                 msg = funcs + "]\t" + str(msg)
             else:
                 msg = funcs + "]\t\t" + str(msg)
-        _msg = str(msg).encode(_enco, BACKSLASH).decode(_enco)
-        _args = tuple([item.encode(_enco, BACKSLASH).decode(_enco)
-                       if isinstance(item, str) else item for item in args[0]])
-        self._log(level, _msg, _args, **kwargs)
+        if self.__needs_escape:
+            _enco = self.encoding
+            msg = str(msg).encode(_enco, BACKSLASH).decode(_enco)
+            args = tuple([item.encode(_enco, BACKSLASH).decode(_enco)
+                          if isinstance(item, str) else item for item in args[0]])
+        else:
+            args = args[0]
+        self._log(level, msg, args, **kwargs)
 
     def debug(self, msg, *args, **kwargs): self.forwarding(logging.DEBUG, msg, args, **kwargs)
 
@@ -515,7 +1523,7 @@ class URL:
 class Msg:
     """メッセージ集"""
 
-    description = ("nicotools downlaod --help または nicotools mylist --help"
+    description = ("nicotools downlaod --help, nicotools mylist --help または nicotools verify --help"
                    " で各コマンドのヘルプを表示します。")
 
     ''' マイリスト編集コマンドのヘルプメッセージ '''
@@ -545,6 +1553,11 @@ class Msg:
                           "全てのマイリストの情報をまとめて取得します。")
     ml_help_yes = ("これを指定すると、マイリスト自体の削除や"
                    "マイリスト内の全項目の削除の時に確認しません。")
+    ml_help_sync = ("ファイルに一行ずつ書いた動画IDの通りになるように、"
+                    "マイリストに追加・削除・移動します。 「マイリスト名<タブ>動画ID」と書いた行は"
+                    "そのマイリストに入り、 名前の代わりに * を指定するとこの形の行だけを扱います。")
+    ml_help_dry_run = ("--sync と同時に指定すると、実行せずに 計画と"
+                       "APIの呼び出し回数の見積もりだけを出力します。")
 
     ''' 動画ダウンロードコマンドのヘルプメッセージ '''
     nd_description = "動画のいろいろをダウンロードします。"
@@ -566,6 +1579,30 @@ class Msg:
     nd_help_limit = ("サムネイルとコメントについては同時ダウンロードを、"
                      "動画については1つあたりの分割数をこの数に制限します。標準は 4 です。")
     nd_help_smile = "動画をsmileサーバー(いわゆる従来サーバー)からダウンロードします。"
+    nd_help_rate = ("ひとつのサーバーへ 一秒あたりに送るリクエストの数の上限。"
+                    "標準は 0 で、制限しません。")
+    nd_help_inflight = "ひとつのサーバーへ同時に接続する数の上限。標準は 4 です。"
+    nd_help_no_cache = "動画の情報をキャッシュから読まず、保存もしません。"
+    nd_help_columnar = "コメントを列ごとにまとめた圧縮形式 (.chats) で保存します。"
+    nd_help_incremental = "保存済みのコメントより新しいものだけを取りに行き、ファイルに書き足します。"
+    nd_help_bandwidth = ("動画を受け取る速さの、全体での上限 (バイト毎秒)。 "
+                         "500K や 2M のように指定します。")
+    nd_help_bandwidth_per_video = "動画を受け取る速さの、動画ごとの上限 (バイト毎秒)。"
+    nd_help_bandwidth_schedule = ("時間帯ごとの全体での上限。 例: 01:00-07:00=0,07:00-01:00=2M "
+                                  "(0 は制限なし)。 指定のない時間帯は --bandwidth に従います。")
+    nd_help_bandwidth_file = ("全体での上限を書いておくファイル。 ダウンロードの途中でも書き換えればすぐに反映され、 "
+                              "時間帯や --bandwidth より優先します。 SIGUSR1 を送ると読み直します。")
+    nd_help_overwrite = ("保存済みのファイルがあっても、すべてを取りに行って上書きします。 "
+                         "指定しなければ、サーバーと同じ大きさの動画と、変わっていないサムネイルは取りに行かず、 "
+                         "コメントは新しいものだけを書き足します。")
+    nd_help_wayback = "過去ログを最初のコメントまでさかのぼって .chats 形式で保存します。"
+    nd_help_parallel = "DMCサーバーから同時にダウンロードする動画の数。標準は 3 です。"
+    nd_help_connections = "動画のダウンロードで同時に張る接続の数の上限。標準は 16 です。"
+    nd_help_trace = "通信ごとの所要時間などを、一行にひとつのJSONとしてこのファイルに書き出します。"
+    nd_help_retries = ("接続が切れたり サーバーが混雑していたりしたときに、"
+                       "ひとつのリクエストをやり直す回数の上限。標準は 3 です。")
+    nd_help_deadline = ("ひとつのリクエストをやり直し続けてよい時間 (秒)。"
+                        "標準では制限しません。")
 
     input_mail = "メールアドレスを入力してください。"
     input_pass = "パスワードを入力してください(画面には表示されません)。"
@@ -573,14 +1610,29 @@ class Msg:
     ''' ログに書くメッセージ '''
     nd_start_download = "{count} 件の情報を取りに行きます。: {ids}"
     nd_download_done = "{path} に保存しました。"
+    nd_resume_video = "{path} のダウンロードを続きから再開します。({done}/{size} バイト済み)"
     nd_download_video = "({0}/{1}) ID: {2} ({3}) の動画をダウンロードします。"
     nd_download_pict = "({0}/{1}) ID: {2} ({3}) のサムネイルをダウンロードします。"
     nd_download_comment = "({0}/{1}) ID: {2} ({3}) のコメントをダウンロードします。"
+    nd_comment_incremental = "ID: {0} の新しいコメントは {1} 件でした。"
+    nd_skip_present = "[スキップ] {path} はすでにサーバーと同じ大きさで保存されています。"
+    nd_skip_unchanged = "[スキップ] {path} はサーバー上で変わっていません。"
+    nd_comment_wayback = "ID: {0} の過去ログを {1} 件保存しました。"
     nd_start_dl_video = "{count} 件の動画をダウンロードします。: {ids}"
     nd_start_dl_pict = "{count} 件のサムネイルをダウンロードします。: {ids}"
     nd_start_dl_comment = "{count} 件のコメントをダウンロードします。: {ids}"
     nd_file_name = "{vid}_{name}.{ext}"
     nd_deleted_or_private = "{0} は削除されているか、非公開です。"
+    nd_governor_stats = "通信の状況 ({host}): 待機中 {queued}, 通信中 {in_flight}, 完了 {completed}"
+    nd_stage_stats = ("段階 {stage}: {count} 件, 平均 {mean:.2f} 秒, 95% {p95:.2f} 秒,"
+                      " 最大 {max:.2f} 秒, 列での待ち 平均 {wait:.2f} 秒")
+    nd_pipeline_stats = "全体: {completed} 件を {elapsed:.1f} 秒で処理しました。 ({throughput:.2f} 件/秒)"
+    nd_trace_summary = "通信の記録:\n{0}"
+    nd_trace_written = "{count} 件の通信の記録を {path} に書き出しました。"
+    nd_retrying = "[再試行] {name}: {error} のため、 {wait:.1f} 秒後にやり直します。 ({attempt}回目)"
+    nd_resuming = "[再開] {name}: {error} のため、 {position} バイト目から続きを取りに行きます。 ({count}回目)"
+    nd_cache_stats = ("キャッシュ: ヒット {hits}, ミス {misses} (うち期限切れ {expired}),"
+                      " 破棄 {evicted}, 保存数 {entries}")
 
     ml_exported = "{0} に出力しました。"
     ml_items_counts = "含まれる項目の数:"
@@ -609,6 +1661,17 @@ class Msg:
     ml_will_copy = "[作業内容:コピー] {0} から {1} へ, 動画ID: {2}"
     ml_will_move = "[作業内容:移動] {0} から {1} へ, 動画ID: {2}"
     ml_will_purge = "[作業内容:マイリスト削除] マイリスト「{0}」を完全に削除します。"
+    ml_sync_kept = "[作業内容:維持] {0} の {1}件はそのままにします。"
+    ml_sync_calls = "APIの呼び出し回数の見積もり: {all}回 (中身の取得 {fetch}回, 変更 {mutate}回)"
+    ml_sync_nothing = "マイリストはすでに指定した通りの中身です。"
+
+    ''' 検証コマンドのメッセージ '''
+    vf_description = ("ダウンロードしたときに記録した大きさとハッシュの通りか、"
+                      "フォルダーの中のファイルを確かめます。")
+    vf_help_directory = "確かめるフォルダーへのパス。 複数指定できます。"
+    vf_help_workers = "同時に動かすプロセスの数。 指定しなければCPUのコアの数、 0 ならひとつのプロセスだけで確かめます。"
+    vf_ok = "[一致] {0}"
+    vf_summary = "{directory}: {all}件のうち {bad}件が記録と一致しませんでした。"
 
 
 class Err:
@@ -623,10 +1686,16 @@ class Err:
     invalid_argument = "引数の型が間違っています。"
     invalid_dirname = "このフォルダー名 {0} はシステム上使えません。他の名前を指定してください。"
     invalid_auth = "メールアドレスとパスワードを入力してください。"
+    invalid_bandwidth = "[エラー] 速さの上限の指定が間違っています: {0}"
     invalid_videoid = ("[エラー] 指定できる動画IDの形式は以下の通りです。"
                        "http://www.nicovideo.jp/watch/sm1234, "
                        "sm1234, nm1234, so1234,  123456, watch/123456")
     connection_404 = "404エラーです。 ID: {0} (タイトル: {1})"
+    video_failed = "[エラー] ID: {0} の動画をダウンロードできませんでした。 理由: {1}"
+    comment_failed = "[エラー] ID: {0} のコメントをダウンロードできませんでした。 理由: {1}"
+    stage_failed = "[エラー] ID: {1} の処理が段階 {0} で失敗しました。 理由: {2}"
+    request_failed = "[エラー] ID: {0} の {1} を取得できませんでした。 理由: {2}"
+    video_incomplete = "[エラー] {0} を最後まで受け取れませんでした。 足りない範囲: {1}, 大きさ: {2} / {3} バイト"
     keyboard_interrupt = "操作を中断しました。"
     not_specified = "[エラー] {0} を指定してください。"
     videoids_contain_all = "通常の動画IDと * を混ぜないでください。"
@@ -645,7 +1714,7 @@ class Err:
     over_load = "[エラー] {0} にはこれ以上追加できません。"
     remaining = "以下の項目は処理されませんでした: {0}"
     already_exist = "[エラー]すでに存在しています。 ID: {0} (タイトル: {1})"
-    known_error = "[エラー] 動画: {0}, コード: {}, 内容: {1}"
+    known_error = "[エラー] 動画: {0}, コード: {1}, 内容: {2}"
     unknown_error_itemid = "[エラー] ({0}/{1}) 動画: {2}, サーバーからの返事: {3}"
     unknown_error = "[エラー] ({0}/{1}) 動画: {2}, サーバーからの返事: {3}"
     failed_to_create = "[エラー] {0} の作成に失敗しました。 サーバーからの返事: {1}"
@@ -653,6 +1722,14 @@ class Err:
     invalid_spec = ("[エラー] {0} は不正です。マイリストの名前"
                     "またはIDは文字列か整数で入力してください。")
     no_items = "[エラー] 指定した動画はいずれもこのマイリストには登録されていません。"
+    sync_list_not_specified = "[エラー] 次の行にはマイリスト名がありません: {0}"
+    cant_read_file = "[エラー] {0} を読み込めませんでした。 理由: {1}"
+    verify_missing = "[不一致] {0} がありません。"
+    verify_size = "[不一致] {0} の大きさが記録と違います。"
+    verify_digest = "[不一致] {0} のハッシュが記録と違います。"
+    verify_algorithm = "[不一致] {0} は知らない方法でハッシュが記録されています。"
+    verify_no_manifest = "[エラー] {0} にはハッシュの記録がありません。"
+    verify_failed = "[エラー] 記録と一致しないファイルがありました: {0}"
 
     '''
     APIから返ってくるエラーメッセージ
@@ -811,6 +1888,9 @@ class DataKey:
     LOOP            = "LOOP"
     SAVE_DIR        = "SAVE_DIR"
     SESSION         = "SESSION"
+    PARALLEL        = "PARALLEL"
+    CONNECTIONS     = "CONNECTIONS"
+    OVERWRITE       = "OVERWRITE"
 
 
 
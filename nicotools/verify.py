@@ -0,0 +1,81 @@
+# coding: UTF-8
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from nicotools import utils
+from nicotools.store import Manifest, verify_file
+from nicotools.utils import Msg, Err
+
+
+PROBLEMS = {
+    "missing": Err.verify_missing,
+    "size": Err.verify_size,
+    "digest": Err.verify_digest,
+    "algorithm": Err.verify_algorithm,
+}
+
+
+def verify(directory: Union[str, Path], workers: Optional[int]=None,
+           logger: Optional[utils.NTLogger]=None) -> Optional[Dict[str, str]]:
+    """
+    フォルダーの Manifest に記録されたファイルを、記録どおりの大きさとハッシュか確かめる。
+
+    ファイルごとに別々のプロセスで読むので、ファイルがたくさんあればCPUのコアの数だけ並んで進む。
+
+    :param Union[str, Path] directory: 確かめるフォルダー
+    :param Optional[int] workers: プロセスの数。 None ならCPUのコアの数、 0 ならこのプロセスだけで確かめる。
+    :param Optional[utils.NTLogger] logger: ロガー
+    :return: {ファイル名: 問題の種類}。 記録がなければ None。
+    :rtype: Optional[Dict[str, str]]
+    """
+    logger = logger or utils.NTLogger()
+    directory = Path(directory)
+    entries = Manifest(directory).load()
+    if not entries:
+        logger.error(Err.verify_no_manifest.format(directory))
+        return None
+    names = sorted(entries)
+    paths = [directory / name for name in names]
+    records = [entries[name] for name in names]
+    if workers == 0:
+        results = list(map(verify_file, paths, records))
+    else:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            # 小さなファイルがたくさんあるときに、受け渡しの回数を減らす
+            chunksize = max(1, len(names) // ((workers or os.cpu_count() or 1) * 4))
+            results = list(executor.map(verify_file, paths, records, chunksize=chunksize))
+
+    problems = {}  # type: Dict[str, str]
+    for name, problem in zip(names, results):
+        if problem is None:
+            logger.debug(Msg.vf_ok.format(name))
+        else:
+            logger.error(PROBLEMS[problem].format(name))
+            problems[name] = problem
+    logger.info(Msg.vf_summary.format(directory=directory, all=len(names), bad=len(problems)))
+    return problems
+
+
+def main(args):
+    """
+    メイン。
+
+    :param args: ArgumentParser.parse_args() によって解釈された引数
+    :rtype: bool
+    """
+    is_debug = int(os.getenv("PYTHON_TEST", 0))
+    log_level = "DEBUG" if is_debug else args.loglevel
+    logger = utils.NTLogger(log_level=log_level)
+    workers = None if args.workers is None else max(0, args.workers)
+
+    failed = []  # type: List[str]
+    for directory in args.DIRECTORY:
+        problems = verify(directory, workers, logger)
+        if problems is None or problems:
+            failed.append(directory)
+    if failed:
+        sys.exit(Err.verify_failed.format(", ".join(failed)))
+    return True
@@ -1,15 +1,29 @@
 # coding: UTF-8
+import asyncio
+import datetime
+import html
+import inspect
+import json
 import os
 import random
 import shutil
 import time
+from pathlib import Path
 
 import aiohttp
 import pytest
+from aiohttp import web
 
 import nicotools
-from nicotools import utils
-from nicotools.download import Info, Video, Comment, Thumbnail
+from benchmarks import samples, startup
+from benchmarks.mock_server import MockServer, OfflineInfo, redirect
+from nicotools import download, utils
+from nicotools.download import Info, Video, Comment, Thumbnail, VideoSmile, VideoDmc, Pipeline, parse_watch_page
+from nicotools.store import (BlockHasher, ChatStore, FileIndex, InfoCache, Manifest, RangeJournal,
+                             chats_from_json, chats_from_xml, file_digest)
+from nicotools.verify import verify
+from nicotools.tracer import Tracer
+from nicotools.utils import KeyDmc, KeyGTI
 
 Waiting = 5
 SAVE_DIR = "tests/downloads/"
@@ -63,6 +77,21 @@ class TestUtils:
              "so1234", "so123456",
              "123456", "1278053154"})
 
+    def test_logger_caller(self, tmpdir):
+        log_file = Path(str(tmpdir)) / "debug.log"
+        logger = utils.NTLogger(file_name=log_file, name="test_logger_caller", log_level="DEBUG")
+
+        def caller():
+            logger.debug("hello %s", "world")
+            return inspect.currentframe().f_lineno - 1
+
+        lineno = caller()
+        for handler in logger.handlers:
+            handler.close()
+        text = log_file.read_text(encoding="utf-8")
+        assert f"|line:{lineno}|<caller> from <test_logger_caller> from <" in text
+        assert text.rstrip().endswith("hello world")
+
     def test_make_dir(self):
         save_dir = ["test", "foo", "foo/bar", "some/thing/text.txt"]
         paths = [utils.get_dir(name) for name in save_dir]
@@ -94,6 +123,1261 @@ class TestUtilsError:
                 utils.get_dir("/{}/downloads".format(__name__))
 
 
+class TestGovernor:
+    def run(self, *coros):
+        async def _gather():
+            return await asyncio.gather(*coros)
+
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(_gather())
+        finally:
+            loop.close()
+
+    def test_max_in_flight(self):
+        governor = utils.Governor(max_in_flight=2)
+        peaks = []
+
+        async def worker(host):
+            async with governor.slot("http://{}/watch/sm9".format(host)):
+                peaks.append(governor.stats()[host]["in_flight"])
+                await asyncio.sleep(0.01)
+
+        self.run(*[worker(host) for host in ["a.example"] * 6 + ["b.example"] * 6])
+        assert max(peaks) == 2
+        assert governor.completed == 12
+        assert governor.in_flight == 0
+        assert governor.queued == 0
+
+    def test_instance_limit(self):
+        governor = utils.Governor(max_in_flight=8)
+        semaphores = []
+        peaks = []
+
+        async def worker():
+            if not semaphores:
+                semaphores.append(asyncio.Semaphore(1))
+            async with governor.slot("http://a.example/", semaphores[0]):
+                peaks.append(governor.in_flight)
+                await asyncio.sleep(0.01)
+
+        self.run(*[worker() for _ in range(4)])
+        assert max(peaks) == 1
+
+    def test_rate(self):
+        governor = utils.Governor(max_in_flight=8, rate=50, burst=1)
+
+        async def worker():
+            async with governor.slot("http://a.example/"):
+                pass
+
+        begin = time.monotonic()
+        self.run(*[worker() for _ in range(6)])
+        assert time.monotonic() - begin >= 0.09
+
+    def test_invalid_args(self):
+        with pytest.raises(ValueError):
+            utils.Governor(max_in_flight=0)
+        with pytest.raises(ValueError):
+            utils.Governor(rate=-1)
+
+
+class TestChunkScheduler:
+    def test_chunks(self):
+        scheduler = utils.ChunkScheduler([(100, 1000), (5000, 9999)], workers=2, chunk_size=1024, block=1024)
+        assert scheduler.pending == [(100, 1000), (5000, 5119), (5120, 6143), (6144, 7167),
+                                     (7168, 8191), (8192, 9215), (9216, 9999)]
+        assert scheduler.remaining == 901 + 5000
+
+    def test_steal(self):
+        scheduler = utils.ChunkScheduler([(0, 9999)], workers=2, chunk_size=10000, block=1000)
+        first = scheduler.take(0)
+        first.position = 2000
+        stolen = scheduler.take(1)
+        assert (stolen.begin, stolen.end) == (6000, 9999)
+        assert first.end == 5999
+        first.position = 5500
+        stolen.position = 9000
+        assert scheduler.take(2) is None
+
+    def test_release(self):
+        scheduler = utils.ChunkScheduler([(0, 9999)], workers=1, chunk_size=1000, block=1000)
+        assignment = scheduler.take(0)
+        assignment.position = 500
+        assert scheduler.release(0, 500, 1.0) is True
+        assert scheduler.pending[0] == (500, 999)
+        assert scheduler.target == 2
+        for number in (0, 1):
+            scheduler.take(number)
+        scheduler.release(0, 100, 1.0)
+        scheduler.release(1, 100, 1.0)
+        assert scheduler.target == 1
+        assert scheduler.retire(1)
+
+    def test_regrow(self):
+        scheduler = utils.ChunkScheduler([(0, 9999)], workers=2, chunk_size=1000, block=1000)
+        assert [scheduler.join(), scheduler.join(), scheduler.join()] == [0, 1, None]
+        scheduler.target = 1
+        assert not scheduler.retire(0)
+        assert scheduler.retire(1)
+        assert scheduler.join() is None
+        scheduler.target = 2
+        # 減らしたあとで増やしたら、空いた番号を使い回して働ける
+        number = scheduler.join()
+        assert number == 1
+        assert not scheduler.retire(number)
+        assert scheduler.take(number) is not None
+        scheduler.leave(0)
+        assert scheduler.slots == {1}
+
+
+class TestWatchPage:
+    DATA_API = {"id": "sm9", "title": "<タイトル> & \"引用\""}
+    PAGE_DATA_API = (
+        '<html><body><div class="x">&lt;</div>'
+        '<div id="js-initial-watch-data" data-api-data="'
+        + html.escape(json.dumps(DATA_API, ensure_ascii=False), quote=True)
+        + '" data-environment="{}"></div></body></html>').encode("utf-8")
+    PAGE_WATCH_API = (
+        '<html><body><div id="watchAPIDataContainer" style="display:none">'
+        + html.escape(json.dumps(DATA_API, ensure_ascii=False), quote=False)
+        + '</div></body></html>').encode("utf-8")
+
+    def test_data_api(self):
+        scanner = utils.WatchDataScanner()
+        assert scanner.feed(self.PAGE_DATA_API)
+        assert scanner.kind == scanner.DATA_API
+        assert json.loads(scanner.payload) == self.DATA_API
+
+    def test_watch_api(self):
+        scanner = utils.WatchDataScanner()
+        assert scanner.feed(self.PAGE_WATCH_API)
+        assert scanner.kind == scanner.WATCH_API
+        assert json.loads(scanner.payload) == self.DATA_API
+
+    def test_chunked(self):
+        for size in (1, 7, 64):
+            scanner = utils.WatchDataScanner()
+            chunks = [self.PAGE_DATA_API[i:i + size] for i in range(0, len(self.PAGE_DATA_API), size)]
+            results = [scanner.feed(chunk) for chunk in chunks]
+            assert results[-1] is True
+            assert json.loads(scanner.payload) == self.DATA_API
+
+    def test_not_found(self):
+        scanner = utils.WatchDataScanner()
+        assert scanner.feed(b'<html><body id="Login_nico"></body></html>') is False
+        assert scanner.payload is None
+
+    def test_parse_workers(self):
+        class Session:
+            async def close(self):
+                pass
+
+        loop = asyncio.new_event_loop()
+        info = Info([], session=Session(), parse_workers=1, loop=loop, logger=LOGGER)
+        try:
+            page = b'<html><body id="Login_nico"></body></html>'
+            assert parse_watch_page(page) is None
+            assert parse_watch_page(self.PAGE_DATA_API) is None  # 必要な値が足りない
+            with pytest.raises(SystemExit):
+                loop.run_until_complete(info._parse(page))
+            for page in (samples.page_data_api(), samples.page_watch_api()):
+                assert loop.run_until_complete(info._parse(page)) == info._junction(page)
+        finally:
+            info.close()
+            loop.close()
+
+
+    def test_stream(self):
+        page = samples.page_data_api()
+        # 動画の情報のすぐ後ろまでを送ったら、残りは送らずに止まる
+        sent = page.index(b"hidden></div>")
+        stalled = []
+
+        async def body():
+            resume = asyncio.Event()
+
+            async def handler(request):
+                response = web.StreamResponse()
+                response.content_length = len(page)
+                await response.prepare(request)
+                await response.write(page[:sent])
+                stalled.append(True)
+                await resume.wait()
+                return response
+
+            app = web.Application()
+            app.router.add_get("/watch/{video_id}", handler)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            try:
+                with redirect(f"http://127.0.0.1:{runner.addresses[0][1]}"):
+                    async with aiohttp.ClientSession() as session:
+                        info = OfflineInfo([], session=session, loop=loop, logger=LOGGER)
+                        return await asyncio.wait_for(info._retrieve_info("sm9"), 5)
+            finally:
+                resume.set()
+                await runner.cleanup()
+
+        loop = asyncio.new_event_loop()
+        try:
+            result = loop.run_until_complete(body())
+        finally:
+            loop.close()
+        assert stalled
+        assert result == parse_watch_page(page)
+
+
+class TestInfoCache:
+    INFO = {KeyDmc.VIDEO_ID: "sm9", KeyDmc.TITLE: "タイトル", KeyDmc.IS_PUBLIC: True,
+            KeyDmc.IS_DELETED: False, KeyDmc.TOKEN: "token", KeyDmc.SIGNATURE: "signature"}
+
+    def make_cache(self, tmpdir, **kwargs):
+        self.now = 1000.0
+        return InfoCache(str(tmpdir / "cache.sqlite3"), clock=lambda: self.now, **kwargs)
+
+    def test_ttl(self, tmpdir):
+        cache = self.make_cache(tmpdir, stable_ttl=100, session_ttl=10)
+        cache.store({"sm9": self.INFO, "sm3": None})
+        assert cache.lookup(["sm9", "sm3"]) == {"sm9": self.INFO}
+        self.now += 20
+        assert cache.lookup(["sm9"]) == {}
+        stable = cache.lookup(["sm9"], stable_only=True)["sm9"]
+        assert stable[KeyDmc.TITLE] == "タイトル"
+        assert stable[KeyDmc.TOKEN] is None
+        self.now += 100
+        assert cache.lookup(["sm9"], stable_only=True) == {}
+        assert cache.stats() == {"hits": 2, "misses": 3, "expired": 2, "evicted": 0, "entries": 1}
+        cache.close()
+
+    def test_lru(self, tmpdir):
+        cache = self.make_cache(tmpdir, max_entries=2)
+        cache.store({"sm1": self.INFO})
+        self.now += 1
+        cache.store({"sm2": self.INFO})
+        self.now += 1
+        cache.lookup(["sm1"])
+        self.now += 1
+        cache.store({"sm3": self.INFO})
+        assert set(cache.lookup(["sm1", "sm2", "sm3"])) == {"sm1", "sm3"}
+        assert cache.stats()["evicted"] == 1
+        cache.close()
+
+    def test_info_without_login(self, tmpdir):
+        cache = self.make_cache(tmpdir)
+        cache.store({"sm9": self.INFO})
+        loop = asyncio.new_event_loop()
+        try:
+            info = Info(["sm9"], cache=cache, loop=loop, logger=LOGGER)
+            assert info.info == {"sm9": self.INFO}
+            assert info.session is None
+        finally:
+            loop.close()
+            cache.close()
+
+
+class TestVideoFile:
+    PAYLOAD = os.urandom(1000003)
+
+    @staticmethod
+    def delay(begin):
+        """ 区間を返すまでに待つ秒数 """
+        return 0.01
+
+    async def handler(self, request):
+        begin, end = request.http_range.start, request.http_range.stop
+        self.requested.append((begin, end))
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(self.delay(begin))
+        self.in_flight -= 1
+        return web.Response(status=206, body=self.PAYLOAD[begin:end])
+
+    @staticmethod
+    def make_commons(session, loop, tmpdir, division, **kwargs):
+        commons = {
+            utils.DataKey.SESSION: session, utils.DataKey.LOGGER: LOGGER,
+            utils.DataKey.LOOP: loop, utils.DataKey.CHUNK_SIZE: 4096,
+            utils.DataKey.IS_MULTILINE: False, utils.DataKey.IS_SMILE: True,
+            utils.DataKey.DIVISION: division, utils.DataKey.SAVE_DIR: str(tmpdir),
+        }
+        commons.update(kwargs)
+        return commons
+
+    def fetch(self, tmpdir, division, file_size=len(PAYLOAD), delay=None, **kwargs):
+        self.requested = []
+        self.in_flight = 0
+        self.peak = 0
+        if delay is not None:
+            self.delay = delay
+        async def _fetch():
+            app = web.Application()
+            app.router.add_get("/video", self.handler)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            port = runner.addresses[0][1]
+            async with aiohttp.ClientSession() as session:
+                video = VideoSmile({}, self.make_commons(session, loop, tmpdir, division, **kwargs))
+                await video._fetch(file_path, f"http://127.0.0.1:{port}/video", file_size)
+            await runner.cleanup()
+
+        file_path = tmpdir / "video.mp4"
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(_fetch())
+        finally:
+            loop.close()
+        return file_path
+
+    def test_split(self, tmpdir):
+        for division in (1, 4, 7):
+            file_path = self.fetch(tmpdir, division)
+            assert file_path.read_binary() == self.PAYLOAD
+            assert not tmpdir.listdir(lambda path: path.ext != ".mp4" and path.basename != Manifest.FILE_NAME)
+
+    def test_tiny(self, tmpdir):
+        file_path = self.fetch(tmpdir, 4, file_size=2)
+        assert file_path.read_binary() == self.PAYLOAD[:2]
+
+    def test_connections(self, tmpdir):
+        file_path = self.fetch(tmpdir, 8, **{utils.DataKey.CONNECTIONS: 3})
+        assert file_path.read_binary() == self.PAYLOAD
+        assert self.peak == 3
+
+    def test_regrow(self, tmpdir):
+        class Scheduler(utils.ChunkScheduler):
+            def __init__(self, missing, **kwargs):
+                # 増やしたあとにも配る区間が残るように、小さく分ける
+                kwargs.update(chunk_size=64 * 1024, block=64 * 1024)
+                super().__init__(missing, **kwargs)
+
+            def join(self):
+                number = super().join()
+                joined.append(number)
+                return number
+
+            def retire(self, number):
+                retired = super().retire(number)
+                if retired:
+                    events.append("retire")
+                return retired
+
+            def take(self, number):
+                assignment = super().take(number)
+                if assignment is not None and "grow" in events:
+                    taken.append(number)
+                return assignment
+
+            def release(self, number, size, seconds):
+                # 速さは見ずに、一度減らしてから増やす
+                super().release(number, 0, 0)
+                if not events:
+                    self.target = 1
+                    events.append("shrink")
+                elif events[-1] == "retire":
+                    self.target = 2
+                    events.append("grow")
+                    return True
+                return False
+
+        joined, events, taken = [], [], []
+        original = utils.ChunkScheduler
+        utils.ChunkScheduler = Scheduler
+        try:
+            file_path = self.fetch(tmpdir, 2)
+        finally:
+            utils.ChunkScheduler = original
+        assert events == ["shrink", "retire", "grow"]
+        assert joined == [0, 1, 1]
+        assert 1 in taken
+        assert file_path.read_binary() == self.PAYLOAD
+
+    def test_hash_without_reread(self, tmpdir):
+        class Hasher(BlockHasher):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                hashers.append(self)
+
+        hashers = []
+        download.BlockHasher = Hasher
+        try:
+            # 後ろの区間ほど早く返して、届く順番をばらばらにする
+            file_path = self.fetch(tmpdir, 4, delay=lambda begin: 0.05 - begin / len(self.PAYLOAD) * 0.04)
+        finally:
+            download.BlockHasher = BlockHasher
+        assert file_path.read_binary() == self.PAYLOAD
+        assert self.peak > 1
+        # 区間の切れ目がブロックにそろっているので、ファイルを読み直さずにハッシュがとれる
+        assert len(hashers) == 1 and hashers[0].reread == 0
+        entry = Manifest(str(tmpdir)).load()[file_path.basename]
+        assert entry["block_size"] == hashers[0].block_size
+        assert entry["digest"] == file_digest(file_path, hashers[0].block_size)
+
+    def test_dmc_pool(self, tmpdir):
+        class Dmc(VideoDmc):
+            async def _negotiate_and_download(self, idx, video_id, position, xml=True):
+                running.append(video_id)
+                peaks.append(len(running))
+                await asyncio.sleep(0.01)
+                running.remove(video_id)
+                if video_id == "sm1":
+                    raise aiohttp.ClientError("failed")
+                done.append(video_id)
+
+        running, peaks, done = [], [], []
+        loop = asyncio.new_event_loop()
+        try:
+            commons = self.make_commons(None, loop, tmpdir, 4, **{utils.DataKey.PARALLEL: 3})
+            Dmc({f"sm{i}": {} for i in range(10)}, commons).callee()
+        finally:
+            loop.close()
+        assert max(peaks) == 3
+        assert sorted(done) == sorted(f"sm{i}" for i in range(10) if i != 1)
+
+    def test_resume(self, tmpdir):
+        size = len(self.PAYLOAD)
+        file_path = tmpdir / "video.mp4"
+        file_path.write_binary(self.PAYLOAD[:50000] + bytes(size - 50000))
+        journal = RangeJournal(str(file_path), size)
+        journal.commit(0, 50000)
+        journal.save()
+
+        file_path = self.fetch(tmpdir, 1)
+        assert self.requested[0][0] == 50000
+        assert sum(end - begin for begin, end in self.requested) == size - 50000
+        assert file_path.read_binary() == self.PAYLOAD
+        assert not (tmpdir / "video.mp4.journal").exists()
+
+    def test_resume_size_changed(self, tmpdir):
+        file_path = tmpdir / "video.mp4"
+        file_path.write_binary(bytes(10))
+        journal = RangeJournal(str(file_path), 10)
+        journal.commit(0, 5)
+        journal.save()
+
+        file_path = self.fetch(tmpdir, 1)
+        assert sum(end - begin for begin, end in self.requested) == len(self.PAYLOAD)
+        assert file_path.read_binary() == self.PAYLOAD
+
+    def test_journal(self, tmpdir):
+        now = [0]
+        journal = RangeJournal(str(tmpdir / "video.mp4"), 100, interval=10, clock=lambda: now[0])
+        assert journal.missing() == [(0, 99)]
+        journal.commit(10, 20)
+        journal.commit(30, 10)
+        journal.commit(60, 10)
+        assert journal.done == [[10, 40], [60, 70]]
+        assert journal.missing() == [(0, 9), (40, 59), (70, 99)]
+        assert not journal.path.exists()
+        now[0] = 10
+        journal.commit(0, 10)
+        assert journal.path.exists()
+
+
+class TestChatStore:
+    JSON = json.dumps(
+        [{"ping": {"content": "rs:0"}},
+         {"thread": {"resultcode": 0, "thread": "1173108780", "last_res": 3}}]
+        + [{"chat": {"thread": "1173108780", "no": no, "vpos": no * 100, "date": 1500000000 + no,
+                     "user_id": "user{}".format(no % 2), "mail": "184", "content": "コメント{}".format(no)}}
+           for no in range(1, 4)]
+        + [{"chat": {"thread": "1173108780", "no": 1, "vpos": 0, "date": 1400000000,
+                     "fork": 1, "content": "投稿者コメント"}},
+           {"chat": {"thread": "1173108780", "no": 4, "vpos": 10, "date": 1500000004, "deleted": 1}}])
+    XML = ('<packet><thread resultcode="0" thread="1" last_res="2"/>'
+           '<chat thread="1" no="1" vpos="-5" date="10" mail="red" user_id="a">&lt;えー&gt;</chat>'
+           '<chat thread="1" no="2" vpos="7" date="11" user_id="b" fork="1"/></packet>')
+
+    def test_json(self, tmpdir):
+        store = ChatStore(str(tmpdir / "sm9.chats"))
+        assert store.append(chats_from_json(self.JSON)) == 5
+        columns = store.load()
+        assert list(columns[ChatStore.NO]) == [1, 2, 3, 4, 1]
+        assert list(columns[ChatStore.FORK]) == [0, 0, 0, 0, 1]
+        assert list(columns[ChatStore.VPOS]) == [100, 200, 300, 10, 0]
+        assert columns[ChatStore.CONTENT] == ["コメント1", "コメント2", "コメント3", "", "投稿者コメント"]
+        assert columns[ChatStore.USER_ID][:3] == ["user1", "user0", "user1"]
+        assert set(columns[ChatStore.THREAD]) == {1173108780}
+
+    def test_xml(self, tmpdir):
+        store = ChatStore(str(tmpdir / "sm9.chats"))
+        store.append(chats_from_xml(self.XML), compress=False)
+        columns = store.load(thread=1)
+        assert list(columns[ChatStore.VPOS]) == [-5, 7]
+        assert columns[ChatStore.CONTENT] == ["<えー>", ""]
+        assert columns[ChatStore.MAIL] == ["red", ""]
+        assert len(store.load(thread=2)[ChatStore.NO]) == 0
+
+    def test_blocks(self, tmpdir):
+        store = ChatStore(str(tmpdir / "sm9.chats"))
+        store.append(chats_from_json(self.JSON))
+        store.append(chats_from_xml(self.XML))
+        store.append(chats_from_json(self.JSON))
+        assert len(list(store.blocks())) == 3
+        assert len(store) == 7
+        assert store.last_numbers() == {(1173108780, 0): 4, (1173108780, 1): 1, (1, 0): 1, (1, 1): 2}
+
+    def test_broken(self, tmpdir):
+        path = tmpdir / "broken.chats"
+        path.write_binary(b"hello")
+        with pytest.raises(ValueError):
+            ChatStore(str(path)).load()
+
+
+class TestIncrementalComment:
+    INFO = {KeyDmc.VIDEO_ID: "sm9", KeyDmc.TITLE: "title", KeyDmc.FILE_NAME: "title",
+            KeyDmc.MOVIE_TYPE: "mp4", KeyDmc.THREAD_ID: 1, KeyDmc.MSG_SERVER: "http://msg.example/api/",
+            KeyDmc.USER_ID: 1, KeyDmc.USER_KEY: "key", KeyDmc.IS_OFFICIAL: False, KeyDmc.NEEDS_KEY: 0}
+
+    @staticmethod
+    def chat(no, fork=0):
+        chat = {"thread": "1", "no": no, "vpos": no, "date": no, "content": str(no)}
+        if fork:
+            chat["fork"] = 1
+        return {"chat": chat}
+
+    def make_comment(self, tmpdir, total, incremental=True, **kwargs):
+        requests = []
+
+        class FakeComment(Comment):
+            async def retriever(self, data, url):
+                thread = json.loads(data)[2]["thread"]
+                requests.append((thread["res_from"], thread.get("fork", 0)))
+                last = total if not thread.get("fork") else 1
+                numbers = range(thread["res_from"], min(last, thread["res_from"] + 999) + 1)
+                return json.dumps([{"thread": {"thread": "1"}}]
+                                  + [self_.chat(no, thread.get("fork", 0)) for no in numbers])
+
+        self_ = self
+        loop = asyncio.new_event_loop()
+
+        class Session:
+            async def close(self):
+                pass
+
+        comment = FakeComment({"sm9": dict(self.INFO)}, save_dir=str(tmpdir), session=Session(),
+                              loop=loop, logger=LOGGER, incremental=incremental, **kwargs)
+        return comment, requests, loop
+
+    def test_json(self, tmpdir):
+        path = tmpdir / "sm9_title.json"
+        path.write_text(json.dumps([self.chat(no) for no in range(1, 11)] + [self.chat(1, fork=1)]),
+                        encoding="utf-8")
+        comment, requests, loop = self.make_comment(tmpdir, 2500)
+        assert comment._comment_path("sm9", False) == Path(str(path))
+        try:
+            comment.start()
+        finally:
+            loop.close()
+        assert requests == [(11, 0), (1011, 0), (2011, 0), (2, 1)]
+        chats = chats_from_json(path.read_text(encoding="utf-8"))
+        assert len(chats) == 2501
+        assert len({(chat["fork"], chat["no"]) for chat in chats}) == 2501
+
+    def test_existing_file(self, tmpdir):
+        # --incremental がなくても、保存済みのファイルがあれば新しいものだけを取りに行く
+        path = tmpdir / "sm9_title.json"
+        path.write_text(json.dumps([self.chat(no) for no in range(1, 11)]), encoding="utf-8")
+        comment, requests, loop = self.make_comment(tmpdir, 15, incremental=False)
+        try:
+            comment.start()
+        finally:
+            loop.close()
+        assert requests == [(11, 0)]
+        assert len(chats_from_json(path.read_text(encoding="utf-8"))) == 15
+
+    def test_columnar(self, tmpdir):
+        path = tmpdir / "sm9_title.chats"
+        ChatStore(str(path)).append(chats_from_json(json.dumps([self.chat(no) for no in range(1, 6)])))
+        comment, requests, loop = self.make_comment(tmpdir, 8, columnar=True)
+        try:
+            comment.start()
+        finally:
+            loop.close()
+        assert requests == [(6, 0)]
+        assert list(ChatStore(str(path)).load()[ChatStore.NO]) == list(range(1, 9))
+
+    def test_merge_xml(self, tmpdir):
+        path = tmpdir / "sm9_title.xml"
+        path.write_text('<packet><thread thread="1"/>\n<chat thread="1" no="1">a</chat>\n</packet>',
+                        encoding="utf-8")
+        comment, _, loop = self.make_comment(tmpdir, 0)
+        loop.close()
+        response = '<packet><chat thread="1" no="1">a</chat><chat thread="1" no="2">b</chat></packet>'
+        assert comment.merge(Path(str(path)), True, [response]) == 1
+        chats = chats_from_xml(path.read_text(encoding="utf-8"))
+        assert [chat[ChatStore.CONTENT] for chat in chats] == ["a", "b"]
+
+
+class TestWayback:
+    def test_crawl(self, tmpdir):
+        requests = []
+        total = 2500
+
+        class Session:
+            async def close(self):
+                pass
+
+        class FakeComment(Comment):
+            async def get_wayback_key(self, thread_id):
+                return "key"
+
+            async def retriever(self, data, url):
+                thread = json.loads(data)[2]["thread"]
+                requests.append((thread["thread"], thread.get("fork", 0), thread["when"]))
+                if thread.get("fork"):
+                    return json.dumps([{"thread": {"thread": "1"}}])
+                # 2件ずつ同じ秒に書かれたことにする
+                numbers = [no for no in range(1, total + 1) if no // 2 < thread["when"]][-1000:]
+                return json.dumps([{"chat": {"thread": "1", "no": no, "date": no // 2, "content": str(no)}}
+                                   for no in numbers])
+
+        for _ in range(2):
+            loop = asyncio.new_event_loop()
+            comment = FakeComment({"sm9": dict(TestIncrementalComment.INFO)}, save_dir=str(tmpdir),
+                                  session=Session(), loop=loop, logger=LOGGER, wayback=True)
+            try:
+                comment.start()
+            finally:
+                loop.close()
+        assert len([request for request in requests if request[1] == 0]) == 3 * 2
+        store = ChatStore(str(tmpdir / "sm9_title.chats"))
+        columns = store.load()
+        assert list(columns[ChatStore.NO]) == list(range(1, total + 1))
+        # 二度目は保存してあるものばかりなので、何も書き足さない
+        assert sum(len(columns[ChatStore.NO]) for _, columns in store.blocks()) == total
+
+
+class TestPipeline:
+    IMAGE = os.urandom(2048)
+
+    async def handler(self, request):
+        self.peers.add(request.transport.get_extra_info("peername"))
+        await asyncio.sleep(0.01)
+        return web.Response(body=self.IMAGE)
+
+    def glossary(self, port, total):
+        return {f"sm{num}": {
+            KeyGTI.FILE_NAME: "title", KeyGTI.TITLE: "title", KeyGTI.VIDEO_ID: f"sm{num}", KeyDmc.MOVIE_TYPE: "mp4",
+            KeyGTI.THUMBNAIL_URL: f"http://127.0.0.1:{port}/thumb{num}"} for num in range(1, total + 1)}
+
+    def serve(self, loop, body):
+        self.peers = set()
+
+        async def _serve():
+            app = web.Application()
+            app.router.add_get("/{name}", self.handler)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            try:
+                return await body(runner.addresses[0][1])
+            finally:
+                await runner.cleanup()
+
+        return loop.run_until_complete(_serve())
+
+    def test_shared_connection(self, tmpdir):
+        loop = asyncio.new_event_loop()
+        pipeline = Pipeline(limit_per_host=1, loop=loop, logger=LOGGER)
+
+        async def body(port):
+            database = await pipeline.run(self.glossary(port, 5), thumbnail={"save_dir": str(tmpdir)})
+            session = pipeline.session
+            await pipeline.run(database, thumbnail={"save_dir": str(tmpdir)})
+            assert pipeline.session is session
+            await session.close()
+
+        try:
+            self.serve(loop, body)
+        finally:
+            loop.close()
+        # どの段階も同じ接続を使い回している
+        assert len(self.peers) == 1
+        for num in range(1, 6):
+            assert (tmpdir / f"sm{num}_title.jpg").read_binary() == self.IMAGE
+        # 溜めておいた記録は、段階を終えたときにまとめて書き出される
+        assert sorted(Manifest(str(tmpdir)).load()) == [f"sm{num}_title.jpg" for num in range(1, 6)]
+
+    def test_borrowed_session(self, tmpdir):
+        loop = asyncio.new_event_loop()
+
+        async def body(port):
+            async with aiohttp.ClientSession() as session:
+                Info([], session=session, loop=loop).close()
+                thumbnail = Thumbnail(self.glossary(port, 2), save_dir=str(tmpdir),
+                                      session=session, loop=loop, logger=LOGGER)
+                assert sorted(await thumbnail.download()) == ["sm1", "sm2"]
+                thumbnail.close()
+                assert not session.closed
+
+        try:
+            self.serve(loop, body)
+        finally:
+            loop.close()
+
+    def test_flow(self):
+        loop = asyncio.new_event_loop()
+        pipeline = Pipeline(queue_size=1, workers={"info": 2, "slow": 2, "last": 1}, loop=loop, logger=LOGGER)
+        arrived = []
+
+        async def info(video_id, _, __):
+            return None if video_id == "sm4" else {"id": video_id}
+
+        async def slow(video_id, data, number):
+            if video_id == "sm1":
+                await asyncio.sleep(0.1)
+            if video_id == "sm3":
+                raise ValueError(video_id)
+            return True
+
+        async def last(video_id, data, number):
+            arrived.append(data["id"])
+
+        pipeline.metrics.start()
+        try:
+            loop.run_until_complete(pipeline._flow(
+                [f"sm{num}" for num in range(1, 7)], [("info", info), ("slow", slow), ("last", last)]))
+        finally:
+            loop.close()
+        pipeline.metrics.stop()
+        # 遅い動画を待たずに、他の動画は先へ進む。 失敗した段階があっても最後まで進む。
+        assert arrived[-1] == "sm1"
+        assert sorted(arrived) == ["sm1", "sm2", "sm3", "sm5", "sm6"]
+        stats = pipeline.metrics.stats()
+        assert stats["info"]["count"] == 6
+        assert stats["last"]["count"] == 5
+        assert stats["slow"]["max"] >= 0.1
+        assert pipeline.metrics.completed == 5
+
+    def test_metrics(self):
+        now = [0]
+        metrics = utils.StageMetrics(clock=lambda: now[0])
+        metrics.start()
+        for latency in range(1, 21):
+            metrics.record("video", latency, waited=1)
+            metrics.complete()
+        now[0] = 10
+        metrics.stop()
+        stats = metrics.stats()["video"]
+        assert (stats["count"], stats["mean"], stats["p95"], stats["max"], stats["wait"]) == (20, 10.5, 20, 20, 1)
+        assert metrics.throughput == 2
+
+
+class TestTracer:
+    def test_thumbnail(self, tmpdir):
+        server = TestPipeline()
+        tracer = Tracer()
+        utils.Canopy.set_tracer(tracer)
+        loop = asyncio.new_event_loop()
+        # セッションは Thumbnail が作る
+        thumbnail = Thumbnail({}, save_dir=str(tmpdir), loop=loop, logger=LOGGER)
+
+        async def body(port):
+            for video_id, info in server.glossary(port, 3).items():
+                await thumbnail.download_one(video_id, info)
+
+        try:
+            server.serve(loop, body)
+            thumbnail.close()
+        finally:
+            utils.Canopy.set_tracer(None)
+            loop.close()
+        assert len(tracer.records) == 3
+        for record in tracer.records:
+            assert (record.stage, record.status, record.bytes, record.retry) == ("thumbnail", 200, 2048, 0)
+            assert record.ttfb > 0
+        stats = tracer.stats()
+        assert stats["thumbnail"]["count"] == 3 and stats["thumbnail"]["bytes"] == 3 * 2048
+        assert "thumbnail" in tracer.summary()
+        trace_file = Path(str(tmpdir)) / "trace.jsonl"
+        assert tracer.dump(trace_file) == 3
+        lines = [json.loads(line) for line in trace_file.read_text(encoding="utf-8").splitlines()]
+        assert {line["stage"] for line in lines} == {"thumbnail"}
+        assert {line["url"].rsplit("/", 1)[1] for line in lines} == {"thumb1.L", "thumb2.L", "thumb3.L"}
+
+    def test_video_range(self, tmpdir):
+        server = TestVideoFile()
+        server.requested, server.in_flight, server.peak = [], 0, 0
+        tracer = Tracer()
+        loop = asyncio.new_event_loop()
+
+        async def _fetch():
+            app = web.Application()
+            app.router.add_get("/video", server.handler)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            port = runner.addresses[0][1]
+            async with aiohttp.ClientSession(trace_configs=[tracer.config()]) as session:
+                video = VideoSmile({}, server.make_commons(session, loop, tmpdir, 4))
+                await video._fetch(tmpdir / "video.mp4", f"http://127.0.0.1:{port}/video", len(server.PAYLOAD))
+            await runner.cleanup()
+
+        try:
+            loop.run_until_complete(_fetch())
+        finally:
+            loop.close()
+        assert {record.stage for record in tracer.records} == {"video-range"}
+        assert sum(record.bytes for record in tracer.records) == len(server.PAYLOAD)
+        assert all(record.status == 206 for record in tracer.records)
+
+
+class TestMockServer:
+    """ 手元のモックサーバーを相手に、通しで動かす """
+    @staticmethod
+    def session(loop):
+        async def _session():
+            return aiohttp.ClientSession()
+
+        return loop.run_until_complete(_session())
+
+    def test_info_login_once(self):
+        calls = []
+
+        class CountingInfo(OfflineInfo):
+            def _get_cookie(self):
+                calls.append(1)
+                return super()._get_cookie()
+
+        loop = asyncio.new_event_loop()
+        with MockServer(page_size=1024) as server, server.redirect():
+            session = self.session(loop)
+            try:
+                # 借りたセッションには一度だけクッキーを入れる
+                info = CountingInfo([], session=session, logger=LOGGER, loop=loop)
+                for video_id in ("sm1", "sm2", "sm3"):
+                    assert list(loop.run_until_complete(info.fetch([video_id]))) == [video_id]
+                assert len(calls) == 1
+                # ログイン済みだと渡されたら入れない
+                info = CountingInfo([], logged_in=True, session=session, logger=LOGGER, loop=loop)
+                loop.run_until_complete(info.fetch(["sm4"]))
+                assert len(calls) == 1
+            finally:
+                loop.run_until_complete(session.close())
+                loop.close()
+
+    def test_video(self, tmpdir):
+        loop = asyncio.new_event_loop()
+        with MockServer(video_size=300 * 1024, page_size=1024) as server, server.redirect():
+            session = self.session(loop)
+            try:
+                glossary = OfflineInfo(["sm1", "sm2", "sm3", "sm4"], session=session,
+                                       logger=LOGGER, loop=loop).info
+                assert sorted(_id for _id, info in glossary.items() if info[KeyDmc.IS_DMC]) == ["sm2", "sm4"]
+                video = Video(glossary, save_dir=str(tmpdir), multiline=False,
+                              session=session, logger=LOGGER, loop=loop)
+                loop.run_until_complete(video.download())
+            finally:
+                loop.run_until_complete(session.close())
+                loop.close()
+        files = [path for path in Path(str(tmpdir)).iterdir() if path.suffix in (".mp4", ".flv")]
+        assert len(files) == 4
+        assert all(path.read_bytes() == server.video for path in files)
+        assert server.requests["dmc-negotiate"] == 2
+
+    @pytest.mark.parametrize("is_xml", [True, False])
+    def test_comment(self, tmpdir, is_xml):
+        loop = asyncio.new_event_loop()
+        with MockServer(comments=1500, page_size=1024) as server, server.redirect():
+            session = self.session(loop)
+            try:
+                glossary = OfflineInfo(["sm1", "sm2"], session=session, logger=LOGGER, loop=loop).info
+                comment = Comment(glossary, save_dir=str(tmpdir), xml=is_xml,
+                                  session=session, logger=LOGGER, loop=loop)
+                loop.run_until_complete(comment.download())
+            finally:
+                loop.run_until_complete(session.close())
+                loop.close()
+        files = sorted(Path(str(tmpdir)).iterdir())
+        assert [path.suffix for path in files] == [".xml" if is_xml else ".json"] * 2
+        for path in files:
+            text = path.read_text(encoding="utf-8")
+            chats = text.count("<chat ") if is_xml else sum(1 for item in json.loads(text) if "chat" in item)
+            # 一度に取れるのは最新の1000件まで
+            assert chats == 1000
+
+    def test_thumbnail(self, tmpdir):
+        loop = asyncio.new_event_loop()
+        with MockServer() as server, server.redirect():
+            session = self.session(loop)
+            try:
+                thumbnail = Thumbnail(["sm1", "sm2"], save_dir=str(tmpdir), session=session,
+                                      logger=LOGGER, loop=loop)
+                assert sorted(thumbnail.start()) == ["sm1", "sm2"]
+            finally:
+                loop.run_until_complete(session.close())
+                loop.close()
+        files = [path for path in Path(str(tmpdir)).iterdir() if path.suffix == ".jpg"]
+        assert len(files) == 2 and all(path.read_bytes() == server.thumbnail for path in files)
+
+
+class TestRetryPolicy:
+    @staticmethod
+    def response_error(status, headers=None):
+        return aiohttp.ClientResponseError(None, (), status=status, headers=headers)
+
+    def test_delay(self):
+        policy = utils.RetryPolicy(base=1, factor=2, cap=5, randomness=lambda: 0.5)
+        assert [policy.delay(attempt) for attempt in range(4)] == [0.5, 1.0, 2.0, 2.5]
+        assert policy.delay(0, retry_after=3) == 3
+
+    def test_plan(self):
+        now = [0.0]
+        policy = utils.RetryPolicy(retries=2, deadline=10, rules={"server": 0},
+                                   clock=lambda: now[0], randomness=lambda: 1.0)
+        assert policy.plan(self.response_error(503, {"Retry-After": "4"}), 0, 0) == 4
+        assert policy.plan(aiohttp.ServerDisconnectedError(), 1, 0) == 2
+        assert policy.plan(asyncio.TimeoutError(), 2, 0) is None
+        assert policy.plan(self.response_error(500), 0, 0) is None
+        assert policy.plan(self.response_error(404), 0, 0) is None
+        assert policy.plan(ValueError(), 0, 0) is None
+        # 締め切りを過ぎてしまうならやり直さない
+        assert policy.plan(self.response_error(429, {"Retry-After": "8"}), 0, 3) is None
+        assert policy.gave_up == 3
+
+    def test_retry_after_date(self):
+        moment = time.time() + 30
+        headers = {"Retry-After": time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(moment))}
+        assert 25 < utils.RetryPolicy.retry_after(self.response_error(503, headers)) <= 30
+        assert utils.RetryPolicy.retry_after(self.response_error(503, {"Retry-After": "soon"})) is None
+
+    def test_mock_server(self, tmpdir):
+        loop = asyncio.new_event_loop()
+        policy = utils.RetryPolicy(base=0.01)
+        utils.Canopy.set_retry_policy(policy)
+        try:
+            with MockServer(page_size=1024) as server, server.redirect():
+                server.inject("watch", 503, 502)
+                server.inject("thumbinfo", 429)
+                # 大きいサムネイルがなければ小さいものを一度だけ取りに行く
+                server.inject("thumbnail", 404, 404, 404)
+                session = TestMockServer.session(loop)
+                try:
+                    glossary = OfflineInfo(["sm1"], session=session, logger=LOGGER, loop=loop).info
+                    assert list(glossary) == ["sm1"]
+                    thumbnail = Thumbnail(["sm1", "sm2"], save_dir=str(tmpdir), session=session,
+                                          logger=LOGGER, loop=loop)
+                    assert len(loop.run_until_complete(thumbnail.download())) == 1
+                    assert len(thumbnail.undone) == 1
+                finally:
+                    loop.run_until_complete(session.close())
+                    loop.close()
+        finally:
+            utils.Canopy.set_retry_policy(None)
+        assert server.requests["watch"] == 3
+        assert server.requests["thumbinfo"] == 3
+        assert server.requests["thumbnail"] == 4
+        assert policy.retried == 3
+
+    def test_resume(self):
+        position = [0]
+
+        async def attempt(number):
+            # 呼ばれるたびに 10 バイトずつ進んで、 30 バイト目までは途中で切れる
+            position[0] += 10
+            if position[0] < 30:
+                raise aiohttp.ClientPayloadError("cut")
+            return number
+
+        loop = asyncio.new_event_loop()
+        policy = utils.RetryPolicy(retries=0)
+        try:
+            assert loop.run_until_complete(policy.call(attempt, progress=lambda: position[0])) == 0
+            assert (policy.resumed, policy.retried) == (2, 0)
+            # 先に進まなければ普通のやり直しになる
+            position[0] = 0
+            with pytest.raises(aiohttp.ClientPayloadError):
+                loop.run_until_complete(policy.call(attempt, progress=lambda: 0))
+        finally:
+            loop.close()
+
+    def test_resume_deadline(self):
+        now = [0.0]
+        position = [0]
+
+        async def attempt(number):
+            # 呼ばれるたびに少しだけ進んで、 4 秒かかって途中で切れる
+            now[0] += 4
+            position[0] += 1
+            raise aiohttp.ClientPayloadError("cut")
+
+        loop = asyncio.new_event_loop()
+        policy = utils.RetryPolicy(deadline=10, clock=lambda: now[0], randomness=lambda: 0.0)
+        try:
+            # 先に進み続けていても、最初の試行から締め切りを過ぎたら諦める
+            with pytest.raises(aiohttp.ClientPayloadError):
+                loop.run_until_complete(policy.call(attempt, progress=lambda: position[0]))
+        finally:
+            loop.close()
+        assert position[0] == 3
+        assert (policy.resumed, policy.gave_up) == (2, 1)
+
+    def test_resume_video(self, tmpdir):
+        loop = asyncio.new_event_loop()
+        # やり直しは許さないので、続きから取りに行けなければ失敗する
+        policy = utils.RetryPolicy(retries=0)
+        utils.Canopy.set_retry_policy(policy)
+        try:
+            with MockServer(video_size=300 * 1024, page_size=1024) as server, server.redirect():
+                server.cut("smile", 1000, 2000)
+                server.cut("dmc-video", 3000, 4000)
+                session = TestMockServer.session(loop)
+                try:
+                    glossary = OfflineInfo(["sm1", "sm2"], session=session, logger=LOGGER, loop=loop).info
+                    video = Video(glossary, save_dir=str(tmpdir), multiline=False,
+                                  session=session, logger=LOGGER, loop=loop)
+                    loop.run_until_complete(video.download())
+                finally:
+                    loop.run_until_complete(session.close())
+                    loop.close()
+        finally:
+            utils.Canopy.set_retry_policy(None)
+        files = [path for path in Path(str(tmpdir)).iterdir() if path.suffix in (".mp4", ".flv")]
+        assert len(files) == 2
+        assert all(path.read_bytes() == server.video for path in files)
+        assert not list(Path(str(tmpdir)).glob("*.journal"))
+        assert (policy.resumed, policy.retried) == (4, 0)
+
+
+class TestIntegrity:
+    def test_block_hasher(self, tmpdir):
+        data = bytes(range(256)) * 40
+        file_path = tmpdir / "video.mp4"
+        file_path.write_binary(data)
+        # 頭から順に届けば読み直さない
+        hasher = BlockHasher(len(data), block_size=1000)
+        for position in range(0, len(data), 300):
+            hasher.update(position, data[position:position + 300])
+        assert hasher.hexdigest(file_path) == file_digest(file_path, 1000)
+        assert hasher.reread == 0
+        # 区間の継ぎ目をまたぐブロックだけを読み直す
+        hasher = BlockHasher(len(data), block_size=1000)
+        hasher.update(5000, data[5000:])
+        hasher.update(0, data[:5000])
+        assert hasher.hexdigest(file_path) == file_digest(file_path, 1000)
+        assert hasher.reread == 0
+        hasher = BlockHasher(len(data), block_size=1000)
+        hasher.update(4500, data[4500:])
+        hasher.update(0, data[:4500])
+        assert hasher.hexdigest(file_path) == file_digest(file_path, 1000)
+        assert hasher.reread == 1
+
+    def test_block_size_for(self):
+        assert BlockHasher.block_size_for(100 * 1024 * 1024, 8) == BlockHasher.BLOCK_SIZE
+        assert BlockHasher.block_size_for(1000003, 8) == 64 * 1024
+        assert BlockHasher.block_size_for(10, 8) == 64 * 1024
+        assert BlockHasher.block_size_for(10 * 1024 * 1024, 4) == 2 * 1024 * 1024
+
+    def test_manifest(self, tmpdir):
+        Manifest(str(tmpdir)).record(tmpdir / "a.jpg", 1, "x")
+        other = Manifest(str(tmpdir))
+        other.record(tmpdir / "b.jpg", 2, "y", save=False)
+        Manifest(str(tmpdir)).record(tmpdir / "c.jpg", 3, "z")
+        other.save()
+        assert sorted(Manifest(str(tmpdir)).load()) == ["a.jpg", "b.jpg", "c.jpg"]
+
+    def test_manifest_batch(self, tmpdir):
+        now = [0]
+        manifest = Manifest(str(tmpdir), interval=10, batch=3, clock=lambda: now[0])
+        manifest.record(tmpdir / "a.jpg", 1, "x")
+        manifest.record(tmpdir / "b.jpg", 2, "y")
+        assert not manifest.path.exists()
+        manifest.record(tmpdir / "c.jpg", 3, "z")
+        assert sorted(manifest.load()) == ["a.jpg", "b.jpg", "c.jpg"]
+        manifest.record(tmpdir / "d.jpg", 4, "w")
+        assert "d.jpg" not in manifest.load()
+        now[0] = 10
+        manifest.record(tmpdir / "e.jpg", 5, "v")
+        assert sorted(manifest.load()) == ["a.jpg", "b.jpg", "c.jpg", "d.jpg", "e.jpg"]
+        manifest.record(tmpdir / "f.jpg", 6, "u")
+        manifest.save()
+        assert "f.jpg" in manifest.load()
+
+    def test_mock_server(self, tmpdir):
+        loop = asyncio.new_event_loop()
+        utils.Canopy.set_retry_policy(utils.RetryPolicy(base=0.01))
+        try:
+            with MockServer(video_size=300 * 1024, page_size=1024) as server, server.redirect():
+                # 途中で切れたサムネイルはそのまま保存せずに取り直す
+                server.cut("thumbnail", 10)
+                session = TestMockServer.session(loop)
+                try:
+                    glossary = OfflineInfo(["sm1", "sm2"], session=session, logger=LOGGER, loop=loop).info
+                    thumbnail = Thumbnail(["sm1"], save_dir=str(tmpdir), session=session, logger=LOGGER, loop=loop)
+                    assert loop.run_until_complete(thumbnail.download()) == ["sm1"]
+                    video = Video(glossary, save_dir=str(tmpdir), multiline=False,
+                                  session=session, logger=LOGGER, loop=loop)
+                    loop.run_until_complete(video.download())
+                finally:
+                    loop.run_until_complete(session.close())
+                    loop.close()
+        finally:
+            utils.Canopy.set_retry_policy(None)
+        assert server.requests["thumbnail"] == 2
+        entries = Manifest(str(tmpdir)).load()
+        assert sorted(Path(name).suffix for name in entries) == [".flv", ".jpg", ".mp4"]
+        assert [entry["size"] for entry in entries.values()].count(len(server.video)) == 2
+        assert (tmpdir / next(name for name in entries if name.endswith(".jpg"))).size() == len(server.thumbnail)
+        assert verify(str(tmpdir), workers=2, logger=LOGGER) == {}
+
+        names = sorted(entries)
+        with (tmpdir / names[0]).open("r+b") as fd:
+            fd.write(b"?")
+        with (tmpdir / names[1]).open("r+b") as fd:
+            fd.truncate(1)
+        (tmpdir / names[2]).remove()
+        assert verify(str(tmpdir), workers=0, logger=LOGGER) == {
+            names[0]: "digest", names[1]: "size", names[2]: "missing"}
+        assert verify(str(tmpdir / "nothing"), workers=0, logger=LOGGER) is None
+
+
+class TestSkip:
+    def test_file_index(self, tmpdir):
+        (tmpdir / "a.mp4").write_binary(b"12345")
+        (tmpdir / "b").mkdir()
+        index = FileIndex(str(tmpdir))
+        assert "a.mp4" in index and "b" not in index
+        assert index.size("a.mp4") == 5 and index.size("c.mp4") is None
+        # 一度だけ走査するので、あとから書いたものは載らない
+        (tmpdir / "c.mp4").write_binary(b"")
+        assert "c.mp4" not in index
+        assert FileIndex(str(tmpdir / "nothing")).entries == {}
+
+    @staticmethod
+    def run(loop, session, glossary, tmpdir, overwrite=False):
+        thumbnail = Thumbnail(dict(glossary), save_dir=str(tmpdir), overwrite=overwrite,
+                              session=session, logger=LOGGER, loop=loop)
+        assert sorted(loop.run_until_complete(thumbnail.download())) == ["sm1", "sm2"]
+        comment = Comment(dict(glossary), save_dir=str(tmpdir), overwrite=overwrite,
+                          session=session, logger=LOGGER, loop=loop)
+        loop.run_until_complete(comment.download())
+        video = Video(dict(glossary), save_dir=str(tmpdir), multiline=False, overwrite=overwrite,
+                      session=session, logger=LOGGER, loop=loop)
+        loop.run_until_complete(video.download())
+
+    def test_mock_server(self, tmpdir):
+        loop = asyncio.new_event_loop()
+        with MockServer(video_size=300 * 1024, comments=1500, page_size=1024) as server, server.redirect():
+            session = TestMockServer.session(loop)
+            try:
+                glossary = OfflineInfo(["sm1", "sm2"], session=session, logger=LOGGER, loop=loop).info
+                self.run(loop, session, glossary, tmpdir)
+                first = server.requests.copy()
+                stamps = {path.name: path.stat().st_mtime_ns for path in Path(str(tmpdir)).iterdir()
+                          if path.suffix != ".json"}
+
+                # 二度目は、動画は大きさを確かめるだけで、サムネイルは 304 が返る
+                self.run(loop, session, glossary, tmpdir)
+                second = server.requests - first
+                assert second["thumbnail"] == 2
+                assert second["smile"] == second["dmc-video"] == 1
+                assert stamps == {path.name: path.stat().st_mtime_ns for path in Path(str(tmpdir)).iterdir()
+                                  if path.suffix != ".json"}
+
+                # 書きかけのものは続きを取りに行く
+                video_path = next(Path(str(tmpdir)).glob("sm1_*.flv"))
+                RangeJournal(video_path, len(server.video)).save()
+                self.run(loop, session, glossary, tmpdir)
+                assert (server.requests - first - second)["smile"] > 1
+
+                third = server.requests.copy()
+                self.run(loop, session, glossary, tmpdir, overwrite=True)
+                assert (server.requests - third)["dmc-video"] > 1
+            finally:
+                loop.run_until_complete(session.close())
+                loop.close()
+        files = [path for path in Path(str(tmpdir)).glob("sm*.json")]
+        assert len(files) == 2
+        # 新しいコメントだけを書き足すので、同じコメントが重なることはない
+        assert all(sum(1 for item in json.loads(path.read_text(encoding="utf-8")) if "chat" in item) == 1000
+                   for path in files)
+
+
+class TestByteLimiter:
+    def test_parse(self):
+        assert utils.parse_size("2M") == 2 * 1024 * 1024
+        assert utils.parse_size("500kb") == 500 * 1024
+        assert utils.parse_size("0") is None
+        assert utils.parse_schedule("01:00-07:00=0, 07:00-01:00=2M") == [
+            (60, 420, None), (420, 60, 2 * 1024 * 1024)]
+        for text in ("01:00-07:00", "25:00-07:00=1M", "01:00-07:00=fast"):
+            with pytest.raises(ValueError):
+                utils.parse_schedule(text)
+
+    def test_token_bucket(self):
+        bucket = utils.TokenBucket(100)
+        bucket.stamp = 0
+        assert bucket.take(0, 10) == 0
+        assert bucket.take(100, 10) == 0
+        # 使いすぎた分は借りになり、返せるまでの秒数を返す
+        assert bucket.take(50, 10) == 0.5
+        assert bucket.take(50, 10.5) == 0.5
+        bucket.set_rate(None)
+        assert bucket.take(10 ** 9, 11) == 0
+
+    def test_current_rate(self, tmpdir):
+        moment = [datetime.datetime(2020, 1, 1, 3, 0)]
+        control = tmpdir / "bandwidth.txt"
+        limiter = utils.ByteLimiter(rate=1024, schedule=utils.parse_schedule("01:00-07:00=0,22:00-01:00=2K"),
+                                    control_file=str(control), now=lambda: moment[0])
+        assert limiter.current_rate() is None
+        moment[0] = datetime.datetime(2020, 1, 1, 23, 30)
+        assert limiter.current_rate() == 2048
+        moment[0] = datetime.datetime(2020, 1, 1, 12, 0)
+        assert limiter.current_rate() == 1024
+        # 制御ファイルがあれば、時間帯よりもそちらに従う
+        control.write_text("5K", encoding="utf-8")
+        assert limiter.current_rate() == 5120
+        control.write_text("0", encoding="utf-8")
+        os.utime(str(control), (0, 0))
+        assert limiter.current_rate() is None
+        control.remove()
+        assert limiter.current_rate() == 1024
+
+    @pytest.mark.parametrize("rate, per_video", [(128 * 1024, None), (None, 64 * 1024)])
+    def test_mock_server(self, tmpdir, rate, per_video):
+        loop = asyncio.new_event_loop()
+        limiter = utils.ByteLimiter(rate=rate, per_video=per_video)
+        utils.Canopy.set_byte_limiter(limiter)
+        try:
+            with MockServer(video_size=96 * 1024, page_size=1024) as server, server.redirect():
+                session = TestMockServer.session(loop)
+                try:
+                    glossary = OfflineInfo(["sm1", "sm2", "sm3"], session=session, logger=LOGGER, loop=loop).info
+                    video = Video(glossary, save_dir=str(tmpdir), multiline=False,
+                                  session=session, logger=LOGGER, loop=loop)
+                    begin = time.monotonic()
+                    loop.run_until_complete(video.download())
+                    elapsed = time.monotonic() - begin
+                finally:
+                    loop.run_until_complete(session.close())
+                    loop.close()
+        finally:
+            utils.Canopy.set_byte_limiter(None)
+        files = [path for path in Path(str(tmpdir)).iterdir() if path.suffix in (".mp4", ".flv")]
+        assert len(files) == 3 and all(path.read_bytes() == server.video for path in files)
+        # 全体なら (288K - 128K) / 128K 秒、 動画ごとなら (96K - 64K) / 64K 秒は待つ
+        assert elapsed >= 0.9 * (1.25 if rate else 0.5)
+        assert limiter.waited > 0
+
+
+class TestStartup:
+    """ 引数を解釈するだけなら、サブコマンドのモジュールや重いライブラリーは読み込まない """
+    def test_import(self):
+        assert startup.heavy_imports(None) == []
+
+    @pytest.mark.parametrize("command", [["--help"], ["download", "sm9", "--what"], ["mylist", "x", "--show", "--what"]])
+    def test_parse_only(self, command):
+        assert startup.heavy_imports(command) == []
+
+
 class TestLogin:
     def test_login_1(self):
         if AUTH_P[0] is not None:
@@ -1,4 +1,5 @@
 # coding: UTF-8
+import asyncio
 import logging
 import os
 import random
@@ -8,6 +9,7 @@ import tempfile
 import pytest
 
 import nicotools
+from benchmarks.mock_server import MockServer, OfflineMyList
 from nicotools import mylist as nicoml, utils
 
 Waiting = 10
@@ -374,3 +376,108 @@ class TestErrors:
         assert nicotools.main(param(c))
         c = "とりあえずマイリスト --delete {}".format(VIDEO_ID)
         assert nicotools.main(param(c)) is False
+
+
+class TestMockServer:
+    """ 手元のモックサーバーを相手に、ログインせずに動かす """
+    def test_add_copy_move_delete(self):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        with MockServer() as server, server.redirect():
+            source, target = server.seed_mylists(2, 0)
+            instance = OfflineMyList()
+            try:
+                assert instance.add(source, "sm1", "sm2", "sm3")
+                assert instance.copy(source, target, "sm1")
+                assert instance.move(source, target, "sm2")
+                assert instance.delete(source, "sm3", confident=True)
+            finally:
+                instance.close()
+        assert list(server.items[source]) == ["sm1"]
+        assert list(server.items[target]) == ["sm1", "sm2"]
+
+    def test_batch(self):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        video_ids = ["sm{}".format(number) for number in range(1, 301)]
+        with MockServer(mylist_limit=250) as server, server.redirect():
+            source, target = server.seed_mylists(2, 0)
+            instance = OfflineMyList()
+            instance.limiter = utils.AdaptiveLimiter(interval=0.001)
+            try:
+                # 追加は一件ずつ行い、上限を超える 251件目で止まる
+                with pytest.raises(utils.MylistAPIError):
+                    instance.add(source, *video_ids, onetime=False)
+                assert len(server.items[source]) == 250
+                assert server.requests["mylist"] == 251
+                assert instance.limiter.back_offs == 1
+
+                assert instance.add(target, "sm1", "sm2", onetime=False)
+                assert instance.move(source, target, *video_ids[:150], onetime=False)
+                assert list(server.items[target]) == video_ids[:150]
+                assert instance.delete(target, *video_ids[:120], onetime=False)
+                # 登録済みのもの (sm121) があったら、そこで止める
+                assert instance.add(target, "sm121", "sm301", onetime=False)
+            finally:
+                instance.close()
+        assert list(server.items[source]) == video_ids[150:250]
+        assert list(server.items[target]) == video_ids[120:150]
+
+    def test_contents_cache(self):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        with MockServer() as server, server.redirect():
+            source, target = server.seed_mylists(2, 3)
+            instance = OfflineMyList()
+            try:
+                meta = instance.loop.run_until_complete(instance.fetch_meta(with_header=False))
+                assert [row[2] for row in meta] == [0, 3, 3]
+                # とりあえずマイリストと二つのマイリストを一度ずつ
+                assert server.requests["mylist"] == 3
+
+                # 取ってきたものを使い回す
+                assert len(instance.loop.run_until_complete(instance.fetch_all(True))) == 1 + 6
+                first = list(server.items[source])[0]
+                assert instance.delete(source, first, confident=True)
+                assert server.requests["mylist"] == 3 + 1
+
+                # 変えたマイリストだけを取り直す
+                assert len(instance.loop.run_until_complete(instance.fetch_one(source, False))) == 2
+                assert len(instance.loop.run_until_complete(instance.fetch_one(target, False))) == 3
+                assert server.requests["mylist"] == 3 + 1 + 1
+            finally:
+                instance.close()
+
+    def test_sync(self, tmpdir):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        plan_file = str(tmpdir.join("plan.txt"))
+        with MockServer() as server, server.redirect():
+            source, target = server.seed_mylists(2, 3)
+            desired = {source: ["sm100000", "sm200000", "sm9"], target: ["sm200001", "sm100001"]}
+            instance = OfflineMyList()
+            try:
+                # 他方から外れるものは移動で、どこにもないものは追加で、余ったものは削除で揃える
+                assert instance.sync_many(desired, dry_run=True, file_name=plan_file)
+                with open(plan_file, encoding="utf-8") as fd:
+                    plan = fd.read()
+                assert utils.Msg.ml_sync_calls.format(all=2 + 5, fetch=2, mutate=5) in plan
+                assert server.requests["mylist"] == 2
+                assert list(server.items[source]) == ["sm100000", "sm100001", "sm100002"]
+
+                assert instance.sync_many(desired, confident=True)
+                assert server.requests["mylist"] == 2 + 5
+                assert list(server.items[source]) == ["sm100000", "sm200000", "sm9"]
+                assert list(server.items[target]) == ["sm200001", "sm100001"]
+
+                # 揃っていれば何もしない
+                assert instance.sync(target, ["sm100001", "sm200001"])
+                assert server.requests["mylist"] == 2 + 5 + 1
+            finally:
+                instance.close()
+
+    def test_read_sync_file(self, tmpdir):
+        sync_file = tmpdir.join("sync.txt")
+        sync_file.write_text("# コメント\nsm1\nwatch/sm2\n\nその他\tsm3\n空にする\t\nsm1\n", encoding="utf-8")
+        desired = nicoml.read_sync_file(str(sync_file), "マイリスト")
+        assert desired == {"マイリスト": ["sm1", "sm2", "sm1"], "その他": ["sm3"], "空にする": []}
+        with pytest.raises(SyntaxError):
+            nicoml.read_sync_file(str(sync_file), utils.ALL_ITEM)
+        with pytest.raises(SyntaxError):
+            nicoml.read_sync_file(str(tmpdir.join("nothing.txt")), "マイリスト")